@@ -16,12 +16,14 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import math
 import random
 import numpy
 import copy
 
 from . import connset as cs
 from . import intervalset as iset
+from . import _philox
 
 from .csaobject import *
 
@@ -47,30 +49,231 @@ class OneToOne (cs.Mask):
         cs.Mask.__init__ (self)
         self.name = OneToOne.tag
         CSAObject.tag_map[CSA + OneToOne.tag] = (self, SINGLETON)
-    
+
+    def transpose (self):
+        return self
+
+    def isTestable (self):
+        return True
+
+    def hasAnalyticDegrees (self):
+        return True
+
+    def contains (self, sources, targets, state):
+        return sources == targets
+
+    def selectivity (self, low0, high0, low1, high1):
+        n = max (1, high0 - low0) * max (1, high1 - low1)
+        return float (self.count (low0, high0, low1, high1, None)) / n
+
     def iterator (self, low0, high0, low1, high1, state):
         for i in range (max (low0, low1), min (high0, high1)):
             yield (i, i)
 
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = cs.defaultBlockSize):
+        high = min (high0, high1)
+        for k in range (max (low0, low1), high, blockSize):
+            i = numpy.arange (k, min (k + blockSize, high), dtype = numpy.int64)
+            yield (i, i.copy ())
+
+    # source-major order is the same
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = cs.defaultBlockSize):
+        return self.blockIterator (low0, high0, low1, high1, state, blockSize)
+
+    def count (self, low0, high0, low1, high1, state):
+        return max (0, min (high0, high1) - max (low0, low1))
+
+    def inDegrees (self, low0, high0, targets, state):
+        return ((targets >= low0) & (targets < high0)).astype (numpy.int64)
+
+    def outDegrees (self, sources, low1, high1, state):
+        return ((sources >= low1) & (sources < high1)).astype (numpy.int64)
+
+
+# Random streams
+#
+# The random masks draw their random numbers from the counter-based
+# generator in _philox, keyed by the seed of the mask, and address them
+# by target index (and source tile or draw number).  Any part of the
+# connectivity can therefore be generated independently of the others
+# and the result is the same whatever the bounds or partitioning used
+# to iterate over the mask.  If a seed is given to partition, it is
+# combined with the seed of the mask.
+
+def newSeed (seed):
+    if seed == None:
+        return random.getrandbits (64)
+    return _philox.stableHash (seed)
+
+def streamKey (seed, state, *purpose):
+    if state != None and 'seed' in state:
+        return _philox.combineKeys (seed, state['seed'], *purpose)
+    elif purpose:
+        return _philox.combineKeys (seed, *purpose)
+    return seed
+
+
+# Sampling of Bernoulli trials by geometric gaps
+#
+# Instead of drawing one random number per possible connection, the
+# distances between successive connections are drawn from a geometric
+# distribution, so that the work is proportional to the number of
+# connections produced.  The connectivity matrix is divided into tiles
+# whose shape only depends on p, and each tile has its own stream of
+# gaps over its positions in target-major order.  Tiles span at least
+# tileSize sources and are made large enough to hold about
+# tileConnections connections, growing about equally along both axes.
+
+tileSize = 4096
+
+tileConnections = 16
+
+maxTileSources = 1 << 31
+
+# positions within a tile are exact in double precision
+maxTileArea = 1 << 52
+
+maxDraws = 1 << 20
+
+windowDraws = 8
+
+def tileShape (p):
+    # the number of targets and sources spanned by a tile
+    area = tileConnections / p
+    (targets, sources) = (1, tileSize)
+    while targets * sources < area and targets * sources < maxTileArea:
+        if sources <= targets and sources < maxTileSources:
+            sources *= 2
+        else:
+            targets *= 2
+    return (targets, sources)
+
+def tileSample (key, p, targets, tiles, nGaps, area = tileSize):
+    # Return (streams, offsets) for the selected offsets within the
+    # tiles, sorted by stream and offset.  targets and tiles number the
+    # target and source tiles of each stream.
+    logq = numpy.log1p (- p)
+    low = _philox.low (targets)[:, None]
+    high = _philox.high (targets)[:, None]
+    tiles = tiles[:, None]
+    last = numpy.full (len (targets), -1, dtype = numpy.int64)
+    active = numpy.arange (len (targets))
+    streams = []
+    offsets = []
+    k = 0
+    while len (active):
+        draws = numpy.arange (k, k + nGaps)[None, :]
+        u = _philox.uniform (key, draws, tiles[active],
+                             low[active], high[active])
+        gaps = numpy.minimum (numpy.floor (numpy.log1p (- u) / logq) + 1,
+                              area + 1).astype (numpy.int64)
+        positions = last[active, None] + numpy.cumsum (gaps, axis = 1)
+        inside = positions < area
+        (rows, cols) = numpy.nonzero (inside)
+        streams.append (active[rows])
+        offsets.append (positions[rows, cols])
+        last[active] = positions[:, -1]
+        active = active[inside[:, -1]]
+        k += nGaps
+    streams = numpy.concatenate (streams)
+    offsets = numpy.concatenate (offsets)
+    if k > nGaps:
+        order = numpy.lexsort ((offsets, streams))
+        return (streams[order], offsets[order])
+    return (streams, offsets)
+
+def bernoulliSample (key, p, low0, high0, low1, high1):
+    # yields (sources, targets) for the connections of the box
+    # [low0, high0) x [low1, high1) selected with probability p
+    if high0 <= low0 or high1 <= low1 or p <= 0.0:
+        return
+    if p >= 1.0:
+        yield (numpy.tile (numpy.arange (low0, high0, dtype = numpy.int64),
+                           high1 - low1),
+               numpy.repeat (numpy.arange (low1, high1, dtype = numpy.int64),
+                             high0 - low0))
+        return
+    (T, S) = tileShape (p)
+    tiles = numpy.arange (low0 // S, (high0 - 1) // S + 1)
+    mean = p * T * S
+    nGaps = min (T * S, int (mean + 4.0 * math.sqrt (mean)) + 2)
+    width = max (1, maxDraws // (len (tiles) * nGaps))
+    for w0 in range (low1 // T, (high1 - 1) // T + 1, width):
+        targetTiles = numpy.arange (w0, min (w0 + width, (high1 - 1) // T + 1))
+        t = numpy.repeat (targetTiles, len (tiles))
+        b = numpy.tile (tiles, len (targetTiles))
+        (streams, offsets) = tileSample (key, p, t, b, nGaps, T * S)
+        sources = b[streams] * S + offsets % S
+        targets = t[streams] * T + offsets // S
+        keep = (sources >= low0) & (sources < high0) \
+               & (targets >= low1) & (targets < high1)
+        (sources, targets) = (sources[keep], targets[keep])
+        if T > 1 and len (tiles) > 1:
+            # the streams of different source tiles interleave
+            span = high0 - low0
+            if span * (high1 - low1) < 1 << 62:
+                keys = numpy.sort (cs.encodeKeys (sources, targets,
+                                                  low0, high0, low1))
+                (sources, targets) = (low0 + keys % span,
+                                      low1 + keys // span)
+            else:
+                order = numpy.lexsort ((sources, targets))
+                (sources, targets) = (sources[order], targets[order])
+        yield (sources, targets)
+
 
 class ConstantRandomMask (cs.Mask):
     tag = 'randomMask'
     
-    def __init__ (self, p):
+    def __init__ (self, p, seed = None):
         cs.Mask.__init__ (self)
         self.p = p
-        self.state = random.getstate ()
+        self.seed = newSeed (seed)
+        self.key = self.seed
         self.name = ConstantRandomMask.tag
 
     def startIteration (self, state):
-        random.setstate (self.state)
-        return self
+        obj = copy.copy (self)
+        obj.key = streamKey (self.seed, state)
+        return obj
+
+    def selectivity (self, low0, high0, low1, high1):
+        return self.p
+
+    def planLabel (self):
+        return '%s %s' % (self.__class__.__name__, self.repr ())
 
     def iterator (self, low0, high0, low1, high1, state):
-        for j in range (low1, high1):
-            for i in range (low0, high0):
-                if random.random () < self.p:
-                    yield (i, j)
+        for (sources, targets) in bernoulliSample (self.key, self.p,
+                                                   low0, high0, low1, high1):
+            for c in zip (sources.tolist (), targets.tolist ()):
+                yield c
+
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = cs.defaultBlockSize):
+        return cs.collectBlocks (bernoulliSample (self.key, self.p,
+                                                  low0, high0, low1, high1),
+                                 blockSize)
+
+    # Since the random numbers are drawn per source tile, the
+    # connections can be generated one tile, or part of a tile, at a
+    # time and sorted by source.
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = cs.defaultBlockSize):
+        expected = self.p * max (1, high1 - low1)
+        width = max (1, int (cs.sortBufferSize / max (expected, 1.0)))
+        S = tileShape (self.p)[1] if self.p < 1.0 else tileSize
+        for t0 in range (low0 - low0 % S, high0, S):
+            l0 = max (low0, t0)
+            h0 = min (high0, t0 + S)
+            for w0 in range (l0, h0, width):
+                blocks = bernoulliSample (self.key, self.p,
+                                          w0, min (w0 + width, h0),
+                                          low1, high1)
+                for block in cs.sortedBySource (blocks, blockSize):
+                    yield block
 
     def repr (self):
         return 'random(%s)' % self.p
@@ -84,14 +287,15 @@ registerTag (ConstantRandomMask.tag, ConstantRandomMask, 1)
 class SampleNRandomOperator (cs.Operator):
     tag = 'random_N'
     
-    def __init__ (self, N):
+    def __init__ (self, N, seed = None):
         self.N = N
+        self.seed = seed
 
     def __mul__ (self, other):
         assert isinstance (other, cs.Finite) \
                and isinstance (other, cs.Mask), \
                'expected finite mask'
-        return SampleNRandomMask (self.N, other)
+        return SampleNRandomMask (self.N, other, self.seed)
 
     def repr (self):
         return 'random(N = %s)' % self.N
@@ -102,104 +306,263 @@ class SampleNRandomOperator (cs.Operator):
 registerTag (SampleNRandomOperator.tag, SampleNRandomOperator, 1)
 
 
-class SampleNRandomMask (cs.Finite,cs.Mask):
-    # The algorithm based on first sampling the number of connections
-    # per partition has been arrived at through discussions with Hans
-    # Ekkehard Plesser.
-    #
-    def __init__ (self, N, mask):
+# Draws in rank order
+#
+# The sources of a target are drawn in increasing order of their rank
+# in the source set, as order statistics of uniform numbers: the log of
+# one minus the k:th of c draws is the running sum of log (1 - u) /
+# (c - k) over the uniform numbers u of the stream of the target.  The
+# sums are accumulated one draw at a time, so they come out the same
+# however the draws are divided into batches, and a cursor (k, sum)
+# per target lets the draws of a range of ranks be generated without
+# redrawing those before it.
+
+def orderedDraws (key, targets, counts, k, sums, N0, n):
+    # Return (ranks, valid, sums) for the next n draws of each target
+    # from draw k with running sum sums: the ranks drawn, which of them
+    # are within the count of the target and the running sums after
+    # each draw
+    draws = k[:, None] + numpy.arange (n)[None, :]
+    valid = draws < counts[:, None]
+    u = _philox.uniform (key, draws, 0,
+                         _philox.low (targets)[:, None],
+                         _philox.high (targets)[:, None])
+    x = numpy.log1p (- u)
+    x /= numpy.maximum (counts[:, None] - draws, 1)
+    if not numpy.all (valid):
+        x[~valid] = 0.0
+    # the sums continue from the given ones, one draw at a time
+    x[:, 0] += sums
+    sums = numpy.cumsum (x, axis = 1, out = x)
+    ranks = numpy.expm1 (sums)
+    ranks *= - N0
+    ranks = numpy.minimum (ranks.astype (numpy.int64), N0 - 1)
+    return (ranks, valid, sums)
+
+class DrawCursor (object):
+    # The position in the draws, in rank order, of each of targets.  k
+    # draws have been made, sums is the running sum after them, and the
+    # rank of the last one is kept in pending until it is returned
+    # (-1 if there is none, N0 when the draws are exhausted).
+    def __init__ (self, key, targets, counts, N0):
+        self.key = key
+        self.targets = targets
+        self.counts = counts
+        self.N0 = N0
+        self.k = numpy.zeros (len (targets), dtype = numpy.int64)
+        self.sums = numpy.zeros (len (targets))
+        self.pending = numpy.where (counts > 0, -1, N0)
+        self.most = int (counts.max ()) if len (counts) else 0
+        self.rank = 0
+
+    def advance (self, limit):
+        # Return (rows, ranks) for the draws with rank below limit,
+        # ordered by draw within each row
+        rows = numpy.nonzero ((self.pending >= 0) & (self.pending < limit))[0]
+        found = [(rows, self.pending[rows])]
+        self.pending[rows] = numpy.where (self.k[rows] < self.counts[rows],
+                                          -1, self.N0)
+        # draws per target expected below limit, and then the draws
+        # per pass for the targets which need more
+        mean = self.most * float (limit - self.rank) / max (1, self.N0)
+        n = int (mean) + 1
+        rows = numpy.nonzero (self.pending < 0)[0]
+        while len (rows):
+            n = max (1, min (n, self.most, maxDraws))
+            split = max (1, maxDraws // n)
+            more = []
+            for start in range (0, len (rows), split):
+                chunk = rows[start:start + split]
+                found.append (self.draw (chunk, n, limit))
+                more.append (chunk[self.pending[chunk] < 0])
+            rows = numpy.concatenate (more)
+            n = int (math.sqrt (mean)) + 1
+        self.rank = max (self.rank, limit)
+        return (numpy.concatenate ([f[0] for f in found]),
+                numpy.concatenate ([f[1] for f in found]))
+
+    def draw (self, rows, n, limit):
+        # Make up to n draws for each of rows, stopping after the first
+        # at or above limit, and return (rows, ranks) for those below
+        (ranks, valid, sums) = orderedDraws (self.key, self.targets[rows],
+                                             self.counts[rows],
+                                             self.k[rows], self.sums[rows],
+                                             self.N0, n)
+        below = valid & (ranks < limit)
+        index = numpy.arange (len (rows))
+        used = numpy.sum (below, axis = 1)
+        beyond = numpy.minimum (used, n - 1)
+        stopped = valid[index, beyond] & ~below[index, beyond]
+        made = used + stopped
+        self.sums[rows] = numpy.where (made > 0,
+                                       sums[index, numpy.maximum (made - 1, 0)],
+                                       self.sums[rows])
+        self.k[rows] += made
+        self.pending[rows] = numpy.where (stopped, ranks[index, beyond],
+                                          numpy.where (self.k[rows]
+                                                       < self.counts[rows],
+                                                       -1, self.N0))
+        (r, c) = numpy.nonzero (below)
+        return (rows[r], ranks[r, c])
+
+
+# Base class for masks which draw, with replacement, perTarget[m]
+# sources for the m:th target of an interval set mask.  The sources of
+# target j are drawn in rank order from the stream of j, so that a
+# partition of the mask only needs to filter out its part, and the
+# mask can be generated in source order one window of ranks at a time.
+#
+class PerTargetRandomMask (cs.Finite, cs.Mask):
+    def __init__ (self, mask, seed):
         cs.Mask.__init__ (self)
-        self.N = N
         assert isinstance (mask, cs.FiniteISetMask), \
-               'SampleNRandomMask currently only operates on FiniteISetMask:s'
-        self.mask = mask
-        self.randomState = random.getstate ()
-        self.npRandomState = numpy.random.get_state ()
+               '%s currently only operates on FiniteISetMask:s' \
+               % self.__class__.__name__
+        self.subMask = mask
+        self.seed = newSeed (seed)
 
     def bounds (self):
-        return self.mask.bounds ()
+        return self.subMask.bounds ()
+
+    def planChildren (self):
+        return [('domain', self.subMask)]
+
+    def hasAnalyticDegrees (self):
+        return True
 
     def startIteration (self, state):
-        obj = copy.copy (self)  # local state: N, N0, perTarget, sources
-        random.setstate (self.randomState)
-        obj.isPartitioned = False
-        if 'partitions' in state:
-            obj.isPartitioned = True
-            partitions = list (map (self.mask.intersection, state['partitions']))
-            sizes = list (map (len, partitions))
-            total = sum (sizes)
-            
-            # The following yields the same result on all processes.
-            # We should add a seed function to the CSA.
-            if 'seed' in state:
-                seed = state['seed']
-            else:
-                seed = 'SampleNRandomMask'
-            # Numpy requires an unsigned 32-bit integer
-            numpy.random.seed (hash (seed) % (numpy.iinfo(numpy.uint32).max + 1))
-            N = numpy.random.multinomial (self.N, numpy.array (sizes) \
-                                           / float (total))
-            obj.N = N[state['selected']]
-            obj.mask = partitions[state['selected']]
-            assert isinstance (obj.mask, cs.FiniteISetMask), \
-                   'SampleNRandomMask iterator only handles finite IntervalSetMask partitions'
-        obj.mask = obj.mask.startIteration (state)
-        obj.N0 = len (obj.mask.set0)
-        obj.lastBound0 = False
-        N1 = len (obj.mask.set1)
-        numpy.random.set_state (self.npRandomState)
-        obj.perTarget = numpy.random.multinomial (obj.N, [1.0 / N1] * N1)
+        obj = copy.copy (self)  # local state: key, perTarget
+        obj.key = streamKey (self.seed, state)
+        obj.perTarget = obj.makePerTarget (len (self.subMask.set1))
         return obj
 
     def iterator (self, low0, high0, low1, high1, state):
-        m = self.mask.set1.count (0, low1)
-        
-        if self.isPartitioned and m > 0:
-            # "replacement" for a proper random.jumpahead (n)
-            # This is required so that different partitions of this
-            # mask aren't produced using the same stream of random
-            # numbers.
-            random.seed (random.getrandbits (32) + m)
-            
-        if self.lastBound0 != (low0, high0):
-            self.lastBound0 = (low0, high0)
-            self.sources = []
-            for i in self.mask.set0.boundedIterator (low0, high0):
-                self.sources.append (i)
-
-        nSources = len (self.sources)
-        for j in self.mask.set1.boundedIterator (low1, high1):
-            s = []
-            for k in range (0, self.perTarget[m]):
-                i = random.randint (0, self.N0 - 1)
-                if i < nSources:
-                    s.append (self.sources[i])
-            s.sort ()
-            for i in s:
-                yield (i, j)
-            m += 1
+        for (sources, targets) in self.sample (low0, high0, low1, high1):
+            for c in zip (sources.tolist (), targets.tolist ()):
+                yield c
+
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = cs.defaultBlockSize):
+        return cs.collectBlocks (self.sample (low0, high0, low1, high1),
+                                 blockSize)
+
+    def count (self, low0, high0, low1, high1, state):
+        set0 = self.subMask.set0
+        set1 = self.subMask.set1
+        if not set0 or low0 > set0.min () or high0 <= set0.max ():
+            return cs.Mask.count (self, low0, high0, low1, high1, state)
+        return int (numpy.sum (self.perTarget[set1.rank (low1):
+                                              set1.rank (high1)]))
+
+    def inDegrees (self, low0, high0, targets, state):
+        set0 = self.subMask.set0
+        set1 = self.subMask.set1
+        if not set0 or low0 > set0.min () or high0 <= set0.max ():
+            return cs.Mask.inDegrees (self, low0, high0, targets, state)
+        inside = set1.contains (targets)
+        degrees = numpy.zeros (len (targets), dtype = numpy.int64)
+        degrees[inside] = self.perTarget[set1.rank (targets[inside])]
+        return degrees
+
+    # The draws for a run of targets are made in one call.  A draw is
+    # the rank of its source in set0, and the draws of each target come
+    # in rank order, so the sources within the bounds are selected
+    # before mapping ranks to sources.
+    def sample (self, low0, high0, low1, high1):
+        set0 = self.subMask.set0
+        set1 = self.subMask.set1
+        N0 = len (set0)
+        (r0, r1) = (set0.rank (max (low0, 0)), set0.rank (max (high0, 0)))
+        if r1 <= r0:
+            return
+        targets = set1.members (low1, high1)
+        counts = self.perTarget[set1.rank (targets)]
+        ends = numpy.cumsum (counts)
+        start = 0
+        while start < len (targets):
+            first = ends[start] - counts[start]
+            end = max (numpy.searchsorted (ends, first + maxDraws, 'right'),
+                       start + 1)
+            cursor = DrawCursor (self.key, targets[start:end],
+                                 counts[start:end], N0)
+            if r0 > 0:
+                cursor.advance (r0)
+            (m, ranks) = cursor.advance (r1)
+            order = numpy.argsort (m, kind = 'stable')
+            yield (set0.select (ranks[order]), targets[start:end][m[order]])
+            start = end
+
+    # The draws of all targets are advanced one window of ranks at a
+    # time, so that each draw is made once.
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = cs.defaultBlockSize):
+        set0 = self.subMask.set0
+        set1 = self.subMask.set1
+        N0 = len (set0)
+        (r0, r1) = (set0.rank (max (low0, 0)), set0.rank (max (high0, 0)))
+        targets = set1.members (low1, high1)
+        if r1 <= r0 or not len (targets):
+            return
+        counts = self.perTarget[set1.rank (targets)]
+        cursor = DrawCursor (self.key, targets, counts, N0)
+        if r0 > 0:
+            cursor.advance (r0)
+        n1 = len (targets)
+        # windows hold sortBufferSize draws, but at least
+        # windowDraws per target on average
+        perRank = float (numpy.sum (counts)) / N0
+        width = max (1, int (cs.sortBufferSize / max (perRank, 1e-6)),
+                     int (windowDraws * n1 / max (perRank, 1e-6)))
+        for w0 in range (r0, r1, width):
+            (m, ranks) = cursor.advance (min (w0 + width, r1))
+            if N0 * n1 < 1 << 62:
+                keys = numpy.sort (ranks * n1 + m)
+                (m, ranks) = (keys % n1, keys // n1)
+            else:
+                order = numpy.lexsort ((m, ranks))
+                (m, ranks) = (m[order], ranks[order])
+            for block in cs.splitColumns ([set0.select (ranks), targets[m]],
+                                          blockSize):
+                yield block
+
+
+class SampleNRandomMask (PerTargetRandomMask):
+    def __init__ (self, N, mask, seed = None):
+        PerTargetRandomMask.__init__ (self, mask, seed)
+        self.N = N
+
+    def makePerTarget (self, N1):
+        if N1 == 0:
+            return numpy.zeros (0, dtype = numpy.int64)
+        rng = numpy.random.Generator (numpy.random.Philox (key = self.key))
+        return rng.multinomial (self.N, numpy.full (N1, 1.0 / N1))
+
+    def selectivity (self, low0, high0, low1, high1):
+        return float (self.N) \
+               / max (1, len (self.subMask.set0) * len (self.subMask.set1))
 
     def repr (self):
-        return self._repr_applyop ('random(N=%s)' % self.N, self.mask)
+        return self._repr_applyop ('random(N=%s)' % self.N, self.subMask)
 
     def _to_xml (self):
         return E ('apply',
                   E ('times'),
                   CSAObject.apply (SampleNRandomOperator.tag, self.N),
-                  self.mask._to_xml ())
+                  self.subMask._to_xml ())
 
 
 class FanInRandomOperator (cs.Operator):
     tag = 'random_fanIn'
     
-    def __init__ (self, fanIn):
+    def __init__ (self, fanIn, seed = None):
         self.fanIn = fanIn
+        self.seed = seed
 
     def __mul__ (self, other):
         assert isinstance (other, cs.Finite) \
                and isinstance (other, cs.Mask), \
                'expected finite mask'
-        return FanInRandomMask (self.fanIn, other)
+        return FanInRandomMask (self.fanIn, other, self.seed)
 
     def repr (self):
         return 'random(fanIn=%s)' % self.fanIn
@@ -210,112 +573,40 @@ class FanInRandomOperator (cs.Operator):
 registerTag (FanInRandomOperator.tag, FanInRandomOperator, 1)
 
 
-# This code is copied and modified from SampleNRandomMask
-# *fixme* refactor code and eliminate code duplication
-class FanInRandomMask (cs.Finite, cs.Mask):
-    # The algorithm based on first sampling the number of connections
-    # per partition has been arrived at through discussions with Hans
-    # Ekkehard Plesser.
-    #
-    def __init__ (self, fanIn, mask):
-        cs.Mask.__init__ (self)
+class FanInRandomMask (PerTargetRandomMask):
+    def __init__ (self, fanIn, mask, seed = None):
+        PerTargetRandomMask.__init__ (self, mask, seed)
         self.fanIn = fanIn
-        assert isinstance (mask, cs.FiniteISetMask), \
-               'FanInRandomMask currently only operates on FiniteISetMask:s'
-        self.mask = mask
-        self.randomState = random.getstate ()
-
-    def bounds (self):
-        return self.mask.bounds ()
 
-    def startIteration (self, state):
-        obj = copy.copy (self)  # local state: N, N0, perTarget, sources
-        random.setstate (self.randomState)
-        obj.isPartitioned = False
-        if 'partitions' in state:
-            obj.isPartitioned = True
-            partitions = list (map (self.mask.intersection, state['partitions']))
-            
-            # The following yields the same result on all processes.
-            # We should add a seed function to the CSA.
-            if 'seed' in state:
-                seed = state['seed']
-            else:
-                seed = 'FanInRandomMask'
-            # Numpy.random.seed requires an unsigned 32 bit integer
-            numpy.random.seed (hash (seed) % (numpy.iinfo(numpy.uint32).max + 1))
-
-            selected = state['selected']
-            obj.mask = partitions[selected]
-            assert isinstance (obj.mask, cs.FiniteISetMask), \
-                   'FanInRandomMask iterator only handles finite IntervalSetMask partitions'
-        obj.mask = obj.mask.startIteration (state)
-        obj.N0 = len (obj.mask.set0)
-        obj.lastBound0 = False
-        if obj.isPartitioned:
-            obj.perTarget = []
-            for j in obj.mask.set1:
-                size = 0
-                sourceDist = numpy.zeros (len (partitions))
-                for k in range (len (partitions)):
-                    if j in partitions[k].set1:
-                        sourceDist[k] = len (partitions[k].set0)
-                sourceDist /= sum (sourceDist)
-                dist = numpy.random.multinomial (self.fanIn, sourceDist)
-                obj.perTarget.append (dist[selected])
-        else:
-            obj.perTarget = [self.fanIn] * len (obj.mask.set1)
-        return obj
+    def makePerTarget (self, N1):
+        return numpy.full (N1, self.fanIn, dtype = numpy.int64)
 
-    def iterator (self, low0, high0, low1, high1, state):
-        m = self.mask.set1.count (0, low1)
-        
-        if self.isPartitioned and m > 0:
-            # "replacement" for a proper random.jumpahead (n)
-            # This is required so that different partitions of this
-            # mask aren't produced using the same stream of random
-            # numbers.
-            random.seed (random.getrandbits (32) + m)
-            
-        if self.lastBound0 != (low0, high0):
-            self.lastBound0 = (low0, high0)
-            self.sources = []
-            for i in self.mask.set0.boundedIterator (low0, high0):
-                self.sources.append (i)
-
-        nSources = len (self.sources)
-        for j in self.mask.set1.boundedIterator (low1, high1):
-            s = []
-            for k in range (0, self.perTarget[m]):
-                i = random.randint (0, self.N0 - 1)
-                if i < nSources:
-                    s.append (self.sources[i])
-            s.sort ()
-            for i in s:
-                yield (i, j)
-            m += 1
+    def selectivity (self, low0, high0, low1, high1):
+        return float (self.fanIn) / max (1, len (self.subMask.set0))
 
     def repr (self):
-        return self._repr_applyop ('random(fanIn=%s)' % self.fanIn, self.mask)
+        return self._repr_applyop ('random(fanIn=%s)' % self.fanIn, self.subMask)
 
     def _to_xml (self):
         return E ('apply',
                   E ('times'),
                   CSAObject.apply (FanInRandomOperator.tag, self.fanIn),
-                  self.mask._to_xml ())
+                  self.subMask._to_xml ())
 
 
 class FanOutRandomOperator (cs.Operator):
     tag = 'random_fanOut'
     
-    def __init__ (self, fanOut):
+    def __init__ (self, fanOut, seed = None):
         self.fanOut = fanOut
+        self.seed = seed
 
     def __mul__ (self, other):
         assert isinstance (other, cs.Finite) \
                and isinstance (other, cs.Mask), \
                'expected finite mask'
-        return FanInRandomMask (self.fanOut, other.transpose ()).transpose ()
+        return FanInRandomMask (self.fanOut, other.transpose (),
+                                self.seed).transpose ()
 
     def repr (self):
         return 'random(fanOut=%s)' % self.fanOut
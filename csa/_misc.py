@@ -17,58 +17,171 @@
 #
 
 import math
-import random
 import copy
+import numpy
 #from scipy.spatial import KDTree
 
 from . import connset as cs
 from . import valueset as vs
+from . import geometry
 from . import _elementary
+from . import _philox
+from . import _spatial
+from . import _sparse
 
 from .csaobject import *
 
 class Random (cs.Operator):
+    def __init__ (self, seed = None):
+        cs.Operator.__init__ (self)
+        self.seed = seed
+
     def __mul__ (self, valueSet):
-        return ValueSetRandomMask (valueSet)
+        return ValueSetRandomMask (valueSet, self.seed)
     
-    def __call__ (self, p = None, N = None, fanIn = None, fanOut = None):
+    def __call__ (self, p = None, N = None, fanIn = None, fanOut = None,
+                  seed = None):
         if p != None:
             assert N == None and fanIn == None and fanOut == None, \
                    'inconsistent parameters'
-            return _elementary.ConstantRandomMask (p)
+            return _elementary.ConstantRandomMask (p, seed)
         elif N != None:
             assert fanIn == None and fanOut == None, \
                    'inconsistent parameters'
-            return _elementary.SampleNRandomOperator (N)
+            return _elementary.SampleNRandomOperator (N, seed)
         elif fanIn != None:
             assert fanOut == None, \
                    'inconsistent parameters'
-            return _elementary.FanInRandomOperator (fanIn)
+            return _elementary.FanInRandomOperator (fanIn, seed)
         elif fanOut != None:
-            return _elementary.FanOutRandomOperator (fanOut)
+            return _elementary.FanOutRandomOperator (fanOut, seed)
+        elif seed != None:
+            return Random (seed)
         assert False, 'inconsistent parameters'
 
 
+# Connections are first sampled with a probability p which bounds the
+# value set from above and then accepted with probability value / p.
+#
 class ValueSetRandomMask (cs.Mask):
-    def __init__ (self, valueSet):
+    def __init__ (self, valueSet, seed = None):
         cs.Mask.__init__ (self)
         self.valueSet = valueSet
-        self.state = random.getstate ()
+        self.seed = _elementary.newSeed (seed)
+        if isinstance (valueSet, vs.QuotedValueSet):
+            self.p = min (valueSet.expression, 1.0)
+        else:
+            self.p = 1.0
+        self.keys = (self.seed, _elementary.streamKey (self.seed, None, 'accept'))
+
+    def selectivity (self, low0, high0, low1, high1):
+        return self.p
 
     def startIteration (self, state):
-        random.setstate (self.state)
-        return self
+        obj = copy.copy (self)
+        obj.keys = (_elementary.streamKey (self.seed, state),
+                    _elementary.streamKey (self.seed, state, 'accept'))
+        return obj
 
     def iterator (self, low0, high0, low1, high1, state):
-        for j in range (low1, high1):
-            for i in range (low0, high0):
-                if random.random () < self.valueSet (i, j):
-                    yield (i, j)
+        for (sources, targets) in self.sample (low0, high0, low1, high1):
+            for c in zip (sources.tolist (), targets.tolist ()):
+                yield c
+
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = cs.defaultBlockSize):
+        return cs.collectBlocks (self.sample (low0, high0, low1, high1),
+                                 blockSize)
+
+    def sample (self, low0, high0, low1, high1):
+        (key, acceptKey) = self.keys
+        for (sources, targets) in _elementary.bernoulliSample (key, self.p,
+                                                               low0, high0,
+                                                               low1, high1):
+            p = vs.evaluate (self.valueSet, sources, targets)
+            u = _philox.uniform (acceptKey,
+                                 _philox.low (sources), _philox.high (sources),
+                                 _philox.low (targets), _philox.high (targets))
+            accept = u * self.p < p
+            yield (sources[accept], targets[accept])
 
     def _to_xml (self):
         return CSAObject.apply ('times', 'random', self.valueSet._to_xml ())
 
 
+# Masks defined by distances between positions are computed using a
+# cell list over the source positions when these are known, so that
+# each target only needs to be compared with nearby sources.  The cell
+# list is kept by the started mask, so that the expression itself is
+# never modified.
+#
+class SpatialMask (cs.Mask):
+    def __init__ (self):
+        cs.Mask.__init__ (self)
+        self.cellList = None
+
+    def startIteration (self, state):
+        obj = copy.copy (self)  # local state: cellList
+        obj.cellList = None
+        return obj
+
+    def iterator (self, low0, high0, low1, high1, state):
+        for (sources, targets) in self.sample (low0, high0, low1, high1):
+            for c in zip (sources.tolist (), targets.tolist ()):
+                yield c
+
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = cs.defaultBlockSize):
+        return cs.collectBlocks (self.sample (low0, high0, low1, high1),
+                                 blockSize)
+
+    # Spatial masks are sets and membership only requires the
+    # positions of the given sources and targets
+    def isTestable (self):
+        return True
+
+    def contains (self, sources, targets, state):
+        return self.accept (geometry._positions (self.sourceFunction (),
+                                                 sources),
+                            geometry._positions (self.targetFunction (),
+                                                 targets))
+
+    def sourceCellList (self, low0, high0):
+        # the cell list is reused as long as the source bounds are
+        # the same (it is replaced as a whole so that threads iterating
+        # concurrently never see a partial one)
+        cellList = self.cellList
+        if cellList == None or cellList[0] != (low0, high0):
+            points = geometry._positions (self.sourceFunction (),
+                                          numpy.arange (low0, high0))
+            cellList = ((low0, high0),
+                        _spatial.CellList (points, self.radius (),
+                                           self.periods ()))
+            self.cellList = cellList
+        return cellList[1]
+
+    def periods (self):
+        return None
+
+    def spatialSample (self, low0, high0, low1, high1):
+        if high0 <= low0 or high1 <= low1:
+            return
+        cellList = self.sourceCellList (low0, high0)
+        width = max (1, int (_spatial.maxCandidates
+                             // (len (cellList.offsets)
+                                 * cellList.meanOccupancy () + 1)))
+        g1 = self.targetFunction ()
+        for w0 in range (low1, high1, width):
+            targets = numpy.arange (w0, min (w0 + width, high1))
+            centers = geometry._positions (g1, targets)
+            (ci, pi) = cellList.candidates (centers)
+            keep = self.accept (cellList.points[pi], centers[ci])
+            sources = low0 + pi[keep]
+            targets = targets[ci[keep]]
+            order = numpy.lexsort ((sources, targets))
+            yield (sources[order], targets[order])
+
+
 class Disc (cs.Operator):
     def __init__ (self, r):
         self.r = r
@@ -77,17 +190,53 @@ class Disc (cs.Operator):
         return DiscMask (self.r, metric)
 
 
-class DiscMask (cs.Mask):
+class DiscMask (SpatialMask):
     def __init__ (self, r, metric):
-        cs.Mask.__init__ (self)
+        SpatialMask.__init__ (self)
         self.r = r
         self.metric = metric
 
-    def iterator (self, low0, high0, low1, high1, state):
-        for j in range (low1, high1):
-            for i in range (low0, high0):
-                if self.metric (i, j) < self.r:
-                    yield (i, j)
+    def sample (self, low0, high0, low1, high1):
+        if getattr (self.metric, 'type', None) == 'euclid':
+            return self.spatialSample (low0, high0, low1, high1)
+        else:
+            return self.bruteForceSample (low0, high0, low1, high1)
+
+    def sourceFunction (self):
+        return self.metric.g1
+
+    def targetFunction (self):
+        return self.metric.g2
+
+    def radius (self):
+        return self.r
+
+    def contains (self, sources, targets, state):
+        if getattr (self.metric, 'type', None) == 'euclid':
+            return SpatialMask.contains (self, sources, targets, state)
+        return vs.evaluate (self.metric, sources, targets) < self.r
+
+    def periods (self):
+        return self.metric.periods
+
+    def accept (self, p0, p1):
+        if self.metric.periods == None:
+            d = geometry._euclidDistances (p0, p1)
+        else:
+            d = geometry._euclidToroidDistances (p0, p1,
+                                                 *self.metric.periods)
+        return d < self.r
+
+    def bruteForceSample (self, low0, high0, low1, high1):
+        if high0 <= low0:
+            return
+        sources = numpy.arange (low0, high0)
+        for (w0, w1) in cs.targetWindows (low0, high0, low1, high1,
+                                          _spatial.maxCandidates):
+            s = numpy.tile (sources, w1 - w0)
+            t = numpy.repeat (numpy.arange (w0, w1), high0 - low0)
+            keep = vs.evaluate (self.metric, s, t) < self.r
+            yield (s[keep], t[keep])
 
 
 class Rectangle (cs.Operator):
@@ -103,23 +252,29 @@ class Rectangle (cs.Operator):
             return RectangleMask (self.width, self.height, gFunction, gFunction)
 
 
-class RectangleMask (cs.Mask):
+class RectangleMask (SpatialMask):
     def __init__ (self, width, height, g0, g1):
-        cs.Mask.__init__ (self)
+        SpatialMask.__init__ (self)
         self.hwidth = width / 2.0
         self.hheight = height / 2.0
         self.g0 = g0
         self.g1 = g1
 
-    def iterator (self, low0, high0, low1, high1, state):
-        for j in range (low1, high1):
-            for i in range (low0, high0):
-                p0 = self.g0 (i)
-                p1 = self.g1 (j)
-                dx = p0[0] - p1[0]
-                dy = p0[1] - p1[1]
-                if abs (dx) < self.hwidth and abs (dy) < self.hheight:
-                    yield (i, j)
+    def sample (self, low0, high0, low1, high1):
+        return self.spatialSample (low0, high0, low1, high1)
+
+    def sourceFunction (self):
+        return self.g0
+
+    def targetFunction (self):
+        return self.g1
+
+    def radius (self):
+        return (self.hwidth, self.hheight)
+
+    def accept (self, p0, p1):
+        d = numpy.abs (p0[:, :2] - p1[:, :2])
+        return (d[:, 0] < self.hwidth) & (d[:, 1] < self.hheight)
 
  
 class Gaussian (cs.Operator):
@@ -143,6 +298,12 @@ class GaussianValueSet (OpExprValue, vs.ValueSet):
         d = self.metric (i, j)
         return math.exp (- d * d / self.sigma22) if d < self.cutoff else 0.0
 
+    def evaluate (self, sources, targets):
+        d = vs.evaluate (self.metric, sources, targets)
+        return numpy.where (d < self.cutoff,
+                            numpy.exp (- d * d / self.sigma22),
+                            0.0)
+
 
 class Block (cs.Operator):
     def __init__ (self, M, N):
@@ -166,12 +327,24 @@ class BlockMask (cs.Mask):
 
     def startIteration (self, state):
         #*fixme* filter out 'partitions' from state
-        nState = {}
+        nState = cs.State ()
         for k in state:
             if k != 'partitions':
                 nState[k] = state[k]
-        self.obj = self.m.startIteration (nState)
-        return self
+        obj = copy.copy (self)
+        obj.obj = self.m.startIteration (nState)
+        return obj
+
+    def optimize (self):
+        obj = copy.copy (self)
+        obj.m = self.m.optimize ()
+        return obj
+
+    def planChildren (self):
+        return [('operand', self.m)]
+
+    def hasAnalyticDegrees (self):
+        return self.m.hasAnalyticDegrees ()
 
     def iterator (self, low0, high0, low1, high1, state):
         maskIter =  self.obj.iterator (low0 // self.M,
@@ -207,6 +380,87 @@ class BlockMask (cs.Mask):
                                           min (self.M * (k + 1), high0)):
                             yield (ii, jj)
 
+    # The sub mask is iterated in source order and each run of sub
+    # connections with the same source is expanded into the rows of
+    # its block.
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = cs.defaultBlockSize):
+        subBounds = (low0 // self.M, (high0 + self.M - 1) // self.M,
+                     low1 // self.N, (high1 + self.N - 1) // self.N)
+        runs = self.sourceRuns (self.obj.sourceBlockIterator (
+            *(subBounds + (state, blockSize))))
+        return cs.collectBlocks (self.expandedRuns (runs, low0, high0,
+                                                    low1, high1, blockSize),
+                                 blockSize)
+
+    def sourceRuns (self, blocks):
+        # yields (k, posts) for each source k of the sub mask
+        (ks, posts) = (cs._noIndices, cs._noIndices)
+        for (k, post) in blocks:
+            ks = numpy.concatenate ((ks, k))
+            posts = numpy.concatenate ((posts, post))
+            # the run of the last source may continue in the next block
+            cut = numpy.searchsorted (ks, ks[-1]) if len (ks) else 0
+            for run in self.splitRuns (ks[:cut], posts[:cut]):
+                yield run
+            (ks, posts) = (ks[cut:], posts[cut:])
+        for run in self.splitRuns (ks, posts):
+            yield run
+
+    def splitRuns (self, ks, posts):
+        (sources, starts) = numpy.unique (ks, return_index = True)
+        ends = numpy.append (starts[1:], len (ks))
+        for (k, s, e) in zip (sources.tolist (), starts.tolist (),
+                              ends.tolist ()):
+            yield (k, posts[s:e])
+
+    def expandedRuns (self, runs, low0, high0, low1, high1, blockSize):
+        for (k, posts) in runs:
+            targets = (self.N * posts[:, None]
+                       + numpy.arange (self.N)[None, :]).ravel ()
+            targets = targets[(targets >= low1) & (targets < high1)]
+            if not len (targets):
+                continue
+            if numpy.any (posts[1:] == posts[:-1]):
+                # repeated sub connections
+                targets = numpy.sort (targets)
+            sources = numpy.arange (max (self.M * k, low0),
+                                    min (self.M * (k + 1), high0))
+            width = max (1, blockSize // len (targets))
+            for w0 in range (0, len (sources), width):
+                rows = sources[w0:w0 + width]
+                yield (numpy.repeat (rows, len (targets)),
+                       numpy.tile (targets, len (rows)))
+
+    def count (self, low0, high0, low1, high1, state):
+        subBounds = (low0 // self.M, (high0 + self.M - 1) // self.M,
+                     low1 // self.N, (high1 + self.N - 1) // self.N)
+        if low0 % self.M == 0 and high0 % self.M == 0 \
+           and low1 % self.N == 0 and high1 % self.N == 0:
+            return self.M * self.N * self.obj.count (*(subBounds + (state,)))
+        # blocks at the border are only partially within the bounds
+        N = 0
+        for (k, post) in self.obj.blockIterator (*(subBounds + (state,))):
+            width0 = numpy.minimum (self.M * (k + 1), high0) \
+                     - numpy.maximum (self.M * k, low0)
+            width1 = numpy.minimum (self.N * (post + 1), high1) \
+                     - numpy.maximum (self.N * post, low1)
+            N += int (numpy.sum (width0 * width1))
+        return N
+
+    def inDegrees (self, low0, high0, targets, state):
+        if low0 % self.M or high0 % self.M:
+            return cs.Mask.inDegrees (self, low0, high0, targets, state)
+        return self.M * self.obj.inDegrees (low0 // self.M, high0 // self.M,
+                                            targets // self.N, state)
+
+    def outDegrees (self, sources, low1, high1, state):
+        if low1 % self.N or high1 % self.N:
+            return cs.Mask.outDegrees (self, sources, low1, high1, state)
+        return self.N * self.obj.outDegrees (sources // self.M,
+                                             low1 // self.N, high1 // self.N,
+                                             state)
+
 
 class Repeat (cs.Operator):
     def __init__ (self, M, N):
@@ -296,27 +550,15 @@ class Fix (cs.Operator):
             return cs.ConnectionSet (FixedCSet (other))
 
 
-class FixedMask (cs.FiniteMask):
+# Connection-sets materialized in compressed form
+#
+class FixedMask (_sparse.CompressedMask):
     def __init__ (self, mask):
-        cs.FiniteMask.__init__ (self)
-        ls = []
-        for c in mask:
-            ls.append (c)
-        self.connections = ls
-        targets = list (map (cs.target, ls))
-        self.low0 = min (ls)[0]
-        self.high0 = max (ls)[0] + 1
-        self.low1 = min (targets)
-        self.high1 = max (targets) + 1
+        (indptr, indices, values) = _sparse.compress (mask)
+        _sparse.CompressedMask.__init__ (self, indptr, indices)
 
-    def iterator (self, low0, high0, low1, high1, state):
-        if not self.isBoundedBy (low0, high0, low1, high1):
-            return iter (self.connections)
-        else:
-            return self.boundedIterator (low0, high0, low1, high1)
 
-    def boundedIterator (self, low0, high0, low1, high1):
-        for c in self.connections:
-            if low0 <= c[0] and c[0] < high0 \
-               and low1 <= c[1] and c[1] < high1:
-                yield c
+class FixedCSet (_sparse.CompressedCSet):
+    def __init__ (self, cset):
+        (indptr, indices, values) = _sparse.compress (cset)
+        _sparse.CompressedCSet.__init__ (self, indptr, indices, values)
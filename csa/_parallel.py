@@ -0,0 +1,187 @@
+#
+#  This file is part of the Connection-Set Algebra (CSA).
+#  Copyright (C) 2010,2011,2012 Mikael Djurfeldt
+#
+#  CSA is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CSA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Parallel generation of partitions
+#
+# The partitions of a connection-set are generated by a pool of worker
+# processes.  Each worker receives the pickled connection-set, the
+# partition masks and the index of its partition, generates the
+# partition as columns (sources, targets, values...) and hands them
+# back in a shared memory segment, so that the connections themselves
+# are never pickled.  Since the random masks draw from counter-based
+# streams keyed by their seeds, the result is the same as when
+# iterating over the partitions one at a time.  Value sets must be
+# picklable, i.e., not be lambda expressions.
+#
+# Within a partition, windows of targets can be generated by a pool of
+# threads.  The block iterators spend most of their time in NumPy,
+# which releases the GIL, and, for the same reason as above, each
+# window is independent of the others.
+
+import collections
+import itertools
+import multiprocessing
+import pickle
+import numpy
+
+from . import connset as cs
+
+try:
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    HAVE_THREADS=True
+except ImportError:
+    HAVE_THREADS=False
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+    HAVE_POOL=HAVE_THREADS
+except ImportError:
+    HAVE_POOL=False
+
+# the number of target windows per thread
+windowsPerThread = 4
+
+def partitionColumns (c, partitions, selected, seed, blockSize):
+    # the columns of partition selected of c, or None if it is empty
+    plan = cs.IterationPlan (c, partitions, selected, seed)
+    return cs.concatenateColumns (plan.blocks (blockSize))
+
+def exportColumns (columns):
+    # Copy columns into a new shared memory segment and return its
+    # name together with the dtype and length of each column
+    layout = [ (column.dtype.str, len (column)) for column in columns ]
+    size = sum ([ column.nbytes for column in columns ])
+    segment = shared_memory.SharedMemory (create = True, size = max (size, 1))
+    offset = 0
+    for column in columns:
+        view = numpy.ndarray (column.shape, column.dtype,
+                              buffer = segment.buf, offset = offset)
+        view[:] = column
+        offset += column.nbytes
+    segment.close ()
+    return (segment.name, layout)
+
+def importColumns (name, layout):
+    # copy the columns out of a shared memory segment and remove it
+    segment = shared_memory.SharedMemory (name = name)
+    try:
+        columns = []
+        offset = 0
+        for (dtype, n) in layout:
+            dtype = numpy.dtype (dtype)
+            columns.append (numpy.ndarray ((n,), dtype, buffer = segment.buf,
+                                           offset = offset).copy ())
+            offset += n * dtype.itemsize
+        return tuple (columns)
+    finally:
+        segment.close ()
+        segment.unlink ()
+
+def collectedColumns (exported, arity):
+    if exported == None:
+        return (cs._noIndices, cs._noIndices) \
+               + tuple ([ numpy.zeros (0) for k in range (arity) ])
+    (name, layout) = exported
+    if name == None:
+        # the columns themselves
+        return layout
+    return importColumns (name, layout)
+
+def generateWorker (data, partitions, selected, seed, blockSize):
+    c = pickle.loads (data)
+    columns = partitionColumns (c, partitions, selected, seed, blockSize)
+    if columns == None:
+        return None
+    elif any ([ column.dtype.hasobject for column in columns ]):
+        # arrays of Python objects can't be shared
+        return (None, tuple (columns))
+    return exportColumns (columns)
+
+def generateParallel (c, partitions, workers = None, seed = None,
+                      selected = None, blockSize = cs.defaultBlockSize):
+    # Return a list with the columns (sources, targets, values...) of
+    # each selected partition of c (default all)
+    if selected == None:
+        selected = range (len (partitions))
+    selected = list (selected)
+    arity = cs.coerceCSet (c).arity
+    if workers == None:
+        workers = multiprocessing.cpu_count ()
+    workers = min (workers, len (selected))
+    if not HAVE_POOL or workers <= 1:
+        results = []
+        for k in selected:
+            columns = partitionColumns (c, partitions, k, seed, blockSize)
+            results.append (tuple (columns) if columns != None
+                            else collectedColumns (None, arity))
+        return results
+    data = pickle.dumps (c, pickle.HIGHEST_PROTOCOL)
+    # the workers should register their segments with our resource
+    # tracker, which then sees them removed
+    resource_tracker.ensure_running ()
+    results = []
+    with ProcessPoolExecutor (max_workers = workers) as executor:
+        futures = [ executor.submit (generateWorker, data, partitions, k,
+                                     seed, blockSize)
+                    for k in selected ]
+        try:
+            for future in futures:
+                results.append (collectedColumns (future.result (), arity))
+        finally:
+            # if a worker failed, remove the segments of the partitions
+            # which weren't collected
+            for future in futures[len (results) + 1:]:
+                if future.exception () == None:
+                    collectedColumns (future.result (), arity)
+    return results
+
+def targetWindows (low1, high1, n):
+    # split [low1, high1) into at most n windows of about equal size
+    size = max (1, -(-(high1 - low1) // n))
+    return [ (start, min (start + size, high1))
+             for start in range (low1, high1, size) ]
+
+def windowBlocks (plan, blockSize, window):
+    return list (plan.blocks (blockSize, targets = window))
+
+def threadedBlocks (plan, threads = None, blockSize = cs.defaultBlockSize,
+                    targets = None):
+    # Yield the blocks of an iteration plan in target order while a
+    # pool of threads generates them window by window.  Blocks never
+    # span two windows.
+    if threads == None:
+        threads = multiprocessing.cpu_count ()
+    (low0, high0, low1, high1) = plan.targetBounds (targets)
+    if not HAVE_THREADS or threads <= 1:
+        for block in plan.blocks (blockSize, targets = (low1, high1)):
+            yield block
+        return
+    windows = iter (targetWindows (low1, high1, threads * windowsPerThread))
+    with ThreadPoolExecutor (max_workers = threads) as executor:
+        # at most two windows per thread are held in memory
+        pending = collections.deque ()
+        for window in itertools.islice (windows, 2 * threads):
+            pending.append (executor.submit (windowBlocks, plan, blockSize,
+                                             window))
+        while pending:
+            blocks = pending.popleft ().result ()
+            for window in itertools.islice (windows, 1):
+                pending.append (executor.submit (windowBlocks, plan,
+                                                 blockSize, window))
+            for block in blocks:
+                yield block
@@ -0,0 +1,80 @@
+#
+#  This file is part of the Connection-Set Algebra (CSA).
+#  Copyright (C) 2010,2011,2012 Mikael Djurfeldt
+#
+#  CSA is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CSA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Counter-based random numbers
+#
+# The Philox4x32-10 generator of Salmon et al. (2011), "Parallel random
+# numbers: as easy as 1, 2, 3", maps a 128-bit counter and a 64-bit key
+# to 128 random bits.  Since any number can be computed directly from
+# its counter, random masks can generate an arbitrary part of the
+# connectivity without replaying a global stream.  This implementation
+# operates on arrays of counters.
+
+import hashlib
+import struct
+import numpy
+
+_mask32 = numpy.uint64 (0xffffffff)
+_M0 = numpy.uint64 (0xD2511F53)
+_M1 = numpy.uint64 (0xCD9E8D57)
+_W0 = 0x9E3779B9
+_W1 = 0xBB67AE85
+
+def philox4x32 (counter, key, rounds = 10):
+    # counter is a tuple of four arrays of 32-bit words, key a tuple of
+    # two 32-bit integers
+    (x0, x1, x2, x3) = [ numpy.asarray (x, dtype = numpy.uint64) & _mask32
+                         for x in counter ]
+    (k0, k1) = key
+    for r in range (rounds):
+        p0 = _M0 * x0
+        p1 = _M1 * x2
+        (x0, x1, x2, x3) = ((p1 >> 32) ^ x1 ^ numpy.uint64 (k0),
+                            p1 & _mask32,
+                            (p0 >> 32) ^ x3 ^ numpy.uint64 (k1),
+                            p0 & _mask32)
+        k0 = (k0 + _W0) & 0xffffffff
+        k1 = (k1 + _W1) & 0xffffffff
+    return (x0, x1, x2, x3)
+
+def splitKey (key):
+    return (key & 0xffffffff, (key >> 32) & 0xffffffff)
+
+def uniform (key, c0, c1, c2, c3):
+    # One double in [0, 1) for each counter (c0, c1, c2, c3).  The key
+    # is a 64-bit integer.
+    (x0, x1, x2, x3) = philox4x32 ((c0, c1, c2, c3), splitKey (key))
+    return ((x0 >> 5) * 67108864.0 + (x1 >> 6)) * (1.0 / 9007199254740992.0)
+
+def low (a):
+    return numpy.asarray (a, dtype = numpy.int64) & 0xffffffff
+
+def high (a):
+    return numpy.asarray (a, dtype = numpy.int64) >> 32
+
+def stableHash (obj):
+    # a 64-bit hash which, in contrast to hash (), is the same in all
+    # processes
+    if isinstance (obj, int) and 0 <= obj < 2 ** 64:
+        return obj
+    return int (hashlib.sha256 (repr (obj).encode ('utf-8')).hexdigest ()[:16],
+                16)
+
+def combineKeys (*keys):
+    data = b''.join ([ struct.pack ('<Q', stableHash (k)) for k in keys ])
+    return int (hashlib.sha256 (data).hexdigest ()[:16], 16)
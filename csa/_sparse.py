@@ -0,0 +1,252 @@
+#
+#  This file is part of the Connection-Set Algebra (CSA).
+#  Copyright (C) 2010,2011,2012 Mikael Djurfeldt
+#
+#  CSA is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CSA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Compressed connection-sets
+#
+# Materialized connections are stored target-major in compressed
+# sparse column (CSC) form: the sources of target j are
+# indices[indptr[j]:indptr[j + 1]] in increasing order, and value k of
+# the connection at position n is values[k][n].  This is the layout of
+# scipy.sparse.csc_matrix with sources as rows and targets as columns,
+# so that the arrays can be shared with scipy without copying.
+
+import numpy
+
+from . import connset as cs
+from . import valueset as vs
+
+try:
+    import scipy.sparse
+    HAVE_SCIPY=True
+except ImportError:
+    HAVE_SCIPY=False
+
+def indexType (n):
+    # the smallest of int32 and int64 which can represent 0, ..., n
+    if n < 2 ** 31:
+        return numpy.int32
+    return numpy.int64
+
+def compress (c, blockSize = cs.defaultBlockSize):
+    # Return (indptr, indices, values) for the finite connection-set c
+    c = cs.coerceCSet (c)
+    columns = []
+    for block in c.blocks (blockSize):
+        if len (block[0]):
+            columns.append (block)
+    arity = len (columns[0]) - 2 if columns else c.arity
+    if not columns:
+        return (numpy.zeros (1, dtype = numpy.int32),
+                numpy.zeros (0, dtype = numpy.int32),
+                [ numpy.zeros (0) for k in range (arity) ])
+    sources = numpy.concatenate ([ b[0] for b in columns ])
+    targets = numpy.concatenate ([ b[1] for b in columns ])
+    values = [ numpy.concatenate ([ b[2 + k] for b in columns ])
+               for k in range (arity) ]
+    del columns
+    n1 = int (targets[-1]) + 1
+    dtype = indexType (max (int (sources.max ()), len (sources), n1))
+    indptr = numpy.searchsorted (targets, numpy.arange (n1 + 1)) \
+                  .astype (dtype)
+    return (indptr, sources.astype (dtype), values)
+
+
+class CompressedMask (cs.FiniteMask):
+    def __init__ (self, indptr, indices, n0 = None):
+        cs.FiniteMask.__init__ (self)
+        self.indptr = indptr
+        self.indices = indices
+        self.n0 = n0
+        if len (indices):
+            self.low0 = int (indices.min ())
+            self.high0 = int (indices.max ()) + 1
+            nonEmpty = numpy.nonzero (numpy.diff (indptr))[0]
+            self.low1 = int (nonEmpty[0])
+            self.high1 = int (nonEmpty[-1]) + 1
+        if n0 == None:
+            self.n0 = self.high0
+
+    def columnRange (self, low1, high1):
+        n1 = len (self.indptr) - 1
+        return (min (max (low1, 0), n1), min (max (high1, 0), n1))
+
+    def positionBlocks (self, low0, high0, low1, high1, blockSize):
+        # yields (positions, sources, targets) for the connections
+        # within the bounds
+        (l1, h1) = self.columnRange (low1, high1)
+        if h1 <= l1:
+            return
+        filtered = low0 > self.low0 or high0 < self.high0
+        for k in range (int (self.indptr[l1]), int (self.indptr[h1]),
+                        blockSize):
+            positions = numpy.arange (k, min (k + blockSize,
+                                              int (self.indptr[h1])))
+            sources = self.indices[positions].astype (numpy.int64)
+            targets = numpy.searchsorted (self.indptr, positions, 'right') - 1
+            if filtered:
+                keep = (sources >= low0) & (sources < high0)
+                positions = positions[keep]
+                sources = sources[keep]
+                targets = targets[keep]
+            yield (positions, sources, targets)
+
+    def iterator (self, low0, high0, low1, high1, state):
+        for (sources, targets) in self.blockIterator (low0, high0,
+                                                      low1, high1, state):
+            for c in zip (sources.tolist (), targets.tolist ()):
+                yield c
+
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = cs.defaultBlockSize):
+        for (positions, sources, targets) \
+                in self.positionBlocks (low0, high0, low1, high1, blockSize):
+            if len (positions):
+                yield (sources, targets.astype (numpy.int64))
+
+    def selectivity (self, low0, high0, low1, high1):
+        return float (len (self.indices)) \
+               / max (1, (self.high0 - self.low0) * (self.high1 - self.low1))
+
+    def coversSources (self, low0, high0):
+        return low0 <= self.low0 and high0 >= self.high0
+
+    def count (self, low0, high0, low1, high1, state):
+        if not self.coversSources (low0, high0):
+            return cs.Mask.count (self, low0, high0, low1, high1, state)
+        (l1, h1) = self.columnRange (low1, high1)
+        return max (0, int (self.indptr[h1]) - int (self.indptr[l1]))
+
+    def hasAnalyticDegrees (self):
+        return True
+
+    def inDegrees (self, low0, high0, targets, state):
+        if not self.coversSources (low0, high0):
+            return cs.Mask.inDegrees (self, low0, high0, targets, state)
+        inside = (targets >= 0) & (targets < len (self.indptr) - 1)
+        degrees = numpy.zeros (len (targets), dtype = numpy.int64)
+        t = targets[inside]
+        degrees[inside] = self.indptr[t + 1] - self.indptr[t]
+        return degrees
+
+    def toSparse (self, data = None, shape = None):
+        assert HAVE_SCIPY, 'scipy is required for sparse matrix export'
+        if data is None:
+            data = numpy.ones (len (self.indices))
+        if shape == None:
+            shape = (self.n0, len (self.indptr) - 1)
+        return scipy.sparse.csc_matrix ((data, self.indices, self.indptr),
+                                        shape = shape, copy = False)
+
+    def repr (self):
+        return 'compressed (%d connections)' % len (self.indices)
+
+
+# Value k of a CompressedCSet looked up by connection.  For multisets,
+# the value of the first of several equal connections is returned.
+#
+class CompressedValueSet (vs.ValueSet):
+    def __init__ (self, mask, values):
+        vs.ValueSet.__init__ (self)
+        self.mask = mask
+        self.values = values
+
+    def positions (self, sources, targets):
+        if not hasattr (self, 'keys'):
+            # connections encoded as keys in iteration order
+            self.keys = cs.encodeKeys (self.mask.indices.astype (numpy.int64),
+                                       numpy.repeat (numpy.arange (
+                                           len (self.mask.indptr) - 1),
+                                           numpy.diff (self.mask.indptr)),
+                                       0, self.mask.high0, 0)
+        keys = cs.encodeKeys (numpy.asarray (sources, dtype = numpy.int64),
+                              numpy.asarray (targets, dtype = numpy.int64),
+                              0, self.mask.high0, 0)
+        positions = numpy.minimum (numpy.searchsorted (self.keys, keys),
+                                   max (len (self.keys) - 1, 0))
+        missing = (numpy.asarray (sources) < 0) \
+                  | (numpy.asarray (sources) >= self.mask.high0)
+        if len (self.keys):
+            missing |= self.keys[positions] != keys
+        else:
+            missing[:] = True
+        if numpy.any (missing):
+            k = numpy.nonzero (missing)[0][0]
+            raise KeyError ((sources[k], targets[k]))
+        return positions
+
+    def __call__ (self, i, j):
+        return self.values[self.positions ([i], [j])[0]]
+
+    def evaluate (self, sources, targets):
+        return self.values[self.positions (sources, targets)]
+
+
+class CompressedCSet (cs.CSet):
+    def __init__ (self, indptr, indices, values, n0 = None):
+        mask = CompressedMask (indptr, indices, n0)
+        cs.CSet.__init__ (self, mask,
+                          *[ CompressedValueSet (mask, v) for v in values ])
+        self.values = values
+
+    def iterator (self, low0, high0, low1, high1, state):
+        for block in self.blockIterator (low0, high0, low1, high1, state):
+            columns = [ b.tolist () for b in block ]
+            for c in zip (*columns):
+                yield (c[0], c[1], list (c[2:]))
+
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = cs.defaultBlockSize):
+        for (positions, sources, targets) \
+                in self._mask.positionBlocks (low0, high0, low1, high1,
+                                              blockSize):
+            if len (positions):
+                yield (sources, targets.astype (numpy.int64)) \
+                      + tuple ([ v[positions] for v in self.values ])
+
+    def toSparse (self, k = 0, shape = None):
+        return self.mask ().toSparse (self.values[k], shape)
+
+    def repr (self):
+        return 'compressed (%d connections, arity %d)' \
+               % (len (self.mask ().indices), self.arity)
+
+
+def compressed (c, blockSize = cs.defaultBlockSize):
+    # materialize the finite connection-set c
+    (indptr, indices, values) = compress (c, blockSize)
+    if not values:
+        return CompressedMask (indptr, indices)
+    return cs.ConnectionSet (CompressedCSet (indptr, indices, values))
+
+def fromSparse (matrix):
+    # connection-set with the stored elements of a scipy.sparse matrix
+    # as connections (row i, column j) with their value
+    if matrix.format != 'csc':
+        matrix = matrix.tocsc ()
+    if not matrix.has_sorted_indices:
+        matrix = matrix.sorted_indices ()
+    return cs.ConnectionSet (CompressedCSet (matrix.indptr, matrix.indices,
+                                             [matrix.data], matrix.shape[0]))
+
+def toSparse (c, k = 0, shape = None):
+    c = cs.coerceCSet (c)
+    if not isinstance (c, (CompressedMask, CompressedCSet)):
+        c = cs.coerceCSet (compressed (c))
+    if isinstance (c, CompressedMask):
+        return c.toSparse (None, shape)
+    return c.toSparse (k, shape)
@@ -0,0 +1,201 @@
+#
+#  This file is part of the Connection-Set Algebra (CSA).
+#  Copyright (C) 2010,2011,2012 Mikael Djurfeldt
+#
+#  CSA is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  CSA is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Cell lists
+#
+# A CellList sorts a set of points into a grid of cells which are at
+# least as large as a given radius in each dimension.  The points
+# within the radius of a center are then all found in the cell of the
+# center or in one of its neighbours.
+
+import itertools
+import numpy
+
+try:
+    from scipy.spatial import cKDTree
+    HAVE_SCIPY=True
+except ImportError:
+    HAVE_SCIPY=False
+
+# the maximal number of candidate pairs examined at a time
+maxCandidates = 1 << 20
+
+def segmentRanges (starts, ends):
+    # concatenation of range (starts[k], ends[k]) for all k, together
+    # with the index k of the range each element belongs to
+    counts = ends - starts
+    owner = numpy.repeat (numpy.arange (len (starts)), counts)
+    offset = numpy.arange (len (owner)) \
+             - numpy.repeat (numpy.cumsum (counts) - counts, counts)
+    return (starts[owner] + offset, owner)
+
+
+class CellList (object):
+    def __init__ (self, points, radius, periods = None):
+        # points is an (n, d) array, radius and periods scalars or
+        # arrays of length d.  If periods is given, space wraps around
+        # and the points are taken modulo periods.
+        points = numpy.asarray (points, dtype = float)
+        self.points = points
+        (n, d) = points.shape
+        radius = numpy.broadcast_to (numpy.asarray (radius, dtype = float),
+                                     (d,))
+        self.periodic = periods is not None
+        if self.periodic:
+            periods = numpy.broadcast_to (numpy.asarray (periods,
+                                                         dtype = float),
+                                          (d,))
+            self.periodArray = periods
+            points = numpy.mod (points, periods)
+            self.origin = numpy.zeros (d)
+            # don't use many more cells than points; halving the number
+            # of cells keeps a whole number of them in each period
+            limit = 4 * n + 16
+            shape = numpy.clip (numpy.floor (periods / radius), 1, limit) \
+                         .astype (numpy.int64)
+            while numpy.prod (shape.astype (float)) > limit:
+                shape = numpy.maximum (shape // 2, 1)
+            self.shape = shape
+            self.cellSize = periods / self.shape
+        else:
+            if n:
+                self.origin = points.min (axis = 0)
+                extent = points.max (axis = 0) - self.origin
+            else:
+                self.origin = numpy.zeros (d)
+                extent = numpy.zeros (d)
+            cellSize = numpy.maximum (radius, 1e-300)
+            # don't use many more cells than points
+            while numpy.prod (extent // cellSize + 1) > 4 * n + 16:
+                cellSize = cellSize * 2.0
+            self.cellSize = cellSize
+            self.shape = (extent // cellSize).astype (numpy.int64) + 1
+        self.strides = numpy.cumprod (numpy.concatenate (([1],
+                                                          self.shape[:-1])))
+        cells = self.cellIds (self.cellCoordinates (points))
+        self.order = numpy.argsort (cells, kind = 'stable')
+        sortedCells = cells[self.order]
+        nCells = int (numpy.prod (self.shape))
+        self.cellStart = numpy.searchsorted (sortedCells, numpy.arange (nCells))
+        self.cellEnd = numpy.searchsorted (sortedCells, numpy.arange (nCells),
+                                           'right')
+        self.offsets = self.neighbourOffsets ()
+
+    def cellCoordinates (self, points):
+        if self.periodic:
+            points = numpy.mod (points, self.periodArray)
+        c = numpy.floor ((points - self.origin) / self.cellSize) \
+                 .astype (numpy.int64)
+        return numpy.clip (c, 0, self.shape - 1) if self.periodic else c
+
+    def cellIds (self, coordinates):
+        return numpy.dot (coordinates, self.strides)
+
+    def neighbourOffsets (self):
+        ranges = []
+        for n in self.shape:
+            if self.periodic and n < 3:
+                # with fewer than three cells, all cells are neighbours
+                ranges.append (range (n))
+            else:
+                ranges.append ((-1, 0, 1))
+        return numpy.array (list (itertools.product (*ranges)),
+                            dtype = numpy.int64)
+
+    def meanOccupancy (self):
+        return float (len (self.order)) / len (self.cellStart)
+
+    def candidates (self, centers):
+        # Return (centerIndices, pointIndices) for all points in cells
+        # neighbouring the centers.  The result is sorted by center,
+        # but not by point.
+        centers = numpy.asarray (centers, dtype = float)
+        coordinates = self.cellCoordinates (centers)
+        if self.periodic and numpy.any (self.shape < 3):
+            small = self.shape < 3
+            coordinates[:, small] = 0
+        ci = []
+        pi = []
+        for offset in self.offsets:
+            c = coordinates + offset
+            if self.periodic:
+                c = numpy.mod (c, self.shape)
+                inside = numpy.ones (len (c), dtype = bool)
+            else:
+                inside = numpy.all ((c >= 0) & (c < self.shape), axis = 1)
+            owners = numpy.nonzero (inside)[0]
+            cells = self.cellIds (c[owners])
+            (k, owner) = segmentRanges (self.cellStart[cells],
+                                        self.cellEnd[cells])
+            ci.append (owners[owner])
+            pi.append (self.order[k])
+        ci = numpy.concatenate (ci)
+        pi = numpy.concatenate (pi)
+        order = numpy.argsort (ci, kind = 'stable')
+        return (ci[order], pi[order])
+
+
+# Nearest neighbour and radius queries
+#
+# kdTree (points) returns a scipy.spatial.cKDTree if scipy is available
+# and otherwise an object with the same query methods which compares
+# with all points.
+
+def kdTree (points):
+    if HAVE_SCIPY:
+        return cKDTree (points)
+    return BruteForceTree (points)
+
+
+class BruteForceTree (object):
+    def __init__ (self, points):
+        self.data = numpy.asarray (points, dtype = float)
+
+    def queryChunks (self, x):
+        x = numpy.asarray (x, dtype = float)
+        step = max (1, maxCandidates // max (1, len (self.data)))
+        flat = x.reshape (-1, self.data.shape[1])
+        for k in range (0, len (flat), step):
+            p = flat[k:k + step]
+            d = numpy.sqrt (numpy.sum ((p[:, None, :]
+                                        - self.data[None, :, :]) ** 2,
+                                       axis = -1))
+            yield d
+
+    def query (self, x):
+        x = numpy.asarray (x, dtype = float)
+        ds = []
+        indices = []
+        for d in self.queryChunks (x):
+            i = numpy.argmin (d, axis = 1)
+            ds.append (d[numpy.arange (len (i)), i])
+            indices.append (i)
+        (d, i) = (numpy.concatenate (ds), numpy.concatenate (indices))
+        if x.ndim == 1:
+            return (d[0], int (i[0]))
+        return (d.reshape (x.shape[:-1]), i.reshape (x.shape[:-1]))
+
+    def query_ball_point (self, x, r):
+        x = numpy.asarray (x, dtype = float)
+        result = []
+        for d in self.queryChunks (x):
+            result.extend ([ list (numpy.nonzero (row <= r)[0])
+                             for row in d ])
+        if x.ndim == 1:
+            return result[0]
+        return result
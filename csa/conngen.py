@@ -24,8 +24,9 @@ except ImportError:
 
 if HAVE_CG:
     from .csaobject import from_xml
-    from .elementary import arity, cross, partition
+    from .elementary import arity, cross, iterationPlan
     from .closure import Closure
+    from .intervalset import StridedIntervalSet
     
     class CSAConnectionGenerator (ConnectionGenerator):
         def __init__ (self, cset):
@@ -39,9 +40,11 @@ if HAVE_CG:
         def setMask (self, mask):
             self.setMasks ([mask], 0)
 
+        # The plan is made once, so that restarting the iteration
+        # doesn't copy the expression tree
         def setMasks (self, masks, local):
             csaMasks = list (map (CSAConnectionGenerator.makeMask, masks))
-            self.generator = partition (self.cset, csaMasks, local)
+            self.generator = iterationPlan (self.cset, csaMasks, local)
 
         @staticmethod
         def makeMask (mask):
@@ -53,11 +56,8 @@ if HAVE_CG:
             if iset.skip == 1:
                 return iset.intervals
             else:
-                ls = []
-                for ivl in iset.intervals:
-                    for i in range (ivl[0], ivl[1] + 1, iset.skip):
-                        ls.append ((i, i))
-                return ls
+                return StridedIntervalSet ([(ivl[0], ivl[1], iset.skip)
+                                            for ivl in iset.intervals])
 
         def __len__ (self):
             return self.generator.__len__ ()
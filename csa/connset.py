@@ -17,12 +17,265 @@
 #
 
 import copy
+import heapq
+import itertools
+import numpy
 
 from . import intervalset
 from . import valueset
 
 from .csaobject import *
 
+# Block iteration
+#
+# In addition to the iterator protocol, which yields one (i, j) tuple
+# per connection, masks support a block iterator protocol which yields
+# pairs (sources, targets) of int64 arrays.  Each block holds at most
+# blockSize connections and blocks are never empty.  Connections come
+# in the same order as from the iterator, i.e., sorted by target and
+# then by source.  Connection-sets with values extend the pairs with
+# one array of values per value set.
+
+defaultBlockSize = 65536
+
+_noIndices = numpy.empty (0, dtype = numpy.int64)
+
+def splitBlock (sources, targets, blockSize):
+    for k in range (0, len (sources), blockSize):
+        yield (sources[k:k + blockSize], targets[k:k + blockSize])
+
+def concatenateBlocks (blocks):
+    blocks = list (blocks)
+    if not blocks:
+        return (_noIndices, _noIndices)
+    elif len (blocks) == 1:
+        return blocks[0]
+    return (numpy.concatenate ([b[0] for b in blocks]),
+            numpy.concatenate ([b[1] for b in blocks]))
+
+def collectBlocks (pieces, blockSize):
+    # join a stream of possibly small or empty pieces into blocks
+    buffered = []
+    n = 0
+    for (sources, targets) in pieces:
+        if not len (sources):
+            continue
+        buffered.append ((sources, targets))
+        n += len (sources)
+        if n >= blockSize:
+            (sources, targets) = concatenateBlocks (buffered)
+            k = n - n % blockSize
+            for block in splitBlock (sources[:k], targets[:k], blockSize):
+                yield block
+            buffered = [(sources[k:], targets[k:])] if k < n else []
+            n -= k
+    if n:
+        yield concatenateBlocks (buffered)
+
+def blocksFromIterator (iterator, blockSize):
+    # generic fallback: collect connections from a tuple iterator
+    while True:
+        block = list (itertools.islice (iterator, blockSize))
+        if not block:
+            return
+        block = numpy.array (block, dtype = numpy.int64)
+        yield (block[:,0].copy (), block[:,1].copy ())
+
+def valueBlocksFromIterator (iterator, arity, blockSize):
+    # generic fallback for connection-sets with values
+    while True:
+        block = list (itertools.islice (iterator, blockSize))
+        if not block:
+            return
+        yield (numpy.array ([c[0] for c in block], dtype = numpy.int64),
+               numpy.array ([c[1] for c in block], dtype = numpy.int64)) \
+              + tuple ([ numpy.array ([c[2][k] for c in block])
+                         for k in range (arity) ])
+
+def targetWindows (low0, high0, low1, high1, blockSize):
+    # split [low1, high1) into target windows with at most about
+    # blockSize possible connections each
+    width = max (1, blockSize // max (1, high0 - low0))
+    for w0 in range (low1, high1, width):
+        yield (w0, min (w0 + width, high1))
+
+class AdaptiveWindows (object):
+    # Like targetWindows, but after each window report (n) tells how
+    # many connections it held, and the width of the following windows
+    # is adapted so that sparse masks are not visited one target at a
+    # time.
+    def __init__ (self, low0, high0, low1, high1, blockSize):
+        self.low1 = low1
+        self.high1 = high1
+        self.blockSize = blockSize
+        self.width = max (1, blockSize // max (1, high0 - low0))
+
+    def __iter__ (self):
+        w0 = self.low1
+        while w0 < self.high1:
+            w1 = min (w0 + self.width, self.high1)
+            yield (w0, w1)
+            w0 = w1
+
+    def report (self, n):
+        if 4 * n < self.blockSize:
+            self.width *= 2
+        elif n > 4 * self.blockSize:
+            self.width = max (1, self.width // 2)
+
+# the number of connections sorted at a time when changing the
+# iteration order
+sortBufferSize = 16 * defaultBlockSize
+
+def sourceWindows (mask, low0, high0, low1, high1):
+    # Windows of [low0, high0) meant to hold about sortBufferSize
+    # connections of mask each.  The width of the first window is
+    # estimated from the selectivity of the mask and is then adapted
+    # to the connections found, so that the mask is generated once.
+    windows = AdaptiveWindows (low1, high1, low0, high0, sortBufferSize)
+    if high0 > low0 and high1 > low1:
+        perSource = mask.selectivity (low0, high0, low1, high1) \
+                    * (high1 - low1)
+        windows.width = max (1, int (sortBufferSize / max (perSource, 1e-6)))
+    return windows
+
+def sourceSortedBlocks (obj, mask, low0, high0, low1, high1, state,
+                        blockSize):
+    # the blocks of obj, with mask as its mask, in source-major order
+    windows = sourceWindows (mask, low0, high0, low1, high1)
+    for (w0, w1) in windows:
+        n = 0
+        for block in sortedBySource (obj.blockIterator (w0, w1, low1, high1,
+                                                        state, blockSize),
+                                     blockSize):
+            n += len (block[0])
+            yield block
+        windows.report (n)
+
+def concatenateColumns (blocks):
+    # join blocks of columns (sources, targets, values...)
+    blocks = list (blocks)
+    if not blocks:
+        return None
+    elif len (blocks) == 1:
+        return list (blocks[0])
+    return [ numpy.concatenate ([b[k] for b in blocks])
+             for k in range (len (blocks[0])) ]
+
+def splitColumns (columns, blockSize, selection = None):
+    # blocks of the rows selected by the index or boolean array selection
+    if selection is not None:
+        columns = [ c[selection] for c in columns ]
+    for k in range (0, len (columns[0]), blockSize):
+        yield tuple ([ c[k:k + blockSize] for c in columns ])
+
+def sortedColumns (blocks, key, blockSize):
+    # Join blocks of columns and reorder them by stable sorting of
+    # key (columns).  Connections with equal keys keep the order in
+    # which they were given.
+    columns = concatenateColumns (blocks)
+    if columns == None:
+        return iter (())
+    return splitColumns (columns, blockSize,
+                         numpy.argsort (key (columns), kind = 'stable'))
+
+def sortedBySource (blocks, blockSize):
+    # Reorder target-major blocks into source-major blocks.  Since the
+    # connections of each target come with increasing source, a stable
+    # sort by source suffices.
+    return sortedColumns (blocks, lambda columns: columns[0], blockSize)
+
+def mergeIterators (iterators):
+    # k-way merge of iterators over connections (i, j, ...) in
+    # iteration order.  For equal connections, those of earlier
+    # iterators come first.
+    iterators = [ iter (it) for it in iterators ]
+    current = [ None ] * len (iterators)
+    heap = []
+    for (k, it) in enumerate (iterators):
+        for c in it:
+            current[k] = c
+            heap.append ((c[1], c[0], k))
+            break
+    heapq.heapify (heap)
+    while heap:
+        k = heap[0][2]
+        yield current[k]
+        for c in iterators[k]:
+            current[k] = c
+            heapq.heapreplace (heap, (c[1], c[0], k))
+            break
+        else:
+            heapq.heappop (heap)
+
+def flattenedOperands (cls, operands):
+    # operands of nested instances of cls are spliced in
+    flat = []
+    for op in operands:
+        if isinstance (op, cls):
+            flat.extend (op.operands)
+        else:
+            flat.append (op)
+    return flat
+
+# the number of possible connections tested when estimating the
+# selectivity of a testable mask
+selectivitySamples = 1024
+
+# the maximal number of rectangles for which ISetBoundedMask counts
+# the connections of its sub mask separately
+maxCountedPieces = 4096
+
+def indexRuns (indices):
+    # the runs of consecutive values in the sorted, unique array
+    # indices as half-open intervals
+    if not len (indices):
+        return []
+    breaks = numpy.nonzero (numpy.diff (indices) != 1)[0] + 1
+    starts = indices[numpy.concatenate (([0], breaks))]
+    ends = indices[numpy.concatenate ((breaks, [len (indices)])) - 1] + 1
+    return list (zip (starts.tolist (), ends.tolist ()))
+
+def blockDegrees (mask, axis, indices, low, high, state):
+    # Return the number of connections of each source (axis 0) or
+    # target (axis 1) in the array indices to targets or from sources
+    # in [low, high), counted over the blocks of mask.
+    (unique, inverse) = numpy.unique (indices, return_inverse = True)
+    degrees = numpy.zeros (len (unique), dtype = numpy.int64)
+    runs = indexRuns (unique)
+    if len (runs) > maxCountedPieces:
+        runs = [(int (unique[0]), int (unique[-1]) + 1)]
+    for (l, h) in runs:
+        bounds = (l, h, low, high) if axis == 0 else (low, high, l, h)
+        for block in mask.blockIterator (*(bounds + (state,))):
+            k = numpy.minimum (numpy.searchsorted (unique, block[axis]),
+                               len (unique) - 1)
+            hit = unique[k] == block[axis]
+            degrees += numpy.bincount (k[hit], minlength = len (unique))
+    return degrees[inverse]
+
+def encodeKeys (sources, targets, low0, high0, low1):
+    # encode connections as int64 keys preserving the iteration order
+    return (targets - low1) * max (1, high0 - low0) + (sources - low0)
+
+def clippedIntervals (iset, low, high):
+    # the intervals of iset within [low, high) as half-open intervals
+    window = intervalset.IntervalSet.fromArrays ([low], [high - 1])
+    (lower, upper) = iset.intersection (window).memberArrays ()
+    return list (zip (lower.tolist (), (upper + 1).tolist ()))
+
+def multisetMatch (keys1, keys2):
+    # For sorted keys1 and keys2, return a boolean array telling for
+    # each element of keys1 whether it has a partner in keys2.  The
+    # n:th occurrence of a key in keys1 matches the n:th occurrence of
+    # the same key in keys2.
+    first = numpy.searchsorted (keys1, keys1, 'left')
+    occurrence = numpy.arange (len (keys1)) - first
+    count = numpy.searchsorted (keys2, keys1, 'right') \
+            - numpy.searchsorted (keys2, keys1, 'left')
+    return occurrence < count
+
+
 # This is the fundamental connection-set class
 # which is also the base class for masks
 #
@@ -79,7 +332,7 @@ class CSet (CSAObject):
         # this code is used for full connection sets
         if isFinite (self.mask ()):
             state = State ()
-            obj = self.startIteration (state)
+            obj = self.optimize ().startIteration (state)
             (low0, high0, low1, high1) = self.bounds ()
             return obj.iterator (low0, high0, low1, high1, state)
         else:
@@ -97,6 +350,59 @@ class CSet (CSAObject):
         for (i, j) in self._mask.iterator (low0, high0, low1, high1, state):
             yield (i, j, [ v (i, j) for v in self.valueSets ])
 
+    def blocks (self, blockSize = defaultBlockSize, order = 'target'):
+        assert order in ('target', 'source'), \
+               "order should be 'target' or 'source'"
+        if isFinite (self.mask ()):
+            state = State ()
+            obj = self.optimize ().startIteration (state)
+            (low0, high0, low1, high1) = self.bounds ()
+            if order == 'source':
+                return obj.sourceBlockIterator (low0, high0, low1, high1,
+                                                state, blockSize)
+            return obj.blockIterator (low0, high0, low1, high1, state,
+                                      blockSize)
+        else:
+            raise RuntimeError ('attempt to retrieve blocks of infinite connection-set')
+
+    # Yields tuples (sources, targets, values0, values1, ...) of arrays
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = defaultBlockSize):
+        for (sources, targets) in self._mask.blockIterator (low0, high0,
+                                                            low1, high1,
+                                                            state,
+                                                            blockSize):
+            yield (sources, targets) \
+                  + tuple ([ valueset.evaluate (v, sources, targets)
+                             for v in self.valueSets ])
+
+    # Like blockIterator, but ordered by source and then target
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = defaultBlockSize):
+        for (sources, targets) in self._mask.sourceBlockIterator (low0, high0,
+                                                                  low1, high1,
+                                                                  state,
+                                                                  blockSize):
+            yield (sources, targets) \
+                  + tuple ([ valueset.evaluate (v, sources, targets)
+                             for v in self.valueSets ])
+
+    # Return an equivalent connection-set which is cheaper to iterate
+    def optimize (self):
+        obj = copy.copy (self)
+        obj._mask = self.mask ().optimize ()
+        return obj
+
+    # The iteration plan is described by a label for each node and the
+    # (role, node) pairs of its operands
+    def planLabel (self):
+        return self.__class__.__name__
+
+    def planChildren (self):
+        if self.mask () is self:
+            return []
+        return [('mask', self.mask ())]
+
     def multisetSum (self, other):
         return CSetMultisetSum (self, other)
 
@@ -128,6 +434,11 @@ class ConnectionSet (CSAObject):
     def __iter__ (self):
         return ConnectionSet.iterators[self.c.arity] (self)
 
+    # Stream the connection-set as columns (i, j, v0, v1, ...) of
+    # arrays, e.g., (sources, targets, weights, delays)
+    def blocks (self, blockSize = defaultBlockSize, order = 'target'):
+        return self.c.blocks (blockSize, order)
+
     def iter0 (self):
         assert False, 'Should not have executed ConnectionSet.iter0'
 
@@ -222,6 +533,131 @@ def transpose (obj):
     return obj.transpose ()
 
 
+def degrees (obj, axis, indices):
+    # degrees of the sources (axis 0) or targets (axis 1) of a finite
+    # connection-set
+    mask = coerceCSet (obj)
+    if not isinstance (mask, Mask):
+        mask = mask.mask ()
+    if not isFinite (mask):
+        raise RuntimeError ('attempt to retrieve degrees of infinite mask')
+    (low0, high0, low1, high1) = mask.bounds ()
+    if indices is None:
+        indices = numpy.arange (*((low0, high0) if axis == 0 else (low1, high1)))
+    elif isinstance (indices, intervalset.IntervalSet):
+        indices = indices.members (indices.min (), indices.max () + 1) \
+                  if indices else _noIndices
+    indices = numpy.asarray (indices, dtype = numpy.int64)
+    if not len (indices):
+        return numpy.zeros (0, dtype = numpy.int64)
+    state = State ()
+    obj = mask.optimize ().startIteration (state)
+    if axis == 0:
+        return obj.outDegrees (indices, low1, high1, state)
+    return obj.inDegrees (low0, high0, indices, state)
+
+# the number of targets whose in-degrees are counted when estimating
+# the work of a partition, the number of segments they are spread over
+# when there are more targets than that, and the number of windows
+# sampled in each segment
+plannerSamples = 4096
+plannerWindows = 64
+windowsPerSegment = 4
+
+# the largest number of targets whose in-degrees are all counted for
+# masks with analytic in-degrees, and the largest number of segments
+# they are summed over
+plannerTargets = 1 << 22
+plannerSegments = 1 << 16
+
+def targetBoundaries (mask, low1, high1):
+    # Return the interval boundaries of the target sets of the
+    # operands of mask within (low1, high1).  Operands in other
+    # coordinates only contribute superfluous cuts.
+    found = set ()
+    nodes = [mask]
+    while nodes and len (found) <= plannerSamples:
+        node = nodes.pop ()
+        if isinstance (node, (IntervalSetMask, ISetBoundedMask)):
+            for (i, j) in node.set1.intervalIterator ():
+                found.update ((i, j + 1))
+                if len (found) > plannerSamples:
+                    break
+        nodes.extend ([ child for (kind, child) in node.planChildren () ])
+    if len (found) > plannerSamples:
+        return []
+    return [ b for b in found if low1 < b < high1 ]
+
+def targetWork (mask, low0, high0, low1, high1, state):
+    # Return segment bounds splitting [low1, high1) and the estimated
+    # number of connections to the targets of each segment
+    if high1 - low1 <= plannerSamples \
+       or (high1 - low1 <= plannerTargets and mask.hasAnalyticDegrees ()):
+        # exact in-degrees, summed over segments of step targets
+        step = max (1, -(-(high1 - low1) // plannerSegments))
+        bounds = numpy.append (numpy.arange (low1, high1, step), high1)
+        work = [numpy.zeros (0)]
+        chunk = step * max (1, plannerSamples // step)
+        for c0 in range (low1, high1, chunk):
+            targets = numpy.arange (c0, min (c0 + chunk, high1))
+            degrees = mask.inDegrees (low0, high0, targets, state)
+            work.append (numpy.add.reduceat (degrees.astype (float),
+                                             numpy.arange (0, len (targets),
+                                                           step)))
+        return (bounds, numpy.concatenate (work))
+    # cut at the operand boundaries so that dense structure isn't
+    # averaged with its sparse surroundings
+    bounds = numpy.linspace (low1, high1, plannerWindows + 1).astype (numpy.int64)
+    bounds = numpy.union1d (bounds, targetBoundaries (mask, low1, high1))
+    nSegments = len (bounds) - 1
+    width = max (1, plannerSamples // (nSegments * windowsPerSegment))
+    work = []
+    for (b0, b1) in zip (bounds[:-1].tolist (), bounds[1:].tolist ()):
+        if b1 - b0 <= width * windowsPerSegment:
+            targets = numpy.arange (b0, b1)
+        else:
+            # windows of width targets centered in each quarter
+            # of the segment
+            targets = []
+            for k in range (windowsPerSegment):
+                c = b0 + (b1 - b0) * (2 * k + 1) // (2 * windowsPerSegment)
+                targets.append (numpy.arange (c - width // 2,
+                                              c - width // 2 + width))
+            targets = numpy.concatenate (targets)
+        degrees = mask.inDegrees (low0, high0, targets, state)
+        work.append (degrees.mean () * (b1 - b0))
+    return (bounds, numpy.array (work))
+
+def balancedPartitions (obj, n):
+    # Return n masks cross (sources, targets) partitioning the targets
+    # of a finite connection-set into intervals with about the same
+    # expected number of connections
+    mask = coerceCSet (obj)
+    if not isinstance (mask, Mask):
+        mask = mask.mask ()
+    if not isFinite (mask):
+        raise RuntimeError ('attempt to partition infinite mask')
+    (low0, high0, low1, high1) = mask.bounds ()
+    high1 = max (low1, high1)
+    state = State ()
+    (bounds, work) = targetWork (mask.optimize ().startIteration (state),
+                                 low0, high0, low1, high1, state)
+    total = numpy.concatenate (([0.0], numpy.cumsum (work)))
+    if total[-1] > 0:
+        # the work of a segment is assumed to be evenly spread over
+        # its targets
+        cuts = numpy.interp (total[-1] * numpy.arange (n + 1) / n,
+                             total, bounds)
+    else:
+        cuts = numpy.linspace (low1, high1, n + 1)
+    cuts = numpy.maximum.accumulate (numpy.round (cuts).astype (numpy.int64))
+    cuts[0] = low1
+    cuts[-1] = high1
+    sources = (low0, high0 - 1) if high0 > low0 else []
+    return [ intervalSetMask (sources, (t0, t1 - 1) if t1 > t0 else [])
+             for (t0, t1) in zip (cuts[:-1].tolist (), cuts[1:].tolist ()) ]
+
+
 # This is the fundamental mask class
 #
 class Mask (CSet):
@@ -229,10 +665,12 @@ class Mask (CSet):
         CSet.__init__ (self, self)
 
     def __len__ (self):
-        N = 0
-        for c in self:
-            N += 1
-        return N
+        if not isFinite (self):
+            raise RuntimeError ('attempt to retrieve length of infinite mask')
+        state = State ()
+        obj = self.optimize ().startIteration (state)
+        (low0, high0, low1, high1) = self.bounds ()
+        return int (obj.count (low0, high0, low1, high1, state))
 
     def __iter__ (self):
         raise RuntimeError ('attempt to retrieve iterator over infinite mask')
@@ -277,6 +715,99 @@ class Mask (CSet):
     def iterator (self, low0, high0, low1, high1, state):
         return NotImplemented
 
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = defaultBlockSize):
+        # default action:
+        return blocksFromIterator (self.iterator (low0, high0, low1, high1,
+                                                  state),
+                                   blockSize)
+
+    # Like blockIterator, but ordered by source and then target.  The
+    # default sorts the connections of a window of sources at a time.
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = defaultBlockSize):
+        return sourceSortedBlocks (self, self, low0, high0, low1, high1,
+                                   state, blockSize)
+
+    # Return the number of connections within the bounds.  Masks which
+    # can count connections without generating them override this.
+    def count (self, low0, high0, low1, high1, state):
+        # default action:
+        N = 0
+        for (sources, targets) in self.blockIterator (low0, high0,
+                                                      low1, high1, state):
+            N += len (sources)
+        return N
+
+    # Return the number of connections from sources in [low0, high0)
+    # to each of the targets (an array), and vice versa for
+    # outDegrees.  Masks which can compute degrees without generating
+    # the connections override these.
+    def inDegrees (self, low0, high0, targets, state):
+        # default action:
+        return blockDegrees (self, 1, targets, low0, high0, state)
+
+    def outDegrees (self, sources, low1, high1, state):
+        # default action:
+        return blockDegrees (self, 0, sources, low1, high1, state)
+
+    # True for masks whose in-degrees are computed without generating
+    # the connections
+    def hasAnalyticDegrees (self):
+        return False
+
+    # Masks which never contain a connection more than once and can
+    # cheaply decide whether given connections belong to them are
+    # testable and implement contains, which returns a boolean array.
+    # Intersections then filter the connections of the other operand
+    # instead of generating both.
+    def isTestable (self):
+        return False
+
+    def contains (self, sources, targets, state):
+        raise NotImplementedError
+
+    # The expected fraction of the possible connections within the
+    # bounds which are connections of the mask.  It is used to choose
+    # which operand of an intersection drives the iteration.  For
+    # testable masks, it is estimated from a fixed sample of possible
+    # connections.
+    def selectivity (self, low0, high0, low1, high1):
+        inf = intervalset.infinity
+        if not self.isTestable () or high0 <= low0 or high1 <= low1 \
+           or high0 == inf or high1 == inf:
+            return 1.0
+        rng = numpy.random.RandomState (0)
+        sources = rng.randint (low0, high0, selectivitySamples)
+        targets = rng.randint (low1, high1, selectivitySamples)
+        state = State ()
+        member = self.startIteration (state).contains (sources, targets,
+                                                       state)
+        return (numpy.count_nonzero (member) + 0.5) \
+               / (selectivitySamples + 1.0)
+
+    def optimize (self):
+        # default action:
+        return self
+
+    # Return a mask equal to cross (set0, set1) * self.  Masks which
+    # can push the bounds into their operands override this.  No
+    # intersection is added where it wouldn't remove anything.
+    def boundedBy (self, set0, set1):
+        # default action:
+        if not (set0 and set1):
+            return intervalSetMask ([], [])
+        elif isFinite (self):
+            (low0, high0, low1, high1) = self.bounds ()
+            inside0 = set0.count (low0, high0)
+            inside1 = set1.count (low1, high1)
+            if inside0 == max (0, high0 - low0) \
+               and inside1 == max (0, high1 - low1):
+                return self
+            elif not inside0 or not inside1:
+                return intervalSetMask ([], [])
+        return IntervalSetMask (set0, set1).intersection (self)
+
     def multisetSum (self, other):
         if isFinite (self) and isFinite (other):
             return FiniteMaskMultisetSum (self, other)
@@ -312,7 +843,7 @@ class Finite (object):
 
     def __iter__ (self):
         state = State ()
-        obj = self.startIteration (state)
+        obj = self.optimize ().startIteration (state)
         (low0, high0, low1, high1) = self.bounds ()
         return obj.iterator (low0, high0, low1, high1, state)
 
@@ -368,25 +899,117 @@ class BinaryMask (BinaryCSAObject, Mask):
         obj.op2 = self.op2.startIteration (state)
         return obj
 
+    def iterator (self, low0, high0, low1, high1, state):
+        for (sources, targets) in self.blockIterator (low0, high0,
+                                                      low1, high1, state):
+            for c in zip (sources.tolist (), targets.tolist ()):
+                yield c
+
+    def optimize (self):
+        obj = copy.copy (self)
+        obj.op1 = self.op1.optimize ()
+        obj.op2 = self.op2.optimize ()
+        return obj
+
+    def planChildren (self):
+        return [('driver', self.op1),
+                ('filter' if self.op2.isTestable () else 'join', self.op2)]
+
+    # If op2 is testable, the connections of op1 are filtered by
+    # filterBlock.  Otherwise both operands are evaluated over one
+    # target window at a time.  Their connections are encoded as int64
+    # keys in iteration order and joined by combineBlocks.
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = defaultBlockSize):
+        if self.op2.isTestable ():
+            blocks = self.op1.blockIterator (low0, high0, low1, high1,
+                                             state, blockSize)
+            for block in collectBlocks (self.filteredBlocks (blocks, state),
+                                        blockSize):
+                yield block
+            return
+        windows = AdaptiveWindows (low0, high0, low1, high1, blockSize)
+        for (w0, w1) in windows:
+            (s1, t1) = concatenateBlocks (
+                self.op1.blockIterator (low0, high0, w0, w1, state, blockSize))
+            (s2, t2) = concatenateBlocks (
+                self.op2.blockIterator (low0, high0, w0, w1, state, blockSize))
+            windows.report (len (s1) + len (s2))
+            keys1 = encodeKeys (s1, t1, low0, high0, w0)
+            keys2 = encodeKeys (s2, t2, low0, high0, w0)
+            (sources, targets) = self.combineBlocks (keys1, s1, t1,
+                                                     keys2, s2, t2)
+            for block in splitBlock (sources, targets, blockSize):
+                yield block
+
+    # The same in source-major order, with keys ordered by source
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = defaultBlockSize):
+        if self.op2.isTestable ():
+            blocks = self.op1.sourceBlockIterator (low0, high0, low1, high1,
+                                                   state, blockSize)
+            for block in collectBlocks (self.filteredBlocks (blocks, state),
+                                        blockSize):
+                yield block
+            return
+        windows = AdaptiveWindows (low1, high1, low0, high0, blockSize)
+        for (w0, w1) in windows:
+            (s1, t1) = concatenateBlocks (
+                self.op1.sourceBlockIterator (w0, w1, low1, high1, state,
+                                              blockSize))
+            (s2, t2) = concatenateBlocks (
+                self.op2.sourceBlockIterator (w0, w1, low1, high1, state,
+                                              blockSize))
+            windows.report (len (s1) + len (s2))
+            keys1 = encodeKeys (t1, s1, low1, high1, w0)
+            keys2 = encodeKeys (t2, s2, low1, high1, w0)
+            (sources, targets) = self.combineBlocks (keys1, s1, t1,
+                                                     keys2, s2, t2)
+            for block in splitBlock (sources, targets, blockSize):
+                yield block
+
+    def filteredBlocks (self, blocks, state):
+        last = None
+        for (sources, targets) in blocks:
+            # equal connections are adjacent in either order
+            first = numpy.ones (len (sources), dtype = bool)
+            first[1:] = (sources[1:] != sources[:-1]) \
+                        | (targets[1:] != targets[:-1])
+            if last == (sources[0], targets[0]):
+                first[0] = False
+            last = (sources[-1], targets[-1])
+            keep = self.filterBlock (first,
+                                     self.op2.contains (sources, targets,
+                                                        state))
+            yield (sources[keep], targets[keep])
+
 
 class MaskIntersection (BinaryMask):
     def __init__ (self, op1, op2):
         BinaryMask.__init__ (self, '*', op1, op2, 1)
 
-    def iterator (self, low0, high0, low1, high1, state):
-        iter1 = self.op1.iterator (low0, high0, low1, high1, state)
-        iter2 = self.op2.iterator (low0, high0, low1, high1, state)
-        (i1, j1) = next (iter1)
-        (i2, j2) = next (iter2)
-        while True:
-            if (j1, i1) < (j2, i2):
-                (i1, j1) = next (iter1)
-            elif (j2, i2) < (j1, i1):
-                (i2, j2) = next (iter2)
-            else:
-                yield (i1, j1)
-                (i1, j1) = next (iter1)
-                (i2, j2) = next (iter2)
+    def combineBlocks (self, keys1, s1, t1, keys2, s2, t2):
+        keep = multisetMatch (keys1, keys2)
+        return (s1[keep], t1[keep])
+
+    # Since op2 has each connection at most once, only the first of
+    # equal connections of op1 can be kept
+    def filterBlock (self, first, member):
+        return first & member
+
+    def isTestable (self):
+        return self.op1.isTestable () and self.op2.isTestable ()
+
+    def contains (self, sources, targets, state):
+        return self.op1.contains (sources, targets, state) \
+               & self.op2.contains (sources, targets, state)
+
+    def selectivity (self, low0, high0, low1, high1):
+        return self.op1.selectivity (low0, high0, low1, high1) \
+               * self.op2.selectivity (low0, high0, low1, high1)
+
+    def optimize (self):
+        return optimizedIntersection (self)
 
 
 class FiniteMaskIntersection (Finite, MaskIntersection):
@@ -398,78 +1021,127 @@ class FiniteMaskIntersection (Finite, MaskIntersection):
         return self.op1.bounds ()
 
 
-class MaskMultisetSum (BinaryMask):
-    def __init__ (self, op1, op2):
-        BinaryMask.__init__ (self, "+", op1, op2, 0)
+# Sums of any number of masks are represented by a single node so that
+# all operands are merged in one step.
+#
+class MaskMultisetSum (NaryCSAObject, Mask):
+    def __init__ (self, *operands):
+        Mask.__init__ (self)
+        NaryCSAObject.__init__ (self, '+',
+                                flattenedOperands (MaskMultisetSum, operands),
+                                0)
+
+    def startIteration (self, state):
+        obj = copy.copy (self)
+        obj.operands = [ op.startIteration (state) for op in self.operands ]
+        return obj
+
+    # operands outside of the bounds are dropped
+    def boundedBy (self, set0, set1):
+        operands = [ op.boundedBy (set0, set1) for op in self.operands ]
+        operands = [ op for op in operands
+                     if not (isinstance (op, IntervalSetMask)
+                             and not (op.set0 and op.set1)) ]
+        if not operands:
+            return intervalSetMask ([], [])
+        elif len (operands) == 1:
+            return operands[0]
+        elif all ([ isFinite (op) for op in operands ]):
+            return FiniteMaskMultisetSum (*operands)
+        return MaskMultisetSum (*operands)
 
     def iterator (self, low0, high0, low1, high1, state):
-        iter1 = self.op1.iterator (low0, high0, low1, high1, state)
-        iter2 = self.op2.iterator (low0, high0, low1, high1, state)
-        try:
-            (i1, j1) = next (iter1)
-        except StopIteration:
-            (i2, j2) = next (iter2)
-            while True:
-                yield (i2, j2)
-                (i2, j2) = next (iter2)
-        try:
-            (i2, j2) = next (iter2)
-        except StopIteration:
-            while True:
-                yield (i1, j1)
-                (i1, j1) = next (iter1)
-        while True:
-            i1s = i1
-            j1s = j1
-            while (j1, i1) <= (j2, i2):
-                yield (i1, j1)
-                try:
-                    (i1, j1) = next (iter1)
-                except StopIteration:
-                    while True:
-                        yield (i2, j2)
-                        (i2, j2) = next (iter2)
-            while (j2, i2) <= (j1s, i1s):
-                yield (i2, j2)
-                try:
-                    (i2, j2) = next (iter2)
-                except StopIteration:
-                    while True:
-                        yield (i1, j1)
-                        (i1, j1) = next (iter1)
+        return mergeIterators ([ op.iterator (low0, high0, low1, high1, state)
+                                 for op in self.operands ])
+
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = defaultBlockSize):
+        windows = AdaptiveWindows (low0, high0, low1, high1, blockSize)
+        for (w0, w1) in windows:
+            blocks = []
+            for op in self.operands:
+                blocks.extend (op.blockIterator (low0, high0, w0, w1, state,
+                                                 blockSize))
+            windows.report (sum ([ len (b[0]) for b in blocks ]))
+            key = lambda c: encodeKeys (c[0], c[1], low0, high0, w0)
+            for block in sortedColumns (blocks, key, blockSize):
+                yield block
+
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = defaultBlockSize):
+        windows = AdaptiveWindows (low1, high1, low0, high0, blockSize)
+        for (w0, w1) in windows:
+            blocks = []
+            for op in self.operands:
+                blocks.extend (op.sourceBlockIterator (w0, w1, low1, high1,
+                                                       state, blockSize))
+            windows.report (sum ([ len (b[0]) for b in blocks ]))
+            key = lambda c: encodeKeys (c[1], c[0], low1, high1, w0)
+            for block in sortedColumns (blocks, key, blockSize):
+                yield block
+
+    def count (self, low0, high0, low1, high1, state):
+        return sum ([ op.count (low0, high0, low1, high1, state)
+                      for op in self.operands ])
+
+    def selectivity (self, low0, high0, low1, high1):
+        return min (1.0, sum ([ op.selectivity (low0, high0, low1, high1)
+                                for op in self.operands ]))
+
+    def optimize (self):
+        operands = [ op.optimize () for op in self.operands ]
+        if all ([ a is b for (a, b) in zip (operands, self.operands) ]):
+            return self
+        return self.__class__ (*operands)
+
+    def planChildren (self):
+        return [ ('operand', op) for op in self.operands ]
+
+    def hasAnalyticDegrees (self):
+        return all ([ op.hasAnalyticDegrees () for op in self.operands ])
+
+    def inDegrees (self, low0, high0, targets, state):
+        return sum ([ op.inDegrees (low0, high0, targets, state)
+                      for op in self.operands ])
+
+    def outDegrees (self, sources, low1, high1, state):
+        return sum ([ op.outDegrees (sources, low1, high1, state)
+                      for op in self.operands ])
 
 
 class FiniteMaskMultisetSum (Finite, MaskMultisetSum):
-    def __init__ (self, op1, op2):
-        assert isFinite (op1) and isFinite (op2)
-        MaskMultisetSum.__init__ (self, op1, op2)
+    def __init__ (self, *operands):
+        assert all ([ isFinite (op) for op in operands ])
+        MaskMultisetSum.__init__ (self, *operands)
 
     def bounds (self):
-        return self.maxBounds (self.op1.bounds (), self.op2.bounds ())
+        b = self.operands[0].bounds ()
+        for op in self.operands[1:]:
+            b = self.maxBounds (b, op.bounds ())
+        return b
 
 
 class MaskDifference (BinaryMask):
     def __init__ (self, op1, op2):
         BinaryMask.__init__ (self, "-", op1, op2, 0)
 
-    def iterator (self, low0, high0, low1, high1, state):
-        iter1 = self.op1.iterator (low0, high0, low1, high1, state)
-        iter2 = self.op2.iterator (low0, high0, low1, high1, state)
-        (i1, j1) = next (iter1)
-        (i2, j2) = next (iter2)
-        while True:
-            if (j1, i1) < (j2, i2):
-                yield (i1, j1)
-                (i1, j1) = next (iter1)
-                continue
-            elif (i1, j1) == (i2, j2):
-                (i1, j1) = next (iter1)
-            try:
-                (i2, j2) = next (iter2)
-            except StopIteration:
-                while True:
-                    yield (i1, j1)
-                    (i1, j1) = next (iter1)
+    def combineBlocks (self, keys1, s1, t1, keys2, s2, t2):
+        keep = ~multisetMatch (keys1, keys2)
+        return (s1[keep], t1[keep])
+
+    # only the first of equal connections of op1 is removed
+    def filterBlock (self, first, member):
+        return ~(first & member)
+
+    def isTestable (self):
+        return self.op1.isTestable () and self.op2.isTestable ()
+
+    def contains (self, sources, targets, state):
+        return self.op1.contains (sources, targets, state) \
+               & ~self.op2.contains (sources, targets, state)
+
+    def selectivity (self, low0, high0, low1, high1):
+        return self.op1.selectivity (low0, high0, low1, high1)
 
 
 def cmpPostOrder (c0, op1):
@@ -497,34 +1169,73 @@ def cmp_to_key(mycmp):
 
 
 class ExplicitMask (FiniteMask):
+    # connections is a list of (source, target) pairs, an (n, 2) array
+    # or a tuple (sources, targets) of arrays.  They are kept as arrays
+    # sorted in iteration order, together with the permutation into
+    # source order and the sources in that order.
     def __init__ (self, connections):
         FiniteMask.__init__ (self)
-        self.connections = list (connections)
-        self.connections.sort (key=cmp_to_key(cmpPostOrder))
-        if connections:
-            self.low0 = min ((i for (i, j) in self.connections))
-            self.high0 = max ((i for (i, j) in self.connections)) + 1
-            self.low1 = self.connections[0][1]
-            self.high1 = self.connections[-1][1] + 1
+        if isinstance (connections, tuple) and len (connections) == 2 \
+           and isinstance (connections[0], numpy.ndarray):
+            (sources, targets) = connections
+        else:
+            connections = numpy.asarray (connections, dtype = numpy.int64)
+            connections = connections.reshape (-1, 2)
+            (sources, targets) = (connections[:,0], connections[:,1])
+        sources = numpy.asarray (sources, dtype = numpy.int64)
+        targets = numpy.asarray (targets, dtype = numpy.int64)
+        order = numpy.lexsort ((sources, targets))
+        self.sources = sources[order]
+        self.targets = targets[order]
+        self.sourceOrder = numpy.lexsort ((self.targets, self.sources))
+        self.sortedSources = self.sources[self.sourceOrder]
+        if len (order):
+            self.low0 = int (self.sources.min ())
+            self.high0 = int (self.sources.max ()) + 1
+            self.low1 = int (self.targets[0])
+            self.high1 = int (self.targets[-1]) + 1
 
     def __len__ (self):
-        return len (self.connections)
+        return len (self.sources)
 
     def iterator (self, low0, high0, low1, high1, state):
-        if not self.isBoundedBy (low0, high0, low1, high1):
-            return iter (self.connections)
-        else:
-            return self.boundedIterator (low0, high0, low1, high1, state)
-
-    def boundedIterator (self, low0, high0, low1, high1, state):
-        iterator = iter (self.connections)
-        (i, j) = next (iterator)
-        while j < low1:
-            (i, j) = next (iterator)
-        while j < high1:
-            if low0 <= i and i < high0:
-                yield (i, j)
-            (i, j) = next (iterator)
+        for (sources, targets) in self.blockIterator (low0, high0,
+                                                      low1, high1, state):
+            for c in zip (sources.tolist (), targets.tolist ()):
+                yield c
+
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = defaultBlockSize):
+        first = numpy.searchsorted (self.targets, low1)
+        last = numpy.searchsorted (self.targets, high1)
+        sources = self.sources[first:last]
+        targets = self.targets[first:last]
+        if low0 > self.low0 or high0 < self.high0:
+            keep = (sources >= low0) & (sources < high0)
+            sources = sources[keep]
+            targets = targets[keep]
+        return splitBlock (sources, targets, blockSize)
+
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = defaultBlockSize):
+        first = numpy.searchsorted (self.sortedSources, low0)
+        last = numpy.searchsorted (self.sortedSources, high0)
+        order = self.sourceOrder[first:last]
+        (sources, targets) = (self.sources[order], self.targets[order])
+        if low1 > self.low1 or high1 < self.high1:
+            keep = (targets >= low1) & (targets < high1)
+            (sources, targets) = (sources[keep], targets[keep])
+        return splitBlock (sources, targets, blockSize)
+
+    def count (self, low0, high0, low1, high1, state):
+        if low0 > self.low0 or high0 < self.high0:
+            return Mask.count (self, low0, high0, low1, high1, state)
+        return int (numpy.searchsorted (self.targets, high1)
+                    - numpy.searchsorted (self.targets, low1))
+
+    def selectivity (self, low0, high0, low1, high1):
+        return float (len (self.sources)) \
+               / max (1, (self.high0 - self.low0) * (self.high1 - self.low1))
 
 
 class IntervalSetMask (Mask):
@@ -545,6 +1256,24 @@ class IntervalSetMask (Mask):
     def __contains__ (self, c):
         return c[0] in self.set0 and c[1] in self.set1
 
+    def isTestable (self):
+        return True
+
+    def hasAnalyticDegrees (self):
+        return True
+
+    def contains (self, sources, targets, state):
+        return self.set0.contains (sources) & self.set1.contains (targets)
+
+    def selectivity (self, low0, high0, low1, high1):
+        if high0 <= low0 or high1 <= low1:
+            return 1.0
+        return float (self.count (low0, high0, low1, high1, None)) \
+               / (high0 - low0) / (high1 - low1)
+
+    def planLabel (self):
+        return '%s %s' % (self.__class__.__name__, self.repr ())
+
     def transpose (self):
         return IntervalSetMask (self.set1, self.set0)
 
@@ -552,11 +1281,11 @@ class IntervalSetMask (Mask):
         return IntervalSetMask (self.set0.shift (M), self.set1.shift (N))
 
     def iterator (self, low0, high0, low1, high1, state):
-        iterator1 = self.set1.intervalIterator ()
-        i1 = next (iterator1)
-        while i1[1] < low1:
-            i1 = next (iterator1)
-        while i1[0] < high1:
+        for i1 in self.set1.intervalIterator ():
+            if i1[1] < low1:
+                continue
+            if i1[0] >= high1:
+                return
             for j in range (max (i1[0], low1), min (i1[1] + 1, high1)):
                 iterator0 = self.set0.intervalIterator ()
                 try:
@@ -578,7 +1307,42 @@ class IntervalSetMask (Mask):
                             yield (i, j)
                 except StopIteration:
                     pass
-            i1 = next (iterator1)
+
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = defaultBlockSize):
+        sources = self.set0.members (low0, high0)
+        if not len (sources):
+            return
+        nSources = len (sources)
+        targets = self.set1.members (low1, high1)
+        if nSources >= blockSize:
+            for j in targets:
+                for block in splitBlock (sources,
+                                         numpy.full (nSources, j), blockSize):
+                    yield block
+        else:
+            nTargets = blockSize // nSources
+            for k in range (0, len (targets), nTargets):
+                t = targets[k:k + nTargets]
+                yield (numpy.tile (sources, len (t)),
+                       numpy.repeat (t, nSources))
+
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = defaultBlockSize):
+        for (targets, sources) in self.transpose ().blockIterator (
+                low1, high1, low0, high0, state, blockSize):
+            yield (sources, targets)
+
+    def count (self, low0, high0, low1, high1, state):
+        return self.set0.count (low0, high0) * self.set1.count (low1, high1)
+
+    def inDegrees (self, low0, high0, targets, state):
+        return numpy.where (self.set1.contains (targets),
+                            self.set0.count (low0, high0), 0)
+
+    def outDegrees (self, sources, low1, high1, state):
+        return numpy.where (self.set0.contains (sources),
+                            self.set1.count (low1, high1), 0)
 
     def intersection (self, other):
         if isinstance (other, IntervalSetMask):
@@ -588,6 +1352,10 @@ class IntervalSetMask (Mask):
         else:
             return ISetBoundedMask (self.set0, self.set1, other)
 
+    def boundedBy (self, set0, set1):
+        return intervalSetMask (self.set0.intersection (set0),
+                                self.set1.intersection (set1))
+
     def multisetSum (self, other):
         if isinstance (other, IntervalSetMask):
             if not self.set0.intersection (other.set0) \
@@ -712,59 +1480,158 @@ class ISetBoundedMask (FiniteMask):
         obj.subMask = self.subMask.startIteration (state)
         return obj
 
+    def isTestable (self):
+        return self.subMask.isTestable ()
+
+    def hasAnalyticDegrees (self):
+        return self.subMask.hasAnalyticDegrees ()
+
+    def contains (self, sources, targets, state):
+        return self.set0.contains (sources) & self.set1.contains (targets) \
+               & self.subMask.contains (sources, targets, state)
+
+    def selectivity (self, low0, high0, low1, high1):
+        return self.subMask.selectivity (max (low0, self.low0),
+                                         min (high0, self.high0),
+                                         max (low1, self.low1),
+                                         min (high1, self.high1))
+
+    def optimize (self):
+        return optimizedIntersection (self)
+
+    def boundedBy (self, set0, set1):
+        set0 = self.set0.intersection (set0)
+        set1 = self.set1.intersection (set1)
+        if set0.count (self.low0, self.high0) \
+           == self.set0.count (self.low0, self.high0) \
+           and set1.count (self.low1, self.high1) \
+           == self.set1.count (self.low1, self.high1):
+            return self
+        return self.subMask.boundedBy (set0, set1)
+
+    def planLabel (self):
+        return '%s %s' % (self.__class__.__name__,
+                          IntervalSetMask._sets_to_repr (self.set0, self.set1))
+
+    def planChildren (self):
+        return [('bounded', self.subMask)]
+
+    def boundedIntervals (self, low0, high0, low1, high1):
+        low0 = max (low0, self.low0)
+        high0 = min (high0, self.high0)
+        low1 = max (low1, self.low1)
+        high1 = min (high1, self.high1)
+        if high0 <= low0 or high1 <= low1:
+            return ([], [])
+        return (clippedIntervals (self.set0, low0, high0),
+                clippedIntervals (self.set1, low1, high1))
+
+    # The tuple iterator is based on the block iterator so that both
+    # visit the sub mask in the same way.  This matters for masks
+    # which draw random numbers.
     def iterator (self, low0, high0, low1, high1, state):
-        if not self.isBoundedBy (low0, high0, low1, high1):
-            return self.simpleIterator (state)
-        else:
-            return self.boundedIterator (low0, high0, low1, high1, state)
+        for (sources, targets) in self.blockIterator (low0, high0,
+                                                      low1, high1, state):
+            for c in zip (sources.tolist (), targets.tolist ()):
+                yield c
 
-    def simpleIterator (self, state):
-        for i1 in self.set1.intervalIterator ():
-            for i0 in self.set0.intervalIterator ():
-                for e in self.subMask.iterator (i0[0], i0[1] + 1,
-                                                i1[0], i1[1] + 1,
-                                                state):
-                    yield e
-
-    def boundedIterator (self, low0, high0, low1, high1, state):
-        iterator1 = self.set1.intervalIterator ()
-        i1 = next (iterator1)
-        while i1[1] < low1:
-            i1 = next (iterator1)
-        while i1[0] < high1:
-            i1 = (max (i1[0], low1), min (i1[1], high1 - 1))
-            iterator0 = self.set0.intervalIterator ()
-            try:
-                i0 = next (iterator0)
-                while i0[1] < low0:
-                    i0 = next (iterator0)
-                if i0[1] < high0:
-                    for e in self.subMask.iterator (max (i0[0], low0),
-                                                    i0[1] + 1,
-                                                    i1[0], i1[1] + 1,
-                                                    state):
-                        yield e
-                    i0 = next (iterator0)
-                    while i0[1] < high0:
-                        for e in self.subMask.iterator (i0[0], i0[1] + 1,
-                                                        i1[0], i1[1] + 1,
-                                                        state):
-                            yield e
-                        i0 = next (iterator0)
-                        for e in self.subMask.iterator (i0[0],
-                                                        min (i0[1] + 1, high0),
-                                                        i1[0], i1[1] + 1,
-                                                        state):
-                            yield e
-                else:
-                        for e in self.subMask.iterator (max (i0[0], low0),
-                                                        min (i0[1] + 1, high0),
-                                                        i1[0], i1[1] + 1,
-                                                        state):
-                            yield e
-            except StopIteration:
-                pass
-            i1 = next (iterator1)
+    # If the source set has a single interval within the bounds, the
+    # sub mask is iterated directly.  Otherwise, for dense source sets
+    # the sub mask is iterated over the source range and the result
+    # filtered, while for sparse source sets the sub mask is iterated
+    # for each source interval and the results are merged in target
+    # order.
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = defaultBlockSize):
+        (intervals0, intervals1) = self.boundedIntervals (low0, high0,
+                                                          low1, high1)
+        if not intervals0:
+            return
+        span0 = (intervals0[0][0], intervals0[-1][1])
+        dense = len (intervals0) == 1 \
+                or 2 * sum (h0 - l0 for (l0, h0) in intervals0) \
+                   >= span0[1] - span0[0]
+        for (l1, h1) in intervals1:
+            if dense:
+                blocks = self.subMask.blockIterator (span0[0], span0[1],
+                                                     l1, h1,
+                                                     state, blockSize)
+                if len (intervals0) == 1:
+                    for block in blocks:
+                        yield block
+                    continue
+                for (sources, targets) in blocks:
+                    keep = self.set0.contains (sources)
+                    if numpy.any (keep):
+                        yield (sources[keep], targets[keep])
+                continue
+            # the windows don't depend on blockSize so that the sub
+            # mask is always queried with the same bounds
+            for (w0, w1) in targetWindows (span0[0], span0[1],
+                                           l1, h1, defaultBlockSize):
+                parts = [ concatenateBlocks (
+                              self.subMask.blockIterator (l0, h0, w0, w1,
+                                                          state, blockSize))
+                          for (l0, h0) in intervals0 ]
+                (sources, targets) = concatenateBlocks (parts)
+                order = numpy.lexsort ((sources, targets))
+                for block in splitBlock (sources[order], targets[order],
+                                         blockSize):
+                    yield block
+
+    # With a single target interval, the sub mask is iterated in source
+    # order for each source interval.
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = defaultBlockSize):
+        (intervals0, intervals1) = self.boundedIntervals (low0, high0,
+                                                          low1, high1)
+        if len (intervals1) > 1:
+            blocks = Mask.sourceBlockIterator (self, low0, high0, low1, high1,
+                                               state, blockSize)
+            for block in blocks:
+                yield block
+            return
+        for (l1, h1) in intervals1:
+            for (l0, h0) in intervals0:
+                for block in self.subMask.sourceBlockIterator (l0, h0, l1, h1,
+                                                               state,
+                                                               blockSize):
+                    yield block
+
+    def count (self, low0, high0, low1, high1, state):
+        (intervals0, intervals1) = self.boundedIntervals (low0, high0,
+                                                          low1, high1)
+        if len (intervals0) * len (intervals1) > maxCountedPieces:
+            return Mask.count (self, low0, high0, low1, high1, state)
+        N = 0
+        for (l1, h1) in intervals1:
+            for (l0, h0) in intervals0:
+                N += self.subMask.count (l0, h0, l1, h1, state)
+        return N
+
+    def inDegrees (self, low0, high0, targets, state):
+        intervals0 = clippedIntervals (self.set0, low0, high0)
+        if len (intervals0) > maxCountedPieces:
+            return Mask.inDegrees (self, low0, high0, targets, state)
+        inside = self.set1.contains (targets)
+        degrees = numpy.zeros (len (targets), dtype = numpy.int64)
+        if numpy.any (inside):
+            t = targets[inside]
+            for (l0, h0) in intervals0:
+                degrees[inside] += self.subMask.inDegrees (l0, h0, t, state)
+        return degrees
+
+    def outDegrees (self, sources, low1, high1, state):
+        intervals1 = clippedIntervals (self.set1, low1, high1)
+        if len (intervals1) > maxCountedPieces:
+            return Mask.outDegrees (self, sources, low1, high1, state)
+        inside = self.set0.contains (sources)
+        degrees = numpy.zeros (len (sources), dtype = numpy.int64)
+        if numpy.any (inside):
+            s = sources[inside]
+            for (l1, h1) in intervals1:
+                degrees[inside] += self.subMask.outDegrees (s, l1, h1, state)
+        return degrees
 
     def repr (self):
         return '%s*%s' % (IntervalSetMask._sets_to_repr (self.set0, self.set1),
@@ -834,6 +1701,27 @@ class BinaryCSet (BinaryCSAObject, CSet):
             m[(i, j)] = v
         return m
 
+    def optimize (self):
+        obj = copy.copy (self)
+        obj.op1 = self.op1.optimize ()
+        obj.op2 = self.op2.optimize ()
+        return obj
+
+    def planChildren (self):
+        return [('operand', self.op1), ('operand', self.op2)]
+
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = defaultBlockSize):
+        # default action:
+        return valueBlocksFromIterator (self.iterator (low0, high0,
+                                                       low1, high1, state),
+                                        self.arity, blockSize)
+
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = defaultBlockSize):
+        return sourceSortedBlocks (self, self._mask, low0, high0, low1, high1,
+                                   state, blockSize)
+
 
 class BinaryCSets (BinaryCSet):
     def __init__ (self, operator, op1, op2):
@@ -847,76 +1735,96 @@ class CSetIntersection (BinaryCSet):
         BinaryCSet.__init__ (self, "*", op1, op2)
         self._mask = op1.mask ().intersection (op2)
 
+    def startIteration (self, state):
+        obj = CSet.startIteration (self, state)
+        obj.op1 = self.op1.startIteration (state)
+        obj.op2 = self.op2.startIteration (state)
+        return obj
+
     def iterator (self, low0, high0, low1, high1, state):
-        iter1 = self.op1.iterator (low0, high0, low1, high1, state)
-        iter2 = self.op2.iterator (low0, high0, low1, high1, state)
-        (i1, j1, v1) = next (iter1)
-        (i2, j2) = next (iter2)
-        while True:
-            if (j1, i1) < (j2, i2):
-                (i1, j1, v1) = next (iter1)
-            elif (j2, i2) < (j1, i1):
-                (i2, j2) = next (iter2)
-            else:
-                yield (i1, j1, v1)
-                (i1, j1, v1) = next (iter1)
-                (i2, j2) = next (iter2)
+        for block in self.blockIterator (low0, high0, low1, high1, state):
+            columns = [ c.tolist () for c in block ]
+            for c in zip (*columns):
+                yield (c[0], c[1], list (c[2:]))
+
+    # The connections of op1, with their values, which match a
+    # connection of the mask op2
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = defaultBlockSize):
+        windows = AdaptiveWindows (low0, high0, low1, high1, blockSize)
+        for (w0, w1) in windows:
+            columns = concatenateColumns (
+                self.op1.blockIterator (low0, high0, w0, w1, state, blockSize))
+            (s2, t2) = concatenateBlocks (
+                self.op2.blockIterator (low0, high0, w0, w1, state, blockSize))
+            windows.report ((len (columns[0]) if columns else 0) + len (s2))
+            if columns == None:
+                continue
+            keep = multisetMatch (encodeKeys (columns[0], columns[1],
+                                              low0, high0, w0),
+                                  encodeKeys (s2, t2, low0, high0, w0))
+            for block in splitColumns (columns, blockSize, keep):
+                yield block
+
+
+class CSetMultisetSum (NaryCSAObject, BinaryCSet):
+    def __init__ (self, *operands):
+        operands = flattenedOperands (CSetMultisetSum, operands)
+        assert all ([ op.arity == operands[0].arity for op in operands ]), \
+               'binary operation on connection-sets with different arity'
+        CSet.__init__ (self, None, *[ None for v in operands[0].valueSets ])
+        NaryCSAObject.__init__ (self, '+', operands, 0)
+        self.valueSetMap = None
+        self._mask = operands[0].mask ()
+        for op in operands[1:]:
+            self._mask = self._mask.multisetSum (op.mask ())
 
+    def startIteration (self, state):
+        obj = CSet.startIteration (self, state)
+        obj.operands = [ op.startIteration (state) for op in self.operands ]
+        return obj
+
+    def optimize (self):
+        obj = copy.copy (self)
+        obj.operands = [ op.optimize () for op in self.operands ]
+        return obj
+
+    def planChildren (self):
+        return [ ('operand', op) for op in self.operands ]
 
-class CSetMultisetSum (BinaryCSets):
-    def __init__ (self, op1, op2):
-        BinaryCSet.__init__ (self, "+", op1, op2)
-        self._mask = op1.mask ().multisetSum (op2.mask ())
-        
     def iterator (self, low0, high0, low1, high1, state):
-        iter1 = self.op1.iterator (low0, high0, low1, high1, state)
-        iter2 = self.op2.iterator (low0, high0, low1, high1, state)
-        try:
-            (i1, j1, v1) = next (iter1)
-        except StopIteration:
-            (i2, j2, v2) = next (iter2)
-            while True:
-                yield (i2, j2, v2)
-                (i2, j2, v2) = next (iter2)
-        try:
-            (i2, j2, v2) = next (iter2)
-        except StopIteration:
-            while True:
-                yield (i1, j1, v1)
-                (i1, j1, v1) = next (iter1)
-        while True:
-            i1s = i1
-            j1s = j1
-            while (j1, i1) <= (j2, i2):
-                yield (i1, j1, v1)
-                try:
-                    (i1, j1, v1) = next (iter1)
-                except StopIteration:
-                    while True:
-                        yield (i2, j2, v2)
-                        (i2, j2, v2) = next (iter2)
-            while (j2, i2) <= (j1s, i1s):
-                yield (i2, j2, v2)
-                try:
-                    (i2, j2, v2) = next (iter2)
-                except StopIteration:
-                    while True:
-                        yield (i1, j1, v1)
-                        (i1, j1, v1) = next (iter1)
+        return mergeIterators ([ op.iterator (low0, high0, low1, high1, state)
+                                 for op in self.operands ])
+
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = defaultBlockSize):
+        windows = AdaptiveWindows (low0, high0, low1, high1, blockSize)
+        for (w0, w1) in windows:
+            blocks = []
+            for op in self.operands:
+                blocks.extend (op.blockIterator (low0, high0, w0, w1, state,
+                                                 blockSize))
+            windows.report (sum ([ len (b[0]) for b in blocks ]))
+            key = lambda c: encodeKeys (c[0], c[1], low0, high0, w0)
+            for block in sortedColumns (blocks, key, blockSize):
+                yield block
 
     def intersection (self, other):
         assert isinstance (other, Mask), 'expected Mask operand'
         if isFinite (self) or isFinite (other):
             # since operands are finite we are allowed to use isEmpty
-            if isEmpty (self.op2.mask ().intersection (other)):
-                return self.op1.intersection (other)
-            if isEmpty (self.op1.mask ().intersection (other)):
-                return self.op2.intersection (other)
+            operands = [ op for op in self.operands
+                         if not isEmpty (op.mask ().intersection (other)) ]
+            if len (operands) <= 1:
+                return (operands or self.operands)[0].intersection (other)
+            if len (operands) < len (self.operands):
+                return CSetIntersection (CSetMultisetSum (*operands), other)
         return CSetIntersection (self, other)
 
 
 class TransposedMask (Finite, Mask):
     def __init__ (self, mask):
+        Mask.__init__ (self)
         self.subMask = mask
 
     def transpose (self):
@@ -926,6 +1834,23 @@ class TransposedMask (Finite, Mask):
         (low0, high0, low1, high1) = self.subMask.bounds ()
         return (low1, high1, low0, high0)
 
+    def isTestable (self):
+        return self.subMask.isTestable ()
+
+    def contains (self, sources, targets, state):
+        return self.subMask.contains (targets, sources, self.transposedState)
+
+    def selectivity (self, low0, high0, low1, high1):
+        return self.subMask.selectivity (low1, high1, low0, high0)
+
+    # double transposes cancel and masks which can be transposed
+    # directly are
+    def optimize (self):
+        return self.subMask.optimize ().transpose ()
+
+    def planChildren (self):
+        return [('operand', self.subMask)]
+
     def startIteration (self, state):
         obj = copy.copy (self)
         obj.transposedState = state.transpose ()
@@ -933,16 +1858,41 @@ class TransposedMask (Finite, Mask):
         return obj
 
     def iterator (self, low0, high0, low1, high1, state):
-        ls = []
-        for c in self.subMask.iterator (low1, high1, low0, high0, \
-                                        self.transposedState):
-            ls.append ((c[1], c[0]))
-        ls.sort (key=cmp_to_key(cmpPostOrder))
-        return iter (ls)
+        for (sources, targets) in self.blockIterator (low0, high0,
+                                                      low1, high1, state):
+            for c in zip (sources.tolist (), targets.tolist ()):
+                yield c
+
+    # The targets are the sources of the sub mask, so the source-major
+    # order of the sub mask is the iteration order of the transpose.
+    def blockIterator (self, low0, high0, low1, high1, state,
+                       blockSize = defaultBlockSize):
+        for (sources, targets) in self.subMask.sourceBlockIterator (
+                low1, high1, low0, high0, self.transposedState, blockSize):
+            yield (targets, sources)
+
+    def sourceBlockIterator (self, low0, high0, low1, high1, state,
+                             blockSize = defaultBlockSize):
+        for (sources, targets) in self.subMask.blockIterator (
+                low1, high1, low0, high0, self.transposedState, blockSize):
+            yield (targets, sources)
+
+    def count (self, low0, high0, low1, high1, state):
+        return self.subMask.count (low1, high1, low0, high0,
+                                   self.transposedState)
+
+    def inDegrees (self, low0, high0, targets, state):
+        return self.subMask.outDegrees (targets, low0, high0,
+                                        self.transposedState)
+
+    def outDegrees (self, sources, low1, high1, state):
+        return self.subMask.inDegrees (low1, high1, sources,
+                                       self.transposedState)
 
 
 class ShiftedMask (Mask):
     def __init__ (self, mask, M, N):
+        Mask.__init__ (self)
         self.subMask = mask
         self.M = M
         self.N = N
@@ -952,6 +1902,47 @@ class ShiftedMask (Mask):
         obj.subMask = self.subMask.startIteration (state)
         return obj
 
+    def isTestable (self):
+        return self.subMask.isTestable ()
+
+    def hasAnalyticDegrees (self):
+        return self.subMask.hasAnalyticDegrees ()
+
+    def contains (self, sources, targets, state):
+        sources = sources - self.M
+        targets = targets - self.N
+        inside = (sources >= 0) & (targets >= 0)
+        result = numpy.zeros (len (sources), dtype = bool)
+        if numpy.any (inside):
+            result[inside] = self.subMask.contains (sources[inside],
+                                                    targets[inside], state)
+        return result
+
+    def selectivity (self, low0, high0, low1, high1):
+        return self.subMask.selectivity (max (low0 - self.M, 0),
+                                         high0 - self.M,
+                                         max (low1 - self.N, 0),
+                                         high1 - self.N)
+
+    # Shifts of shifts are folded into one shift unless the inner shift
+    # drops connections which the outer would bring back.
+    def optimize (self):
+        subMask = self.subMask.optimize ()
+        (M, N) = (self.M, self.N)
+        if isinstance (subMask, ShiftedMask) \
+           and (subMask.M >= 0 or M <= 0) and (subMask.N >= 0 or N <= 0):
+            (M, N) = (M + subMask.M, N + subMask.N)
+            subMask = subMask.subMask
+        if M == 0 and N == 0:
+            return subMask
+        return subMask.shift (M, N)
+
+    def planLabel (self):
+        return '%s (%d, %d)' % (self.__class__.__name__, self.M, self.N)
+
+    def planChildren (self):
+        return [('operand', self.subMask)]
+
     def iterator (self, low0, high0, low1, high1, state):
         low0 -= self.M
         high0 -= self.M
@@ -964,6 +1955,37 @@ class ShiftedMask (Mask):
             if i1 >= 0 and j1 >= 0:
                 yield (i1, j1)
 
+    def count (self, low0, high0, low1, high1, state):
+        low0 = max (low0 - self.M, 0)
+        high0 -= self.M
+        low1 = max (low1 - self.N, 0)
+        high1 -= self.N
+        if high0 <= low0 or high1 <= low1:
+            return 0
+        return self.subMask.count (low0, high0, low1, high1, state)
+
+    def inDegrees (self, low0, high0, targets, state):
+        low0 = max (low0 - self.M, 0)
+        high0 -= self.M
+        targets = targets - self.N
+        inside = targets >= 0
+        degrees = numpy.zeros (len (targets), dtype = numpy.int64)
+        if high0 > low0 and numpy.any (inside):
+            degrees[inside] = self.subMask.inDegrees (low0, high0,
+                                                      targets[inside], state)
+        return degrees
+
+    def outDegrees (self, sources, low1, high1, state):
+        low1 = max (low1 - self.N, 0)
+        high1 -= self.N
+        sources = sources - self.M
+        inside = sources >= 0
+        degrees = numpy.zeros (len (sources), dtype = numpy.int64)
+        if high1 > low1 and numpy.any (inside):
+            degrees[inside] = self.subMask.outDegrees (sources[inside],
+                                                       low1, high1, state)
+        return degrees
+
 
 class FiniteShiftedMask (Finite, ShiftedMask):
     def bounds (self):
@@ -982,6 +2004,110 @@ def shiftedMask (mask, M, N):
         return ShiftedMask (mask, M, N)
 
 
+# Expression optimization
+#
+# Before iteration, expressions are rewritten by optimize () into
+# equivalent expressions which are cheaper to iterate.  A chain of
+# intersections is flattened into its factors.  The interval set masks
+# among them are merged into one cross product which, together with
+# the bounds of the finite factors, bounds the iteration of all other
+# factors.  The most selective of these drives the iteration, the
+# other masks which have to be generated are joined with it and
+# testable masks filter the result.
+
+def intersectionFactors (mask):
+    if isinstance (mask, MaskIntersection):
+        return intersectionFactors (mask.op1) + intersectionFactors (mask.op2)
+    elif isinstance (mask, ISetBoundedMask):
+        return [IntervalSetMask (mask.set0, mask.set1)] \
+               + intersectionFactors (mask.subMask)
+    optimized = mask.optimize ()
+    if optimized is not mask \
+       and isinstance (optimized, (MaskIntersection, ISetBoundedMask)):
+        return intersectionFactors (optimized)
+    return [optimized]
+
+def boundingSet (iset, low, high):
+    if high == intervalset.infinity:
+        return iset
+    elif high <= low:
+        return intervalset.IntervalSet ([])
+    return iset.intersection (intervalset.IntervalSet.fromArrays ([low],
+                                                                  [high - 1]))
+
+def setRange (iset, low, high):
+    if not iset:
+        return (0, 0)
+    elif iset.finite ():
+        return (iset.min (), iset.max () + 1)
+    return (max (iset.min (), low), high)
+
+def optimizedIntersection (mask):
+    factors = intersectionFactors (mask)
+    set0 = set1 = intervalset.N
+    others = []
+    for f in factors:
+        if isinstance (f, IntervalSetMask):
+            set0 = set0.intersection (f.set0)
+            set1 = set1.intersection (f.set1)
+        else:
+            others.append (f)
+    if not others:
+        return intervalSetMask (set0, set1)
+    inf = intervalset.infinity
+    (low0, high0, low1, high1) = (0, inf, 0, inf)
+    for f in others:
+        if isFinite (f):
+            (l0, h0, l1, h1) = f.bounds ()
+            (low0, high0, low1, high1) = (max (low0, l0), min (high0, h0),
+                                          max (low1, l1), min (high1, h1))
+    set0 = boundingSet (set0, low0, high0)
+    set1 = boundingSet (set1, low1, high1)
+    bounds = setRange (set0, low0, high0) + setRange (set1, low1, high1)
+    selectivity = [ f.selectivity (*bounds) for f in others ]
+    # sorted is stable, so equally selective factors keep their order
+    order = sorted (range (len (others)), key = lambda k: selectivity[k])
+    rest = order[1:]
+    order = order[:1] + [ k for k in rest if not others[k].isTestable () ] \
+            + [ k for k in rest if others[k].isTestable () ]
+    chain = others[order[0]]
+    for k in order[1:]:
+        if isFinite (chain):
+            chain = FiniteMaskIntersection (chain, others[k])
+        else:
+            chain = MaskIntersection (chain, others[k])
+    if len (factors) == len (others) and isFinite (chain):
+        return chain
+    if not isFinite (chain) and not (set0.finite () and set1.finite ()):
+        # the iteration can't be bounded
+        return mask
+    return ISetBoundedMask (set0, set1, chain)
+
+
+def explain (obj):
+    # a description of the optimized iteration plan of obj, one line
+    # per node
+    lines = []
+    describePlan (coerceCSet (obj).optimize (), '', 0, None, lines)
+    return '\n'.join (lines)
+
+def describePlan (node, role, depth, bounds, lines):
+    # nodes without bounds are described within those of their parent
+    notes = []
+    if isFinite (node):
+        bounds = node.bounds ()
+        notes.append ('bounds (%d, %d, %d, %d)' % bounds)
+    if isinstance (node, Mask):
+        if bounds != None:
+            notes.append ('selectivity %.3g' % node.selectivity (*bounds))
+        if node.isTestable ():
+            notes.append ('testable')
+    lines.append ('%s%s%s [%s]' % ('  ' * depth, role, node.planLabel (),
+                                   ', '.join (notes)))
+    for (r, child) in node.planChildren ():
+        describePlan (child, r + ': ', depth + 1, bounds, lines)
+
+
 class State (dict):
     def transpose (self):
         if 'partitions' in self:
@@ -992,12 +2118,21 @@ class State (dict):
             return self
 
 
+# The bounds of a partition given by a cross are pushed into the
+# partitioned object, which is only intersected with the partition
+# where this removes connections.
+#
+def partitionedMask (partition, mask):
+    if isinstance (partition, IntervalSetMask):
+        return mask.boundedBy (partition.set0, partition.set1)
+    return partition * mask
+
+
 class MaskPartition (Finite, Mask):
     def __init__ (self, mask, partitions, selected, seed):
         Mask.__init__ (self)
 
-        #*fixme* How can we know when this is not necessary?
-        self.subMask = partitions[selected] * mask
+        self.subMask = partitionedMask (partitions[selected], mask)
 
         #domain = IntervalSetMask ([], [])
         #for m in partitions:
@@ -1013,6 +2148,14 @@ class MaskPartition (Finite, Mask):
     def bounds (self):
         return self.subMask.bounds ()
 
+    def optimize (self):
+        obj = copy.copy (self)
+        obj.subMask = self.subMask.optimize ()
+        return obj
+
+    def planChildren (self):
+        return [('partition', self.subMask)]
+
     def startIteration (self, state):
         for key in self.state:
             state[key] = self.state[key]
@@ -1024,9 +2167,11 @@ class MaskPartition (Finite, Mask):
 
 class CSetPartition (CSet):
     def __init__ (self, c, partitions, selected, seed):
-        #*fixme* How can we know when this is not necessary?
-        
-        self.subCSet = (partitions[selected] * c).c
+        p = partitions[selected]
+        if partitionedMask (p, c.c.mask ()) is c.c.mask ():
+            self.subCSet = c.c
+        else:
+            self.subCSet = (p * c).c
         CSet.__init__ (self, self.subCSet.mask (), *self.subCSet.valueSets)
 
         self.state = { #'domain' : domain,
@@ -1041,6 +2186,14 @@ class CSetPartition (CSet):
     def bounds (self):
         return self.subCSet.bounds ()
 
+    def optimize (self):
+        obj = copy.copy (self)
+        obj.subCSet = self.subCSet.optimize ()
+        return obj
+
+    def planChildren (self):
+        return [('partition', self.subCSet)]
+
     def startIteration (self, state):
         for key in self.state:
             state[key] = self.state[key]
@@ -1049,3 +2202,55 @@ class CSetPartition (CSet):
     def iterator (self, low0, high0, low1, high1, state):
         raise RuntimeError ('iterator called on wrong object')
     
+
+
+# An iteration plan is the optimized expression of a finite
+# connection-set, or of one of its partitions, started once.  Started
+# objects only hold state which doesn't change during iteration, such
+# as the keys of random streams, so the plan can be iterated any
+# number of times without copying the expression tree again.
+#
+class IterationPlan (object):
+    def __init__ (self, c, partitions = None, selected = 0, seed = None):
+        if partitions == None:
+            c = coerceCSet (c)
+        elif isinstance (c, ConnectionSet):
+            c = CSetPartition (c, partitions, selected, seed)
+        else:
+            c = MaskPartition (coerceCSet (c), partitions, selected, seed)
+        if not isFinite (c.mask ()):
+            raise RuntimeError ('attempt to plan iteration over infinite connection-set')
+        self.arity = c.arity
+        self.bounds = c.bounds ()
+        self.state = State ()
+        self.obj = c.optimize ().startIteration (self.state)
+
+    def targetBounds (self, targets):
+        # the bounds restricted to the targets in [targets[0], targets[1])
+        (low0, high0, low1, high1) = self.bounds
+        if targets != None:
+            (low1, high1) = (max (low1, targets[0]), min (high1, targets[1]))
+        return (low0, high0, low1, high1)
+
+    # connections with values are tuples (i, j, v0, v1, ...) as when
+    # iterating over a ConnectionSet
+    def __iter__ (self):
+        iterator = self.obj.iterator (*(self.bounds + (self.state,)))
+        if not self.arity:
+            return iterator
+        return ((i, j) + tuple (vs) for (i, j, vs) in iterator)
+
+    def __len__ (self):
+        # started masks count themselves, other connection-sets their mask
+        mask = self.obj if isinstance (self.obj, Mask) else self.obj.mask ()
+        return int (mask.count (*(self.bounds + (self.state,))))
+
+    def blocks (self, blockSize = defaultBlockSize, order = 'target',
+                targets = None):
+        assert order in ('target', 'source'), \
+               "order should be 'target' or 'source'"
+        bounds = self.targetBounds (targets)
+        if order == 'source':
+            return self.obj.sourceBlockIterator (*(bounds + (self.state,
+                                                             blockSize)))
+        return self.obj.blockIterator (*(bounds + (self.state, blockSize)))
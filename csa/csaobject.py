@@ -186,6 +186,33 @@ class BinaryCSAObject (CSAObject):
         return E ('apply', E (op), op1, op2)
 
 
+# An associative operator applied to several operands, which is
+# written and serialized like the corresponding left-deep chain of
+# binary operations
+#
+class NaryCSAObject (CSAObject):
+    def __init__ (self, name, operands, precedence = 0):
+        CSAObject.__init__ (self, name, precedence)
+        self.operands = operands
+
+    def repr (self):
+        op1 = self.operands[0].repr ()
+        if self.operands[0].precedence < self.precedence:
+            op1 = "(%s)" % op1
+        return self.name.join ([op1] + [ op._repr_as_op2 (self.precedence)
+                                         for op in self.operands[1:] ])
+
+    def _to_xml (self):
+        if self.name in BinaryCSAObject.operator_table:
+            op = BinaryCSAObject.operator_table[self.name]
+        else:
+            op = self.name
+        xml = self.operands[0]._to_xml ()
+        for operand in self.operands[1:]:
+            xml = E ('apply', E (op), xml, operand._to_xml ())
+        return xml
+
+
 class OpExprValue (BinaryCSAObject):
     def __init__ (self, operator, operand):
         BinaryCSAObject.__init__ (self, '*', operator, operand, 1)
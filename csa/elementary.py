@@ -24,6 +24,7 @@ from . import connset as _cs
 from . import valueset as _vs
 from . import _elementary
 from . import _misc
+from . import _parallel
 from .csaobject import registerTag
 
 # Connection-Set constructor
@@ -91,6 +92,58 @@ def partition (c, masks, selected, seed = None):
     elif isinstance (c, _cs.ConnectionSet):
         return _cs.ConnectionSet (_cs.CSetPartition (c, masks, selected, seed))
 
+# A reusable plan for iterating over c or, if masks are given, over
+# its partition selected
+#
+def iterationPlan (c, masks = None, selected = 0, seed = None):
+    return _cs.IterationPlan (c, masks, selected, seed)
+
+# The partitions of c generated by a pool of worker processes.  Returns
+# one tuple (sources, targets, values...) of arrays per partition.
+#
+def generateParallel (c, masks, workers = None, seed = None, selected = None):
+    return _parallel.generateParallel (c, masks, workers, seed, selected)
+
+# The blocks of an iteration plan (or of partition selected of c)
+# generated window by window by a pool of threads.
+#
+def threadedBlocks (c, masks = None, selected = 0, threads = None, seed = None,
+                    blockSize = _cs.defaultBlockSize):
+    plan = c if isinstance (c, _cs.IterationPlan) \
+           else iterationPlan (c, masks, selected, seed)
+    return _parallel.threadedBlocks (plan, threads, blockSize)
+
+# Degree statistics
+#
+def inDegrees (c, targets = None):
+    return _cs.degrees (c, 1, targets)
+
+def outDegrees (c, sources = None):
+    return _cs.degrees (c, 0, sources)
+
+# n partitions of the targets of c with about the same expected number
+# of connections, to be passed to partition
+#
+def balancedPartitions (c, n):
+    return _cs.balancedPartitions (c, n)
+
+# The optimized iteration plan
+#
+def explain (c):
+    print (_cs.explain (c))
+
+# Iteration in 'target' (default) or 'source' major order
+#
+def iterate (c, order = 'target'):
+    if order == 'target':
+        return iter (c)
+    return _iterateBlocks (_cs.coerceCSet (c).blocks (order = order))
+
+def _iterateBlocks (blocks):
+    for block in blocks:
+        for x in zip (*[ column.tolist () for column in block ]):
+            yield x
+
 # Utilities
 #
 def tabulate (c):
@@ -20,38 +20,118 @@ import math as _math
 import random as _random
 import numpy as _numpy
 
-from . import intervalset as _iset
+from . import _spatial
+
+# Geometry objects map indices to positions.  They are called with an
+# index, returning the position as a tuple, and also support batch
+# lookup through positionsOf (indices), which returns an array with
+# one row per index.  Finite geometries have a positions array.
+#
+class Geometry (object):
+    def positionsOf (self, indices):
+        return self.positions[indices]
+
+
+# Geometries of scattered points build a spatial index (a KD-tree)
+# over the points of a domain when first queried, so that inverse
+# lookups take O(log N) time.
+#
+class PointSet (Geometry):
+    def __init__ (self):
+        self._trees = {}
+
+    def tree (self, domain):
+        key = None if domain == None else tuple (domain.intervals)
+        if key not in self._trees:
+            if domain == None:
+                indices = _numpy.arange (self.N)
+            else:
+                indices = _numpy.array (list (domain), dtype = _numpy.int64)
+            self._trees[key] = (indices,
+                                _spatial.kdTree (self.positions[indices]))
+        return self._trees[key]
+
+    def nearest (self, points, domain = None):
+        """Returns the index of the point nearest to each of points"""
+        (indices, tree) = self.tree (domain)
+        (d, k) = tree.query (points)
+        return indices[k]
+
+    def within (self, points, r, domain = None):
+        """Returns the sorted indices of the points within distance r
+        of a point, or a list of such arrays for an array of points"""
+        (indices, tree) = self.tree (domain)
+        result = tree.query_ball_point (points, r)
+        if _numpy.ndim (points) == 1:
+            return _numpy.sort (indices[_numpy.array (result, dtype = int)])
+        return [ _numpy.sort (indices[_numpy.array (ls, dtype = int)])
+                 for ls in result ]
+
+    def inverseOf (self, coordinates, domain):
+        i = self.nearest (_numpy.stack (_numpy.broadcast_arrays (*coordinates),
+                                        axis = -1),
+                          domain)
+        return int (i) if _numpy.ndim (i) == 0 else i
+
+
+class Grid2d (Geometry):
+    type = 'grid'
+
+    def __init__ (self, width, xScale = 1.0, yScale = 1.0, x0 = 0.0, y0 = 0.0):
+        self.width = width
+        self.xScale = xScale / width
+        self.yScale = yScale / width
+        self.x0 = x0
+        self.y0 = y0
+        self._positions = None
+
+    def __call__ (self, i):
+        return (self.x0 + self.xScale * (i % self.width),
+                self.y0 + self.yScale * (i // self.width))
+
+    def positionsOf (self, indices):
+        indices = _numpy.asarray (indices)
+        return _numpy.column_stack ((self.x0 + self.xScale * (indices % self.width),
+                                     self.y0 + self.yScale * (indices // self.width)))
+
+    @property
+    def positions (self):
+        if self._positions is None:
+            self._positions = self.positionsOf (_numpy.arange (self.width
+                                                               * self.width))
+        return self._positions
+
+    def inverse (self, x, y):
+        return int (round (x / self.xScale - self.x0)) \
+               + self.width * int (round (y / self.yScale - self.y0))
+
+
+class Random2d (PointSet):
+    type = 'ramdom'
+
+    def __init__ (self, N, xScale = 1.0, yScale = 1.0):
+        PointSet.__init__ (self)
+        self.coords = [(xScale * _random.random (), yScale * _random.random ())
+                       for i in range (0, N)]
+        self.positions = _numpy.array (self.coords, dtype = float) \
+                               .reshape (N, 2)
+        self.N = N
+        self.xScale = xScale
+        self.yScale = yScale
+
+    def __call__ (self, i):
+        return self.coords[i]
+
+    # x and y may also be arrays
+    def inverse (self, x, y, domain = None):
+        return self.inverseOf ((x, y), domain)
+
 
 def grid2d (width, xScale = 1.0, yScale = 1.0, x0 = 0.0, y0 = 0.0):
-    xScale /= width
-    yScale /= width
-    g = lambda i: \
-        (x0 + xScale * (i % width), y0 + yScale * (i // width))
-    g.type = 'grid'
-    g.width = width
-    g.xScale = xScale
-    g.yScale = yScale
-    g.x0 = x0
-    g.y0 = y0
-    g.inverse = lambda x, y: \
-                    int (round (x / xScale - x0)) \
-                    + width * int (round (y / yScale - y0))
-    return g
+    return Grid2d (width, xScale, yScale, x0, y0)
 
 def random2d (N, xScale = 1.0, yScale = 1.0):
-    coords = [(xScale * _random.random (), yScale * _random.random ())
-              for i in range (0, N)]
-    g = lambda i: coords[i]
-    g.type = 'ramdom'
-    g.N = N
-    g.xScale = xScale
-    g.yScale = yScale
-    # We should use a KD-tree here
-    g.inverse = lambda x, y, domain=_iset.IntervalSet ((0, N - 1)): \
-                    _numpy.array ([euclidDistance2d ((x, y), g(i)) \
-                                   for i in domain]).argmin () \
-                                   + domain.min ()
-    return g
+    return Random2d (N, xScale, yScale)
 
 class ProjectionOperator (object):
     def __init__ (self, projection):
@@ -61,14 +141,85 @@ class ProjectionOperator (object):
         projection = self.projection
         return lambda i: projection (g (i))
 
+# Return the positions of the elements indices as a 2-dimensional
+# array with one row per index.  Geometry objects look these up
+# directly.  Other position functions are called once per distinct
+# index.
+#
+def _positions (g, indices):
+    if hasattr (g, 'positionsOf'):
+        return g.positionsOf (indices)
+    (unique, inverse) = _numpy.unique (indices, return_inverse = True)
+    p = _numpy.array ([g (i) for i in unique.tolist ()], dtype = float)
+    return p.reshape (len (unique), -1)[inverse]
+
+def _euclidDistances (p1, p2):
+    return _numpy.sqrt (_numpy.sum ((p1 - p2) ** 2, axis = -1))
+
+def _euclidToroidDistances (p1, p2, xScale, yScale):
+    dd = _numpy.abs (p1 - p2)
+    scale = _numpy.array ([xScale, yScale])
+    dd = _numpy.where (dd < scale / 2., dd, scale - dd)
+    return _numpy.sqrt (_numpy.sum (dd * dd, axis = -1))
+
+# Metrics are called either with a source and a target index, or with
+# arrays of sources and targets, in which case an array of distances
+# is returned.  The batch form is also available as evaluate, which
+# makes metrics vectorizable value sets.
+#
+class Metric (object):
+    type = 'euclid'
+    periods = None
+
+    def __init__ (self, g1, g2 = None):
+        self.g1 = g1
+        self.g2 = g1 if g2 == None else g2
+
+    def __call__ (self, i, j):
+        if _numpy.ndim (i) == 0 and _numpy.ndim (j) == 0:
+            return self.distance (self.g1 (i), self.g2 (j))
+        return self.evaluate (*_numpy.broadcast_arrays (i, j))
+
+    def evaluate (self, sources, targets):
+        return self.distances (_positions (self.g1, sources),
+                               _positions (self.g2, targets))
+
+
+class EuclidMetric2d (Metric):
+    def distance (self, p1, p2):
+        return euclidDistance2d (p1, p2)
+
+    def distances (self, p1, p2):
+        return _euclidDistances (p1, p2)
+
+
+class EuclidToroidMetric2d (Metric):
+    def __init__ (self, g1, g2 = None, xScale = 1.0, yScale = 1.0):
+        Metric.__init__ (self, g1, g2)
+        self.periods = (xScale, yScale)
+
+    def distance (self, p1, p2):
+        return euclidToroidDistance2d (p1, p2, *self.periods)
+
+    def distances (self, p1, p2):
+        return _euclidToroidDistances (p1, p2, *self.periods)
+
+
+class EuclidMetric3d (Metric):
+    def distance (self, p1, p2):
+        return euclidDistance3d (_numpy.asarray (p1), _numpy.asarray (p2))
+
+    def distances (self, p1, p2):
+        return _euclidDistances (p1, p2)
+
+
 def euclidDistance2d (p1, p2):
     dx = p1[0] - p2[0]
     dy = p1[1] - p2[1]
     return _math.sqrt (dx * dx + dy * dy)
 
 def euclidMetric2d (g1, g2 = None):
-    g2 = g1 if g2 == None else g2
-    return lambda i, j: euclidDistance2d (g1 (i), g2 (j))
+    return EuclidMetric2d (g1, g2)
 
 # These functions were contributed by Dr. Birgit Kriener
 
@@ -79,11 +230,72 @@ def euclidToroidDistance2d (p1, p2, xScale=1.0, yScale=1.0):
     return _math.sqrt (dx * dx + dy * dy)
 
 def euclidToroidMetric2d (g1, g2 = None, xScale=1.0, yScale=1.0):
-    g2 = g1 if g2 == None else g2
-    return lambda i, j: euclidToroidDistance2d (g1 (i), g2 (j), xScale, yScale)
+    return EuclidToroidMetric2d (g1, g2, xScale, yScale)
 
 # 3D functions
 
+class Grid3d (Geometry):
+    type = 'grid3d'
+
+    def __init__ (self, width, xScale = 1.0, yScale = 1.0, zScale = 1.0,
+                  x0 = 0.0, y0 = 0.0, z0 = 0.0):
+        self.width = width
+        self.xScale = xScale / width
+        self.yScale = yScale / width
+        self.zScale = zScale / width
+        self.x0 = x0
+        self.y0 = y0
+        self.z0 = z0
+        self._positions = None
+
+    def __call__ (self, i):
+        w = self.width
+        return (self.x0 + self.xScale * (i % w),
+                self.y0 + self.yScale * ((i % (w * w)) // w),
+                self.z0 + self.zScale * (i // (w * w)))
+
+    def positionsOf (self, indices):
+        indices = _numpy.asarray (indices)
+        w = self.width
+        return _numpy.column_stack ((self.x0 + self.xScale * (indices % w),
+                                     self.y0 + self.yScale * ((indices % (w * w)) // w),
+                                     self.z0 + self.zScale * (indices // (w * w))))
+
+    @property
+    def positions (self):
+        if self._positions is None:
+            self._positions = self.positionsOf (_numpy.arange (self.width ** 3))
+        return self._positions
+
+    def inverse (self, x, y, z):
+        return int (round (x / self.xScale - self.x0)) \
+               + self.width * (int (round (y / self.yScale - self.y0)
+                                    + self.width
+                                    * int (round (z / self.zScale - self.z0))))
+
+
+class Random3d (PointSet):
+    type = 'random'
+
+    def __init__ (self, N, xScale = 1.0, yScale = 1.0, zScale = 1.0):
+        PointSet.__init__ (self)
+        coords = _numpy.random.random((N, 3))
+        coords[...,0] *= xScale
+        coords[...,1] *= yScale
+        coords[...,2] *= zScale
+        self.positions = coords
+        self.N = N
+        self.xScale = xScale
+        self.yScale = yScale
+        self.zScale = zScale
+
+    def __call__ (self, i):
+        return self.positions[i]
+
+    def inverse (self, x, y, z, domain = None):
+        return self.inverseOf ((x, y, z), domain)
+
+
 def grid3d(width, xScale = 1.0, yScale = 1.0, zScale = 1.0, x0 = 0.0, y0 = 0.0, z0 = 0.0):
     """Returns a 3D grid between (0, 0, 0) and (1, 1, 1)
     :param width: The number of rows/columns the grid has
@@ -101,24 +313,7 @@ def grid3d(width, xScale = 1.0, yScale = 1.0, zScale = 1.0, x0 = 0.0, y0 = 0.0,
     :param z0: Translates the grid along the z axis
     :type zScale: float
     :return: A callable grid that returns 3d positions when given an index"""
-    xScale /= width
-    yScale /= width
-    zScale /= width
-    g = lambda i: \
-        (x0 + xScale * (i % width), y0 + yScale * ((i % (width*width)) / width), z0 + zScale * (i / (width*width)))
-    g.type = 'grid3d'
-    g.width = width
-    g.xScale = xScale
-    g.yScale = yScale
-    g.zScale = zScale
-    g.x0 = x0
-    g.y0 = y0
-    g.z0 = z0
-    g.inverse = lambda x, y, z: \
-                    int (round (x / xScale - x0)) \
-                    + width * (int (round (y / yScale - y0)
-                    + width * int (round (z / zScale - z0))))
-    return g
+    return Grid3d (width, xScale, yScale, zScale, x0, y0, z0)
     
 def random3d(N, xScale = 1.0, yScale = 1.0, zScale = 1.0):
     """Creates a set of points scattered uniformly inside a 3D box
@@ -130,22 +325,9 @@ def random3d(N, xScale = 1.0, yScale = 1.0, zScale = 1.0):
     :type yScale: float
     :param zScale: The scale of the box on the z axis
     :type zScale: float
+    :return: A callable geometry with an (N, 3) positions array
     """
-    coords = _numpy.random.random((N, 3))
-    coords[...,0] *= xScale
-    coords[...,1] *= yScale
-    coords[...,2] *= zScale
-    g = lambda i: coords[i]
-    g.type = 'random'
-    g.N = N
-    g.xScale = xScale
-    g.yScale = yScale
-    g.zScale = zScale
-    g.inverse = lambda x, y, z, domain=_iset.IntervalSet ((0, N - 1)): \
-                    _numpy.array ([euclidDistance3d (_numpy.array((x, y, z)), g(i)) \
-                                   for i in domain]).argmin () \
-                                   + domain.min ()
-    return g
+    return Random3d (N, xScale, yScale, zScale)
 
 def euclidDistance3d(p1, p2):
     """Returns the euclidean distance in 3D between two points
@@ -164,8 +346,7 @@ def euclidMetric3d (g1, g2 = None):
     :type g1: callable
     :param g2: The second group of points. If None, the first group of points is used
     :type g2: callable
-    :return: A 3D euclidean metric function
-    :rtype: function
+    :return: A 3D euclidean metric, which also accepts arrays of indices
+    :rtype: EuclidMetric3d
     """
-    g2 = g1 if g2 == None else g2
-    return lambda i, j: euclidDistance3d (g1 (i), g2 (j))
+    return EuclidMetric3d (g1, g2)
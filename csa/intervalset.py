@@ -17,12 +17,86 @@
 #
 
 import sys
+import numpy
 
 from .csaobject import *
 
 infinity = sys.maxsize - 1
 
-# Interval sets are represented as ordered lists of closed intervals
+_noIntervals = numpy.empty (0, dtype = numpy.int64)
+
+# Vectorized set operations on interval arrays
+#
+# An interval array pair (lower, upper) holds the closed intervals
+# [lower[k], upper[k]] in increasing order.  The intervals are disjoint
+# and never adjacent, i.e., lower[k + 1] > upper[k] + 1.
+
+def overlappingPairs (lower0, upper0, lower1, upper1):
+    # for each interval of the first set, the overlapping intervals
+    # of the second set are first[k] <= m < last[k]
+    first = numpy.searchsorted (upper1, lower0, 'left')
+    last = numpy.searchsorted (lower1, upper0, 'right')
+    n = numpy.maximum (last - first, 0)
+    total = int (n.sum ())
+    index0 = numpy.repeat (numpy.arange (len (lower0)), n)
+    offsets = numpy.cumsum (n) - n
+    index1 = numpy.arange (total) - numpy.repeat (offsets - first, n)
+    return (index0, index1)
+
+def intersectArrays (lower0, upper0, lower1, upper1):
+    (index0, index1) = overlappingPairs (lower0, upper0, lower1, upper1)
+    if not len (index0):
+        return (_noIntervals, _noIntervals)
+    return (numpy.maximum (lower0[index0], lower1[index1]),
+            numpy.minimum (upper0[index0], upper1[index1]))
+
+def unionArrays (lower0, upper0, lower1, upper1):
+    lower = numpy.concatenate ((lower0, lower1))
+    upper = numpy.concatenate ((upper0, upper1))
+    return mergeArrays (lower, upper)
+
+def mergeArrays (lower, upper):
+    # sort possibly overlapping intervals and merge overlapping
+    # or adjacent ones
+    if not len (lower):
+        return (_noIntervals, _noIntervals)
+    order = numpy.argsort (lower, kind = 'mergesort')
+    lower = lower[order]
+    upper = upper[order]
+    reach = numpy.maximum.accumulate (upper)
+    start = numpy.empty (len (lower), dtype = bool)
+    start[0] = True
+    start[1:] = lower[1:] > reach[:-1] + 1
+    starts = numpy.flatnonzero (start)
+    ends = numpy.append (starts[1:] - 1, len (lower) - 1)
+    return (lower[starts], reach[ends])
+
+def complementArrays (lower, upper):
+    # the complement within [0, infinity]
+    gapLower = numpy.concatenate (([0], upper + 1))
+    gapUpper = numpy.concatenate ((lower - 1, [infinity]))
+    keep = gapLower <= gapUpper
+    return (gapLower[keep], gapUpper[keep])
+
+def shiftArrays (lower, upper, N):
+    lower = lower + N
+    upper = upper + N
+    keep = upper >= 0
+    return (numpy.maximum (lower[keep], 0), upper[keep])
+
+def arraysSize (lower, upper):
+    return int ((upper - lower).sum ()) + len (lower)
+
+def expandArrays (lower, upper):
+    # return all members of the intervals as one array
+    sizes = upper - lower + 1
+    offsets = numpy.cumsum (sizes) - sizes
+    return numpy.arange (int (sizes.sum ()), dtype = numpy.int64) \
+           + numpy.repeat (lower - offsets, sizes)
+
+
+# Interval sets are represented as ordered sequences of closed intervals
+# stored in two int64 arrays of lower and upper bounds
 #
 class IntervalSet (CSAObject):
     tag = 'intervalset'
@@ -31,8 +105,8 @@ class IntervalSet (CSAObject):
     # return true if tuple i represents a well-formed interval
     def goodInterval (i):
         return len (i) == 2 \
-               and isinstance (i[0], int) \
-               and isinstance (i[1], int) \
+               and isinstance (i[0], (int, numpy.integer)) \
+               and isinstance (i[1], (int, numpy.integer)) \
                and i[0] <= i[1]
 
     @staticmethod
@@ -56,46 +130,84 @@ class IntervalSet (CSAObject):
             if isinstance (x, tuple):
                 assert IntervalSet.goodInterval (x), 'malformed interval'
                 res.append (x)
-            elif isinstance (x, int):
+            elif isinstance (x, (int, numpy.integer)):
                 res.append ((x, x))
             elif isinstance (x, range):
                 res += IntervalSet.rangeToIntervals (x)
             else:
                 raise TypeError ("can't interpret element as interval")
-        s = res
+        if not res:
+            return (_noIntervals, _noIntervals)
 
-        s.sort ()
+        s = numpy.array (res, dtype = numpy.int64)
+        s = s[numpy.lexsort ((s[:,1], s[:,0]))]
+        lower = s[:,0]
+        upper = s[:,1]
 
         # merge intervals
-        # by construction we know that i[0] <= i[1] for i in s
-        res = []
-        N = 0
-        if s:
-            lastLower = s[0][0]
-            lastUpper = s[0][1]
-
-            assert lastLower >= 0, 'only positive values allowed'
-
-            for i in s[1:]:
-                assert lastLower < i[0] and lastUpper < i[0], 'intervals overlap'
-                if i[0] - lastUpper == 1:
-                    lastUpper = i[1]
-                else:
-                    res.append ((lastLower, lastUpper))
-                    N += 1 + lastUpper - lastLower
-                    lastLower = i[0]
-                    lastUpper = i[1]
-            res.append ((lastLower, lastUpper))
-            N += 1 + lastUpper - lastLower
-
-        return (res, N)
-    
+        # by construction we know that lower <= upper
+        assert lower[0] >= 0, 'only positive values allowed'
+        assert numpy.all (lower[1:] > upper[:-1]), 'intervals overlap'
+        start = numpy.empty (len (lower), dtype = bool)
+        start[0] = True
+        start[1:] = lower[1:] - upper[:-1] != 1
+        starts = numpy.flatnonzero (start)
+        ends = numpy.append (starts[1:] - 1, len (lower) - 1)
+        return (lower[starts], upper[ends])
+
     def __init__ (self, s = [], intervals = None, nIntegers = None):
         if intervals:
             self.intervals = intervals
-            self.nIntegers = nIntegers
+            if nIntegers != None:
+                self.nIntegers = nIntegers
+        else:
+            self.setArrays (*self.coerce (s))
+
+    @classmethod
+    def fromArrays (cls, lower, upper, nIntegers = None):
+        iset = cls.__new__ (cls)
+        IntervalSet.setArrays (iset, lower, upper, nIntegers)
+        return iset
+
+    def setArrays (self, lower, upper, nIntegers = None):
+        self.lower = numpy.asarray (lower, dtype = numpy.int64)
+        self.upper = numpy.asarray (upper, dtype = numpy.int64)
+        if nIntegers == None:
+            nIntegers = arraysSize (self.lower, self.upper)
+        self.nIntegers = nIntegers
+        self._intervals = None
+        self._cumsize = None
+
+    # The prefix sums of interval sizes: cumsize[k] is the number of
+    # integers in the intervals before interval k
+    @property
+    def cumsize (self):
+        if self._cumsize is None:
+            sizes = self.upper - self.lower + 1
+            self._cumsize = numpy.concatenate (([0], numpy.cumsum (sizes)))
+        return self._cumsize
+
+    # The list of (lower, upper) tuples is kept for compatibility and
+    # is only computed on demand
+    @property
+    def intervals (self):
+        if self._intervals is None:
+            self._intervals = list (zip (self.lower.tolist (),
+                                         self.upper.tolist ()))
+        return self._intervals
+
+    @intervals.setter
+    def intervals (self, intervals):
+        intervals = list (intervals)
+        if intervals:
+            (lower, upper) = zip (*intervals)
         else:
-            (self.intervals, self.nIntegers) = self.coerce (s)
+            (lower, upper) = ((), ())
+        self.setArrays (lower, upper)
+        self._intervals = intervals
+
+    def arrays (self):
+        return (self.lower, self.upper)
 
     def repr (self):
         return 'IntervalSet(%r)' % self.intervals
@@ -104,14 +216,32 @@ class IntervalSet (CSAObject):
         return self.nIntegers
 
     def __contains__ (self, n):
-        for i in self.intervals:
-            if n > i[1]:
-                continue
-            elif n >= i[0]:
-                return True
-            else:
-                return False
-        return False
+        k = numpy.searchsorted (self.upper, n)
+        return k < len (self.lower) and self.lower[k] <= n
+
+    # Batch membership test for an array of integers
+    def contains (self, indices):
+        indices = numpy.asarray (indices, dtype = numpy.int64)
+        k = numpy.searchsorted (self.upper, indices)
+        res = k < len (self.lower)
+        res[res] = self.lower[k[res]] <= indices[res]
+        return res
+
+    # The number of members smaller than n (n may be an array)
+    def rank (self, n):
+        k = numpy.searchsorted (self.upper, n)
+        inside = numpy.minimum (k, len (self.lower) - 1)
+        partial = numpy.where (k < len (self.lower),
+                               numpy.maximum (n - self.lower[inside], 0),
+                               0) if len (self.lower) else 0
+        r = self.cumsize[k] + partial
+        return int (r) if numpy.ndim (r) == 0 else r
+
+    # The k:th smallest member, counting from 0 (k may be an array)
+    def select (self, k):
+        m = numpy.searchsorted (self.cumsize, k, 'right') - 1
+        e = self.lower[m] + (k - self.cumsize[m])
+        return int (e) if numpy.ndim (e) == 0 else e
 
     def __iter__ (self):
         for i in self.intervals:
@@ -119,8 +249,8 @@ class IntervalSet (CSAObject):
                 yield e
 
     def __invert__ (self):
-        return ComplementaryIntervalSet (intervals = self.intervals, \
-                                         nIntegers = self.nIntegers)
+        return ComplementaryIntervalSet.fromArrays (self.lower, self.upper,
+                                                    self.nIntegers)
 
     def __add__ (self, other):
         if not isinstance (other, IntervalSet):
@@ -153,51 +283,41 @@ class IntervalSet (CSAObject):
         if not self or N == 0:
             return self
 
-        intervals = []
-        nIntegers = self.nIntegers
-        for (i, j) in self.intervals:
-            i += N
-            j += N
-            if i >= 0:
-                intervals.append ((i, j))
-            elif j >= 0:
-                intervals.append ((0, j))
-                nIntegers += i
-                
-        return IntervalSet (intervals = intervals, nIntegers = nIntegers)
+        return IntervalSet.fromArrays (*shiftArrays (self.lower, self.upper, N))
+
+    # Return the intervals of the members of the set as arrays
+    # (differs from self.arrays () for complementary sets)
+    def memberArrays (self):
+        return (self.lower, self.upper)
 
     def intervalIterator (self):
         return iter (self.intervals)
 
+    # Return the members in [low, high) as an array
+    def members (self, low, high):
+        if high <= low:
+            return _noIntervals
+        window = IntervalSet.fromArrays ([low], [high - 1])
+        return expandArrays (*self.intersection (window).memberArrays ())
+
     def boundedIterator (self, low, high):
-        iterator = iter (self.intervals)
-        i = next (iterator)
-        while i[1] < low:
-            i = next (iterator)
-        while i[0] < high:
-            for e in range (max (low, i[0]), min (i[1] + 1, high)):
+        first = int (numpy.searchsorted (self.upper, low))
+        last = int (numpy.searchsorted (self.lower, high))
+        for k in range (first, last):
+            for e in range (max (low, int (self.lower[k])),
+                            min (int (self.upper[k]) + 1, high)):
                 yield e
-            i = next (iterator)
 
     def count (self, low, high):
-        iterator = iter (self.intervals)
-        c = 0
-        try:
-            i = next (iterator)
-            while i[1] < low:
-                i = next (iterator)
-            while i[0] < high:
-                c += min (i[1] + 1, high) - max (low, i[0])
-                i = next (iterator)
-        except StopIteration:
-            pass
-        return c
+        if high <= low:
+            return 0
+        return self.rank (high) - self.rank (low)
 
     def min (self):
-        return self.intervals[0][0]
+        return int (self.lower[0])
 
     def max (self):
-        return self.intervals[-1][1]
+        return int (self.upper[-1])
 
     def skipIntervals (self):
         if len (self.intervals) <= 1 or self.intervals[0][0] != self.intervals[0][1]:
@@ -218,107 +338,20 @@ class IntervalSet (CSAObject):
         return skip, res
 
     def intersection (self, other):
-        res = []
-        N = 0
-        iter0 = self.intervalIterator ()
-        iter1 = other.intervalIterator ()
-        try:
-            i0 = next (iter0)
-            i1 = next (iter1)
-            while True:
-                if i0[1] <= i1[1]:
-                    if i0[1] >= i1[0]:
-                        lower = max (i0[0], i1[0])
-                        res.append ((lower, i0[1]))
-                        N += 1 + i0[1] - lower
-                    i0 = next (iter0)
-                else:
-                    if i1[1] >= i0[0]:
-                        lower = max (i0[0], i1[0])
-                        res.append ((lower, i1[1]))
-                        N += 1 + i1[1] - lower
-                    i1 = next (iter1)
-        except StopIteration:
-            pass
-        iset = IntervalSet ()
-        iset.intervals = res
-        iset.nIntegers = N
-        return iset
+        if isinstance (other, StridedIntervalSet):
+            return other.intersection (self)
+        (lower0, upper0) = self.memberArrays ()
+        (lower1, upper1) = other.memberArrays ()
+        (lower, upper) = intersectArrays (lower0, upper0, lower1, upper1)
+        return IntervalSet.fromArrays (lower, upper)
 
     def union (self, other):
         if isinstance (other, ComplementaryIntervalSet):
             return ~(~self).intersection (~other)
         
-        iset = IntervalSet ()
-        if not other.nIntegers:
-            iset.intervals = list (self.intervals)
-            iset.nIntegers = self.nIntegers
-            return iset
-        if not self.nIntegers:
-            iset.intervals = list (other.intervals)
-            iset.nIntegers = other.nIntegers
-            return iset
-        res = []
-        N = 0
-        iter0 = self.intervalIterator ()
-        iter1 = other.intervalIterator ()
-        i0 = next (iter0)
-        i1 = next (iter1)
-        if i0[0] <= i1[0]:
-            (lower, upper) = i0
-        else:
-            (lower, upper) = i1
-        try:
-            while True:
-                if i0[0] <= i1[0]:
-                    if i0[0] <= upper + 1:
-                        if i0[1] > upper:
-                            upper = i0[1]
-                    else:
-                        res.append ((lower, upper))
-                        N += 1 + upper - lower
-                        (lower, upper) = i0
-                    try:
-                        i0 = next (iter0)
-                    except StopIteration:
-                        if i1[0] <= upper + 1:
-                            if i1[1] > upper:
-                                upper = i1[1]
-                            i1 = (lower, upper)
-                        else:
-                            res.append ((lower, upper))
-                            N += 1 + upper - lower
-                        while True:
-                            res.append (i1)
-                            N += 1 + i1[1] - i1[0]
-                            i1 = next (iter1)
-                else:
-                    if i1[0] <= upper + 1:
-                        if i1[1] > upper:
-                            upper = i1[1]
-                    else:
-                        res.append ((lower, upper))
-                        N += 1 + upper - lower
-                        (lower, upper) = i1
-                    try:
-                        i1 = next (iter1)
-                    except StopIteration:
-                        if i0[0] <= upper + 1:
-                            if i0[1] > upper:
-                                upper = i0[1]
-                            i0 = (lower, upper)
-                        else:
-                            res.append ((lower, upper))
-                            N += 1 + upper - lower
-                        while True:
-                            res.append (i0)
-                            N += 1 + i0[1] - i0[0]
-                            i0 = next (iter0)
-        except StopIteration:
-            pass
-        iset.intervals = res
-        iset.nIntegers = N
-        return iset
+        (lower1, upper1) = other.memberArrays ()
+        return IntervalSet.fromArrays (*unionArrays (self.lower, self.upper,
+                                                     lower1, upper1))
 
     def _to_xml (self):
         intervals = [ E ('interval', E ('cn', str (i)), E ('cn', str (j)))
@@ -353,65 +386,50 @@ class ComplementaryIntervalSet (IntervalSet):
     #     raise RuntimeError ('ComplementaryIntervalSet has infinite length')
  
     def __contains__ (self, n):
-        for i in self.intervals:
-            if n < i[0]:
-                continue
-            elif n <= i[1]:
-                return False
-            else:
-                return True
-        return True
+        return not IntervalSet.__contains__ (self, n)
+
+    def contains (self, indices):
+        return ~IntervalSet.contains (self, indices)
+
+    def rank (self, n):
+        return n - IntervalSet.rank (self, n)
+
+    def select (self, k):
+        # the number of members below each excluded interval
+        before = self.lower - self.cumsize[:-1]
+        m = numpy.searchsorted (before, k, 'right')
+        e = k + self.cumsize[m]
+        return int (e) if numpy.ndim (e) == 0 else e
 
     def __iter__ (self):
         raise RuntimeError ("can't interate over ComplementaryIntervalSet")
 
     def __invert__ (self):
-        return IntervalSet (intervals = self.intervals, \
-                            nIntegers = self.nIntegers)
+        return IntervalSet.fromArrays (self.lower, self.upper, self.nIntegers)
 
     def finite (self):
         return False
 
     def shift (self, N):
-        iset = IntervalSet (intervals = self.intervals, \
-                            nIntegers = self.nIntegers).shift (N)
-        return ComplementaryIntervalSet (intervals = iset.intervals, \
-                                         nIntegers = iset.nIntegers)
+        iset = (~self).shift (N)
+        return ComplementaryIntervalSet.fromArrays (iset.lower, iset.upper,
+                                                    iset.nIntegers)
+
+    def memberArrays (self):
+        return complementArrays (self.lower, self.upper)
 
     def intervalIterator (self):
-        start = 0
-        for i in self.intervals:
-            if i[0] > 0:
-                yield (start, i[0] - 1)
-            start = i[1] + 1
-        yield (start, infinity)
+        (lower, upper) = self.memberArrays ()
+        return zip (lower.tolist (), upper.tolist ())
 
     def boundedIterator (self, low, high):
         raise RuntimeError ("can't interate over ComplementaryIntervalSet")
 
-    def count (self, low, high):
-        iterator = iter (self.intervals)
-        c = 0
-        prev = low
-        try:
-            i = next (iterator)
-            while i[1] < low:
-                i = next (iterator)
-            while i[0] < high:
-                c += i[0] - prev
-                prev = i[1] + 1
-                i = next (iterator)
-        except StopIteration:
-            pass
-        if prev < high:
-            c += high - prev
-        return c
-
     def min (self):
-        if not self.intervals or self.intervals[0][0] > 0:
+        if not len (self.lower) or self.lower[0] > 0:
             return 0
         else:
-            return self.intervals[0][1] + 1
+            return int (self.upper[0]) + 1
 
     def max (self):
         raise RuntimeError ('the maximum of a ComplementaryIntervalSet is infinity')
@@ -435,3 +453,229 @@ class ComplementaryIntervalSet (IntervalSet):
 N = ComplementaryIntervalSet ([])
 
 CSAObject.tag_map[CSA + 'N'] = (N, SINGLETON)
+
+
+def _egcd (a, b):
+    # return (g, p, q) such that p * a + q * b = g = gcd (a, b)
+    (p0, q0, p1, q1) = (1, 0, 0, 1)
+    while b:
+        (k, r) = divmod (a, b)
+        (a, b) = (b, r)
+        (p0, q0, p1, q1) = (p1, q1, p0 - k * p1, q0 - k * q1)
+    return (a, p0, q0)
+
+
+# Strided interval sets are represented as ordered sequences of closed
+# strided intervals (start, stop, step) with members start, start + step,
+# ..., stop.  The ranges [start, stop] of different strided intervals do
+# not overlap.  The typical use is the round-robin distribution of
+# neurons over the processes of a parallel simulator, where a process
+# owns r, r + P, r + 2P, ...  and the set has constant size.
+#
+class StridedIntervalSet (IntervalSet):
+    def __init__ (self, s = []):
+        if isinstance (s, tuple):
+            s = [ s ]
+        triples = []
+        for x in s:
+            if len (x) == 2:
+                x = x + (1,)
+            (start, stop, step) = x
+            assert step >= 1, 'step must be positive'
+            assert start >= 0, 'only positive values allowed'
+            if start <= stop:
+                triples.append ((start, start + (stop - start) // step * step,
+                                 step))
+        triples.sort ()
+        if triples:
+            a = numpy.array (triples, dtype = numpy.int64)
+        else:
+            a = numpy.empty ((0, 3), dtype = numpy.int64)
+        self.setTriples (a[:,0], a[:,1], a[:,2])
+
+    @classmethod
+    def fromTriples (cls, start, stop, step):
+        iset = cls.__new__ (cls)
+        iset.setTriples (start, stop, step)
+        return iset
+
+    def setTriples (self, start, stop, step):
+        self.start = numpy.asarray (start, dtype = numpy.int64)
+        self.stop = numpy.asarray (stop, dtype = numpy.int64)
+        self.step = numpy.asarray (step, dtype = numpy.int64)
+        assert numpy.all (self.start[1:] > self.stop[:-1]), \
+               'strided intervals overlap'
+        self.sizes = (self.stop - self.start) // self.step + 1
+        self.nIntegers = int (self.sizes.sum ())
+        self._cumsize = numpy.concatenate (([0], numpy.cumsum (self.sizes)))
+        self._intervals = None
+        self._arrays = None
+
+    @property
+    def triples (self):
+        return list (zip (self.start.tolist (), self.stop.tolist (),
+                          self.step.tolist ()))
+
+    @property
+    def cumsize (self):
+        return self._cumsize
+
+    # The ordinary interval representation is only computed on demand
+    # since it has one interval per member for step > 1
+    def memberArrays (self):
+        if self._arrays is None:
+            unit = self.step == 1
+            members = numpy.repeat (~unit, self.sizes)
+            k = numpy.repeat (numpy.arange (len (self.start)), self.sizes)
+            e = self.start[k] \
+                + (numpy.arange (self.nIntegers) - self._cumsize[k]) \
+                * self.step[k]
+            lower = numpy.concatenate ((e[members], self.start[unit]))
+            upper = numpy.concatenate ((e[members], self.stop[unit]))
+            order = numpy.argsort (lower)
+            self._arrays = (lower[order], upper[order])
+        return self._arrays
+
+    @property
+    def lower (self):
+        return self.memberArrays ()[0]
+
+    @property
+    def upper (self):
+        return self.memberArrays ()[1]
+
+    def arrays (self):
+        return self.memberArrays ()
+
+    def repr (self):
+        return 'StridedIntervalSet(%r)' % self.triples
+
+    def __contains__ (self, n):
+        k = numpy.searchsorted (self.stop, n)
+        return k < len (self.start) and self.start[k] <= n \
+               and (n - self.start[k]) % self.step[k] == 0
+
+    def contains (self, indices):
+        indices = numpy.asarray (indices, dtype = numpy.int64)
+        k = numpy.searchsorted (self.stop, indices)
+        res = k < len (self.start)
+        kk = k[res]
+        d = indices[res] - self.start[kk]
+        res[res] = (d >= 0) & (d % self.step[kk] == 0)
+        return res
+
+    def rank (self, n):
+        k = numpy.searchsorted (self.stop, n)
+        inside = numpy.minimum (k, len (self.start) - 1)
+        if len (self.start):
+            d = numpy.maximum (n - self.start[inside], 0)
+            partial = numpy.where (k < len (self.start),
+                                   (d + self.step[inside] - 1)
+                                   // self.step[inside],
+                                   0)
+        else:
+            partial = 0
+        r = self._cumsize[k] + partial
+        return int (r) if numpy.ndim (r) == 0 else r
+
+    def select (self, k):
+        m = numpy.searchsorted (self._cumsize, k, 'right') - 1
+        e = self.start[m] + (k - self._cumsize[m]) * self.step[m]
+        return int (e) if numpy.ndim (e) == 0 else e
+
+    def __iter__ (self):
+        for (start, stop, step) in self.triples:
+            for e in range (start, stop + 1, step):
+                yield e
+
+    def __invert__ (self):
+        (lower, upper) = self.memberArrays ()
+        return ComplementaryIntervalSet.fromArrays (lower, upper)
+
+    def shift (self, N):
+        if not self or N == 0:
+            return self
+        start = self.start + N
+        stop = self.stop + N
+        keep = stop >= 0
+        (start, stop, step) = (start[keep], stop[keep], self.step[keep])
+        # first member >= 0
+        start = numpy.where (start < 0, start % step, start)
+        keep = start <= stop
+        return StridedIntervalSet.fromTriples (start[keep], stop[keep],
+                                               step[keep])
+
+    def intervalIterator (self):
+        for (start, stop, step) in self.triples:
+            if step == 1:
+                yield (start, stop)
+            else:
+                for e in range (start, stop + 1, step):
+                    yield (e, e)
+
+    def boundedIterator (self, low, high):
+        first = int (numpy.searchsorted (self.stop, low))
+        last = int (numpy.searchsorted (self.start, high))
+        for (start, stop, step) in self.triples[first:last]:
+            if start < low:
+                start += (low - start + step - 1) // step * step
+            for e in range (start, min (stop + 1, high), step):
+                yield e
+
+    def min (self):
+        return int (self.start[0])
+
+    def max (self):
+        return int (self.stop[-1])
+
+    def skipIntervals (self):
+        if len (self.start) and numpy.all (self.step == self.step[0]):
+            return (int (self.step[0]),
+                    list (zip (self.start.tolist (), self.stop.tolist ())))
+        return IntervalSet.skipIntervals (self)
+
+    def intersection (self, other):
+        if isinstance (other, StridedIntervalSet):
+            return self.stridedIntersection (other)
+        (lower, upper) = other.memberArrays ()
+        (k, m) = overlappingPairs (self.start, self.stop, lower, upper)
+        (start, stop, step) = (self.start[k], self.stop[k], self.step[k])
+        low = numpy.maximum (start, lower[m])
+        high = numpy.minimum (stop, upper[m])
+        first = start + (low - start + step - 1) // step * step
+        last = start + (high - start) // step * step
+        keep = first <= last
+        return StridedIntervalSet.fromTriples (first[keep], last[keep],
+                                               step[keep])
+
+    def stridedIntersection (self, other):
+        (k, m) = overlappingPairs (self.start, self.stop,
+                                   other.start, other.stop)
+        triples = []
+        for (k, m) in zip (k.tolist (), m.tolist ()):
+            (a1, m1) = (int (self.start[k]), int (self.step[k]))
+            (a2, m2) = (int (other.start[m]), int (other.step[m]))
+            low = max (a1, a2)
+            high = min (int (self.stop[k]), int (other.stop[m]))
+            # solve x = a1 (mod m1), x = a2 (mod m2)
+            (g, p, q) = _egcd (m1, m2)
+            if (a2 - a1) % g:
+                continue
+            step = m1 // g * m2
+            x = (a1 + (a2 - a1) // g * p * m1) % step
+            first = low + (x - low) % step
+            if first <= high:
+                triples.append ((first, high, step))
+        return StridedIntervalSet (triples)
+
+    def union (self, other):
+        if isinstance (other, StridedIntervalSet):
+            start = numpy.concatenate ((self.start, other.start))
+            stop = numpy.concatenate ((self.stop, other.stop))
+            order = numpy.argsort (start)
+            if numpy.all (start[order][1:] > stop[order][:-1]):
+                step = numpy.concatenate ((self.step, other.step))
+                return StridedIntervalSet.fromTriples (start[order],
+                                                       stop[order],
+                                                       step[order])
+        return IntervalSet.fromArrays (*self.memberArrays ()).union (other)
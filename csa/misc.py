@@ -17,6 +17,7 @@
 #
 
 from . import _misc
+from . import _sparse
 
 def disc (r):
     return _misc.Disc (r)
@@ -43,4 +44,14 @@ fix = _misc.Fix ()
 def block1 (N):
     return _misc.Block (N)
 
+# Compressed connection-sets and scipy.sparse conversion
+#
+compressed = _sparse.compressed
+
+def toSparse (c, k = 0, shape = None):
+    return _sparse.toSparse (c, k, shape)
+
+def fromSparse (matrix):
+    return _sparse.fromSparse (matrix)
+
 #del _misc                               # not for export
@@ -16,24 +16,48 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import numpy
+
 from .csaobject import *
 
+# Evaluate the value set or plain function v for the connections
+# (sources[k], targets[k]) and return the values as an array.
+# Objects which know how to do this themselves provide an evaluate
+# method or attribute, others are called once per connection.
+#
+def evaluate (v, sources, targets):
+    if hasattr (v, 'evaluate'):
+        return v.evaluate (sources, targets)
+    return scalarEvaluate (v, sources, targets)
+
+def scalarEvaluate (v, sources, targets):
+    values = [ v (i, j) for (i, j) in zip (sources.tolist (),
+                                           targets.tolist ()) ]
+    if not values:
+        return numpy.empty (0)
+    return numpy.array (values)
+
 class ValueSet (CSAObject):
     def __init__ (self):
         CSAObject.__init__ (self, "valueset")
+
+    def evaluate (self, sources, targets):
+        # default action:
+        return scalarEvaluate (self, sources, targets)
         
     def __neg__ (self):
-        return GenericValueSet (lambda i, j: - self (i, j))
+        return GenericValueSet (lambda i, j: - self (i, j),
+                                lambda s, t: - evaluate (self, s, t))
     
     def __add__ (self, other):
         if not callable (other):
             return maybeAffine (other, 1.0, self)
         elif isinstance (other, (QuotedValueSet, AffineValueSet)):
             return other.__add__ (self)
-        elif isinstance (other, GenericValueSet):
-            return GenericValueSet (lambda i, j: self (i, j) + other.function (i, j))
         else:
-            return GenericValueSet (lambda i, j: self (i, j) + other (i, j))
+            return GenericValueSet (lambda i, j: self (i, j) + other (i, j),
+                                    lambda s, t: evaluate (self, s, t)
+                                                 + evaluate (other, s, t))
 
     def __radd__ (self, other):
         return self.__add__ (other)
@@ -49,10 +73,10 @@ class ValueSet (CSAObject):
             return maybeAffine (0.0, other, self)
         elif isinstance (other, (QuotedValueSet, AffineValueSet)):
             return other.__mul__ (self)
-        elif isinstance (other, GenericValueSet):
-            return GenericValueSet (lambda i, j: self (i, j) * other.function (i, j))
         else:
-            return GenericValueSet (lambda i, j: self (i, j) * other (i, j))
+            return GenericValueSet (lambda i, j: self (i, j) * other (i, j),
+                                    lambda s, t: evaluate (self, s, t)
+                                                 * evaluate (other, s, t))
 
     def __rmul__ (self, other):
         return self.__mul__ (other)
@@ -66,6 +90,9 @@ class QuotedValueSet (ValueSet):
     def __call__ (self, i, j):
         return self.expression
 
+    def evaluate (self, sources, targets):
+        return numpy.full (len (sources), self.expression)
+
     def __neg__ (self):
         return QuotedValueSet (- self.expression)
     
@@ -91,35 +118,44 @@ class QuotedValueSet (ValueSet):
 
 
 class GenericValueSet (ValueSet):
-    def __init__ (self, function):
+    def __init__ (self, function, evaluator = None):
         ValueSet.__init__ (self)
         self.function = function
+        # evaluator, if given, computes function over arrays of
+        # sources and targets
+        self.evaluator = evaluator
 
     def __call__ (self, i, j):
         return self.function (i, j)
 
+    def evaluate (self, sources, targets):
+        if self.evaluator != None:
+            return self.evaluator (sources, targets)
+        return evaluate (self.function, sources, targets)
+
     def __neg__ (self):
-        return GenericValueSet (lambda i, j: - self.function (i, j))
+        return GenericValueSet (lambda i, j: - self.function (i, j),
+                                lambda s, t: - self.evaluate (s, t))
 
     def __add__ (self, other):
         if not callable (other):
-            return maybeAffine (other, 1.0, self.function)
+            return maybeAffine (other, 1.0, self)
         elif isinstance (other, (QuotedValueSet, AffineValueSet)):
             return other.__add__ (self)
-        elif isinstance (other, GenericValueSet):
-            return GenericValueSet (lambda i, j: self.function (i, j) + other.function (i, j))
         else:
-            return GenericValueSet (lambda i, j: self.function (i, j) + other (i, j))
+            return GenericValueSet (lambda i, j: self.function (i, j) + other (i, j),
+                                    lambda s, t: self.evaluate (s, t)
+                                                 + evaluate (other, s, t))
 
     def __mul__ (self, other):
         if not callable (other):
-            return maybeAffine (0.0, other, self.function)
+            return maybeAffine (0.0, other, self)
         elif isinstance (other, (QuotedValueSet, AffineValueSet)):
             return other.__mul__ (self)
-        elif isinstance (other, GenericValueSet):
-            return GenericValueSet (lambda i, j: self.function (i, j) * other.function (i, j))
         else:
-            return GenericValueSet (lambda i, j: self.function (i, j) * other (i, j))
+            return GenericValueSet (lambda i, j: self.function (i, j) * other (i, j),
+                                    lambda s, t: self.evaluate (s, t)
+                                                 * evaluate (other, s, t))
 
 
 class AffineValueSet (ValueSet):
@@ -132,6 +168,9 @@ class AffineValueSet (ValueSet):
     def __call__ (self, i, j):
         return self.const + self.coeff * self.func (i, j)
 
+    def evaluate (self, sources, targets):
+        return self.const + self.coeff * evaluate (self.func, sources, targets)
+
     def __neg__ (self):
         return maybeAffine (- self.const, - self.coeff, self.func)
     
@@ -143,11 +182,19 @@ class AffineValueSet (ValueSet):
                                 self.coeff, self.func)
         elif isinstance (other, AffineValueSet):
             f = lambda i, j: \
-                    self.const * self.func (i, j) \
-                    + other.const * other.func (i, j)
+                    self.coeff * self.func (i, j) \
+                    + other.coeff * other.func (i, j)
+            f = GenericValueSet (f,
+                                 lambda s, t: \
+                                     self.coeff * evaluate (self.func, s, t)
+                                     + other.coeff * evaluate (other.func, s, t))
             return maybeAffine (self.const + other.const,
                                 1.0,
                                 f)
+        else:
+            return GenericValueSet (lambda i, j: self (i, j) + other (i, j),
+                                    lambda s, t: self.evaluate (s, t)
+                                                 + evaluate (other, s, t))
 
     def __mul__ (self, other):
         if not callable (other):
@@ -164,9 +211,19 @@ class AffineValueSet (ValueSet):
                     + self.const * other.coeff * other.func (i, j) \
                     + self.coeff * other.coeff \
                       * self.func (i, j) * other.func (i, j)
+            def g (s, t):
+                v0 = evaluate (self.func, s, t)
+                v1 = evaluate (other.func, s, t)
+                return other.const * self.coeff * v0 \
+                       + self.const * other.coeff * v1 \
+                       + self.coeff * other.coeff * v0 * v1
             return maybeAffine (self.const * other.const,
                                 1.0,
-                                f)
+                                GenericValueSet (f, g))
+        else:
+            return GenericValueSet (lambda i, j: self (i, j) * other (i, j),
+                                    lambda s, t: self.evaluate (s, t)
+                                                 * evaluate (other, s, t))
 
 def maybeAffine (const, coeff, func):
     if coeff == 0.0:
@@ -20,6 +20,10 @@ import sys
 import numpy
 
 from csa import *
+from csa.intervalset import IntervalSet, StridedIntervalSet
+from csa._sparse import HAVE_SCIPY
+from csa.connset import ExplicitMask
+from csa import connset
 
 import unittest
 
@@ -124,6 +128,174 @@ class TestElementary (TestCSA):
             self.assertTrue (g < 0.0)
 
 
+    def test_randomMask (self):
+        c = cross ((0, 999), (0, 999)) * random (0.01)
+        ls = [x for x in c]
+        self.assertEqual (ls, [x for x in c], 'random mask not reproducible')
+        self.assertTrue (9500 < len (ls) < 10500,
+                         'maybe wrong statistics %d != 10000' % len (ls))
+        self.assertEqual (ls, sorted (ls, key = lambda x: (x[1], x[0])),
+                          'random mask connections out of order')
+        c = cross ((0, 999), (0, 999)) * (random * vset (0.01))
+        n = len (c)
+        self.assertTrue (9500 < n < 10500,
+                         'maybe wrong statistics %d != 10000' % n)
+        n = len (cross ((0, 10 ** 9), (0, 10 ** 9)) * random (1e-14))
+        self.assertTrue (9500 < n < 10500,
+                         'maybe wrong statistics %d != 10000' % n)
+        c = cross ((0, 19999), (0, 9999)) * random (1e-5)
+        ps = [cross ((0, 19999), (k * 1000, k * 1000 + 999))
+              for k in range (10)]
+        self.assertEqual ([x for k in range (10) for x in partition (c, ps, k)],
+                          list (c), 'sparse random mask partitioned')
+
+    def test_philox (self):
+        from csa._philox import philox4x32
+        self.assertEqual ([int (x) for x in philox4x32 ((0, 0, 0, 0), (0, 0))],
+                          [0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8],
+                          'philox4x32 known answer')
+
+    def test_randomPartitions (self):
+        R = (0, 59)
+        for m in [random (0.1) * cross (R, R),
+                  random (N = 300) * cross (R, R),
+                  random (fanIn = 4) * cross (R, R)]:
+            ls = sorted ([x for x in m])
+            for K in (2, 3):
+                edges = [60 * k // K for k in range (K + 1)]
+                for ps in ([cross ((edges[k], edges[k + 1] - 1), R)
+                            for k in range (K)],
+                           [cross (R, (edges[k], edges[k + 1] - 1))
+                            for k in range (K)]):
+                    parts = []
+                    for k in range (K):
+                        parts.extend (partition (m, ps, k))
+                    self.assertEqual (sorted (parts), ls,
+                                      'partitioning changed %s' % m)
+
+    def test_balancedPartitions (self):
+        R = (0, 199)
+        m = cross (R, R) * random (0.02, seed = 1) + cross (R, (150, 199)) * full
+        ps = balancedPartitions (m, 4)
+        self.assertEqual (len (ps), 4, 'number of partitions')
+        sizes = [len (partition (m, ps, k)) for k in range (4)]
+        self.assertEqual (sum (sizes), len (m), 'partitioning changed')
+        self.assertTrue (max (sizes) < 1.2 * min (sizes), 'balance')
+        # dense targets narrower than a sampled segment; the work is
+        # estimated from samples, so the bound is looser
+        m = cross ((0, 99), (0, 99999)) * random (0.001, seed = 1) \
+            + cross ((0, 99), (0, 99)) * random (0.3, seed = 2)
+        ps = balancedPartitions (m, 4)
+        sizes = [len (partition (m, ps, k)) for k in range (4)]
+        self.assertTrue (max (sizes) < 1.5 * min (sizes), 'dense balance')
+        ps = balancedPartitions (cross ((0, 1), (0, 1)) * full, 4)
+        self.assertEqual (sorted ([len (p) for p in ps]), [0, 0, 2, 2],
+                          'more partitions than targets')
+
+    def test_count (self):
+        N = 10 ** 6
+        self.assertEqual (len (cross ((0, N - 1), (0, N - 1)) * oneToOne), N)
+        self.assertEqual (len (random (N = 1000) * full (100)), 1000)
+        for m in [cross ((3, 40), (0, 37)) * (oneToOne + full),
+                  cross ((0, 40), (0, 40))
+                  * (block (3, 2) * (oneToOne * cross ((1, 10), (0, 12)))),
+                  cross ((5, 30), (4, 20)) * (block (4, 3) * oneToOne),
+                  cross ((0, 30), (0, 30))
+                  * (transpose * (cross ((0, 9), (3, 20)) * (full - oneToOne))),
+                  cross ((0, 30), (0, 30))
+                  * (shift (-4, 7) * (cross ((0, 9), (0, 9)) * oneToOne)),
+                  cross ((0, 59), (0, 59)) * random (0.2),
+                  cross ((10, 49), (0, 59)) * (random (fanIn = 3)
+                                               * full (60))]:
+            self.assertEqual (len (m), len (list (m)), 'count')
+
+    def test_degrees (self):
+        N = 10 ** 6
+        self.assertEqual (list (inDegrees (cross ((0, N - 1), (0, N - 1))
+                                           * oneToOne, [0, 5, N])),
+                          [1, 1, 0])
+        self.assertTrue (numpy.all (inDegrees (random (fanIn = 7) * full (100))
+                                    == 7))
+        self.assertTrue (numpy.all (outDegrees (random (fanOut = 3)
+                                                * full (50, 20)) == 3))
+        for m in [cross ((3, 40), (0, 37)) * (oneToOne + full),
+                  cross ((0, 40), (0, 40))
+                  * (block (3, 2) * (oneToOne * cross ((1, 10), (0, 12)))),
+                  cross ((0, 59), (0, 59)) * random (0.2)]:
+            ls = list (m)
+            for (degrees, k) in [(inDegrees, 1), (outDegrees, 0)]:
+                expected = [0] * 60
+                for c in ls:
+                    expected[c[k]] += 1
+                self.assertEqual (list (degrees (m, range (60))), expected,
+                                  'degrees')
+
+    def test_explicit (self):
+        ls = [(3, 2), (1, 2), (0, 5), (1, 2), (7, 0)]
+        self.assertEqualCS (ls * full, [(7, 0), (1, 2), (1, 2), (3, 2), (0, 5)],
+                            'explicit mask order')
+        sources = numpy.array ([c[0] for c in ls])
+        targets = numpy.array ([c[1] for c in ls])
+        for m in [ExplicitMask ((sources, targets)),
+                  ExplicitMask (numpy.array (ls))]:
+            self.assertEqual (list (m), list (ExplicitMask (ls)), 'array input')
+        self.assertEqualCS (cross ((1, 5), (1, 9)) * ExplicitMask (ls),
+                            [(1, 2), (1, 2), (3, 2)], 'bounded iteration')
+
+    def test_disc (self):
+        g = random2d (200)
+        for (r, d) in [(0.1, euclidMetric2d (g)),
+                       (0.3, euclidToroidMetric2d (g)),
+                       (0.02, euclidToroidMetric2d (g)),
+                       (1e-5, euclidToroidMetric2d (g))]:
+            self.assertEqualCS (cross ((0, 149), (50, 199)) * (disc (r) * d),
+                                [(i, j) for j in range (50, 200)
+                                 for i in range (0, 150) if d (i, j) < r],
+                                'disc mask')
+        m = cross ((0, 149), (50, 199)) * (disc (0.1) * euclidMetric2d (g))
+        list (m)
+        self.assertEqual (m._mask.subMask.cellList, None,
+                          'cell list kept by the started mask')
+        self.assertEqualCS (cross ((0, 149), (50, 199))
+                            * (rectangle (0.2, 0.1) * g),
+                            [(i, j) for j in range (50, 200)
+                             for i in range (0, 150)
+                             if abs (g (i)[0] - g (j)[0]) < 0.1
+                             and abs (g (i)[1] - g (j)[1]) < 0.05],
+                            'rectangle mask')
+
+    def test_geometry (self):
+        for g in [grid2d (10), random2d (100), grid3d (4), random3d (64)]:
+            indices = numpy.array ([3, 17, 42, 3])
+            self.assertTrue (numpy.allclose (g.positions[indices],
+                                             [g (i) for i in indices]),
+                             'geometry positions')
+            d = euclidMetric3d (g) if len (g (0)) == 3 else euclidMetric2d (g)
+            targets = numpy.array ([5, 5, 60, 0])
+            self.assertTrue (numpy.allclose (d (indices, targets),
+                                             [d (i, j) for (i, j)
+                                              in zip (indices, targets)]),
+                             'batch metric')
+        g = random2d (100)
+        self.assertEqual (g.inverse (*g (42)), 42, 'random2d inverse')
+
+    def test_inverse (self):
+        g = random2d (1000)
+        (x, y) = (numpy.random.random (50), numpy.random.random (50))
+        domain = ival (100, 199) + ival (500, 549)
+        members = numpy.array (list (domain))
+        d = euclidMetric2d (g)
+        nearest = [members[numpy.argmin ([euclidDistance2d ((x[k], y[k]), g (i))
+                                          for i in members])]
+                   for k in range (50)]
+        self.assertEqual (list (g.inverse (x, y, domain)), nearest,
+                          'batch inverse')
+        self.assertEqual (list (g.within (g.positions[7], 0.05)),
+                          [i for i in range (1000) if d (7, i) <= 0.05],
+                          'radius query')
+        g = random3d (1000)
+        self.assertEqual (g.inverse (*g (123)), 123, 'random3d inverse')
+
     def partitionRandomN (self):
         K = self.K
         N = 3 * K
@@ -189,6 +361,21 @@ class TestElementary (TestCSA):
         for x in res.flatten ():
             self.assertAlmostEqual (x, 1.0, 0, 'maybe wrong statistics %g != 1.' % x)
 
+    def test_fanInSources (self):
+        R = (0, 49)
+        m = random (fanIn = 4) * cross ([(0, 9), (30, 39)], R)
+        ls = list (m)
+        self.assertEqual (ls, sorted (ls, key = lambda c: (c[1], c[0])),
+                          'target-major order')
+        self.assertTrue (all ([i < 10 or 30 <= i < 40 for (i, j) in ls]),
+                         'sources outside of source set')
+        self.assertEqual (inDegrees (m).tolist (), [4] * 50, 'fan-in')
+        self.assertEqual (list (random (N = 5) * cross ([], [])), [],
+                          'no targets')
+        self.assertEqual (list (cross ((5, 35), R) * m),
+                          [(i, j) for (i, j) in ls if 5 <= i <= 35],
+                          'bounded sources')
+
 class TestOperators (TestCSA):
     def test_difference (self):
         # Test difference
@@ -196,6 +383,306 @@ class TestOperators (TestCSA):
                             [(i, j) for j in range (0,4) for i in range (0,4) if i != j],
                             'difference operator')
 
+    def test_join (self):
+        R = (0, 99)
+        m1 = cross (R, R) * random (0.3)
+        m2 = cross (R, R) * random (0.5)
+        ls1 = list (m1)
+        ls2 = set (m2)
+        self.assertEqual (list (m1 * m2), [c for c in ls1 if c in ls2],
+                          'intersection')
+        self.assertEqual (list (cross (R, R) * (m1 - m2)),
+                          [c for c in ls1 if c not in ls2],
+                          'difference')
+        c = cset (m1, vset (lambda i, j: i + 0.5 * j))
+        self.assertEqual (list (c * m2),
+                          [(i, j, i + 0.5 * j) for (i, j) in ls1
+                           if (i, j) in ls2],
+                          'connection-set intersection')
+
+    def test_multisetSum (self):
+        R = (0, 49)
+        ms = [cross (R, R) * random (0.05) for k in range (12)]
+        m = ms[0]
+        for x in ms[1:]:
+            m = m + x
+        self.assertEqual (len (m.operands), 12, 'flattened sum')
+        expected = sorted ([c for x in ms for c in x],
+                           key = lambda c: (c[1], c[0]))
+        self.assertEqual (list (m), expected, 'k-way merge')
+        self.assertEqual ([c for (s, t) in m.blocks (37)
+                           for c in zip (s.tolist (), t.tolist ())],
+                          expected, 'k-way block merge')
+        c = cset (ms[0], 1.0) + cset (ms[1], 2.0) + cset (ms[2], 3.0)
+        self.assertEqual (list (c),
+                          sorted ([(i, j, float (k + 1))
+                                   for k in range (3) for (i, j) in ms[k]],
+                                  key = lambda c: (c[1], c[0], c[2])),
+                          'connection-set sum')
+
+    def test_optimize (self):
+        R = (0, 99)
+        g = random2d (100)
+        d = disc (0.3) * euclidMetric2d (g)
+        r = random (0.05)
+        m = cross (R, R) * d * r
+        plan = m.optimize ()
+        self.assertEqual ([role for (role, x) in plan.subMask.planChildren ()],
+                          ['driver', 'filter'], 'random mask drives, disc filters')
+        self.assertEqual (list (m), [c for c in cross (R, R) * r
+                                     if c in set (cross (R, R) * d)],
+                          'filtered intersection')
+        self.assertEqual (list (cross (R, R) * (ExplicitMask ([(3, 3)] * 3)
+                                                 * oneToOne)),
+                          [(3, 3)], 'multiset intersection with a set')
+        self.assertEqual (list (cross ((0, 49), R) * (cross (R, (10, 19)) * r)),
+                          [(i, j) for (i, j) in cross (R, R) * r
+                           if i < 50 and 10 <= j < 20],
+                          'merged crosses')
+        s = shift (2, 3) * (shift (1, 1) * (cross (R, R) * r))
+        self.assertEqual (s.optimize ().M, 3, 'folded shifts')
+        self.assertEqual (list (s), [(i + 3, j + 4) for (i, j) in cross (R, R) * r],
+                          'folded shifts')
+        t = transpose * (transpose * (cross (R, R) * r))
+        self.assertFalse (isinstance (t.optimize (), connset.TransposedMask),
+                          'double transpose')
+
+    def test_partitionBounds (self):
+        R = (0, 99)
+        r = random (0.2)
+        ps = [cross (R, (0, 49)), cross (R, (50, 99))]
+        m = cross (R, (50, 99)) * r
+        self.assertTrue (partition (m, ps, 1).subMask is m, 'no intersection')
+        self.assertEqual (list (partition (m, ps, 0)), [], 'empty partition')
+        s = cross ((0, 49), (0, 49)) * r + cross ((50, 99), (50, 99)) * oneToOne
+        p = partition (s, ps, 1)
+        self.assertFalse (isinstance (p.subMask, connset.MaskMultisetSum),
+                          'operand outside of partition dropped')
+        self.assertEqual (list (p), [(i, i) for i in range (50, 100)],
+                          'partition of sum')
+        c = cset (m, 2.0)
+        self.assertTrue (partition (c, ps, 1).c.subCSet is c.c,
+                         'no intersection of connection-set')
+
+
+class TestIntervalSet (TestCSA):
+    def test_setOperations (self):
+        a = ival (0, 9) + ival (20, 29)
+        b = ival (5, 24)
+        self.assertEqual ((a * b).intervals, [(5, 9), (20, 24)],
+                          'interval set intersection')
+        self.assertEqual ((a + b).intervals, [(0, 29)],
+                          'interval set union')
+        self.assertEqual ((a - b).intervals, [(0, 4), (25, 29)],
+                          'interval set difference')
+        self.assertEqual (a.shift (-5).intervals, [(0, 4), (15, 24)],
+                          'interval set shift')
+        self.assertEqual ((~a * ival (0, 39)).intervals, [(10, 19), (30, 39)],
+                          'interval set complement')
+
+    def test_fragmented (self):
+        even = IntervalSet ([(i, i) for i in range (0, 1000, 2)])
+        odd = IntervalSet ([(i, i) for i in range (1, 1000, 2)])
+        self.assertEqual (len (even * odd), 0, 'disjoint fragmented sets')
+        self.assertEqual ((even + odd).intervals, [(0, 999)],
+                          'union of fragmented sets')
+
+    def test_rankSelect (self):
+        a = ival (0, 9) + ival (20, 29)
+        self.assertTrue (25 in a and 15 not in a, 'membership')
+        self.assertTrue (15 in ~a and 25 not in ~a, 'complement membership')
+        self.assertEqual (list (a.contains (numpy.array ([5, 15, 25]))),
+                          [True, False, True], 'batch membership')
+        self.assertEqual (a.count (5, 25), 10, 'count')
+        self.assertEqual ((~a).count (5, 25), 10, 'complement count')
+        self.assertEqual (a.rank (25), 15, 'rank')
+        self.assertEqual (a.select (15), 25, 'select')
+        self.assertEqual ((~a).select (5), 15, 'complement select')
+
+    def test_strided (self):
+        s = StridedIntervalSet ((3, 10**7, 4))
+        self.assertEqual (len (s), 2500000, 'strided set size')
+        self.assertTrue (7 in s and 8 not in s, 'strided membership')
+        self.assertEqual (s.count (0, 20), 5, 'strided count')
+        self.assertEqual (s.select (2), 11, 'strided select')
+        t = s * StridedIntervalSet ((1, 10**7, 6))
+        self.assertEqual (t.triples, [(7, 9999991, 12)],
+                          'intersection of strided sets')
+        self.assertEqual (list (s * ival (0, 20)), [3, 7, 11, 15, 19],
+                          'intersection with interval set')
+        self.assertEqualCS (cross (StridedIntervalSet ((0, 6, 3)), 1) * full,
+                            [(0, 1), (3, 1), (6, 1)],
+                            'strided interval set mask')
+
+
+class TestBlocks (TestCSA):
+    def assertBlocksEqual (self, c, blockSize, msg):
+        ls = []
+        for (sources, targets) in c.blocks (blockSize):
+            self.assertTrue (0 < len (sources) <= blockSize, msg)
+            ls.extend (zip (sources.tolist (), targets.tolist ()))
+        self.assertEqual (ls, [x for x in c], msg)
+
+    def test_blocks (self):
+        a = [(0, 3), (10, 14)]
+        b = [(2, 6), (9, 11)]
+        for blockSize in (1, 7, 1000):
+            self.assertBlocksEqual (cross (a, b), blockSize,
+                                    'interval set mask blocks')
+            self.assertBlocksEqual (cross (a, b) * (full - oneToOne),
+                                    blockSize, 'difference blocks')
+            self.assertBlocksEqual (cross (a, b) * (oneToOne + full),
+                                    blockSize, 'multiset sum blocks')
+            self.assertBlocksEqual (cross (a, b) * [(1, 2), (12, 10), (2, 9)],
+                                    blockSize, 'explicit mask blocks')
+
+    def test_transpose (self):
+        for m in [cross ((0, 79), (0, 59)) * random (0.3),
+                  random (fanIn = 5) * full (70, 40),
+                  ExplicitMask ([(1, 2), (1, 2), (5, 0), (3, 3)])]:
+            expected = sorted ([(j, i) for (i, j) in m],
+                               key = lambda c: (c[1], c[0]))
+            self.assertEqual (list (transpose * m), expected, 'transpose')
+            self.assertEqual (list (cross ((3, 30), (5, 40)) * (transpose * m)),
+                              [c for c in expected
+                               if 3 <= c[0] <= 30 and 5 <= c[1] <= 40],
+                              'bounded transpose')
+        self.assertTrue (numpy.all (outDegrees (random (fanOut = 4)
+                                                * full (50, 60)) == 4))
+
+    def test_transposeWindows (self):
+        # the source windows of fan-in masks make each draw once, so the
+        # result doesn't depend on their size
+        m = random (fanIn = 6, seed = 1) * cross ([(0, 99), (150, 299)],
+                                                  (0, 199))
+        expected = sorted ([(j, i) for (i, j) in m],
+                           key = lambda c: (c[1], c[0]))
+        size = connset.sortBufferSize
+        try:
+            for n in [1, 50, 1000, size]:
+                connset.sortBufferSize = n
+                self.assertEqual (list (transpose * m), expected, 'transpose')
+                self.assertEqual (list (cross ((10, 120), (120, 260))
+                                        * (transpose * m)),
+                                  [c for c in expected
+                                   if 10 <= c[0] <= 120 and 120 <= c[1] <= 260],
+                                  'bounded transpose')
+        finally:
+            connset.sortBufferSize = size
+
+    def test_sourceOrder (self):
+        R = (0, 79)
+        for m in [cross (R, (0, 59)) * random (0.3),
+                  random (fanIn = 5) * full (70, 40),
+                  cross ((0, 50), (0, 50)) * (oneToOne + full),
+                  cross ([(0, 10), (20, 30)], [(5, 9), (40, 50)])
+                  * random (0.5),
+                  cross (R, R) * (random (0.2) - random (0.3)),
+                  ExplicitMask ([(1, 2), (1, 2), (5, 0), (3, 3)]),
+                  cross ((1, 44), (3, 37))
+                  * (block (2, 3) * ExplicitMask ([(1, 2), (1, 2), (5, 0),
+                                                   (3, 3), (1, 7)]))]:
+            self.assertEqual (list (iterate (m, order = 'source')),
+                              sorted (m), 'source order')
+            for (sources, targets) in m.blocks (7, order = 'source'):
+                self.assertTrue (0 < len (sources) <= 7, 'block size')
+        c = cset (cross (R, R) * random (0.2), vset (lambda i, j: i + j))
+        self.assertEqual (list (iterate (c, order = 'source')), sorted (c),
+                          'source order with values')
+
+    def test_valueBlocks (self):
+        g = random2d (100)
+        d = euclidMetric2d (g)
+        c = cset (cross ((0, 49), (50, 99)) * full,
+                  gaussian (0.1, 0.3) * d,
+                  2.0 * vset (d) + vset (lambda i, j: i))
+        ls = []
+        for (i, j, w, delay) in c.blocks (500):
+            self.assertTrue (len (i) == len (w) == len (delay) <= 500,
+                             'column lengths')
+            ls.extend (zip (i.tolist (), j.tolist (),
+                            w.tolist (), delay.tolist ()))
+        for (x, y) in zip (ls, [x for x in c]):
+            self.assertEqual (x[:2], y[:2], 'connection order')
+            self.assertAlmostEqual (x[2], y[2], 12, 'gaussian weight')
+            self.assertAlmostEqual (x[3], y[3], 12, 'affine delay')
+        self.assertEqual (len (ls), 2500, 'number of connections')
+
+    def test_iterationPlan (self):
+        R = (0, 59)
+        ps = [cross ((0, 29), R), cross ((30, 59), R)]
+        for c in [cross (R, R) * random (0.2),
+                  cross (R, R) * (random (fanIn = 3) * full (60)),
+                  cset (cross (R, R) * random (0.1), vset (lambda i, j: i + j))]:
+            for (masks, k) in [(None, 0), (ps, 0), (ps, 1)]:
+                expected = list (c) if masks is None \
+                           else list (partition (c, masks, k))
+                p = iterationPlan (c, masks, k)
+                self.assertEqual (list (p), expected, 'plan')
+                self.assertEqual (list (p), expected, 'plan rerun')
+                self.assertEqual (len (p), len (expected), 'plan length')
+                self.assertEqual ([x for b in p.blocks (7, targets = (10, 20))
+                                   for x in zip (b[0].tolist (), b[1].tolist ())],
+                                  [x[:2] for x in expected if 10 <= x[1] < 20],
+                                  'target range')
+
+    def test_generateParallel (self):
+        R = (0, 59)
+        ps = [cross (R, (k * 20, k * 20 + 19)) for k in range (3)]
+        c = cset (cross (R, R) * random (0.2, seed = 1), 2.0)
+        columns = generateParallel (c, ps, workers = 2)
+        self.assertEqual (len (columns), 3, 'one result per partition')
+        for k in range (3):
+            self.assertEqual ([(i, j, v) for (i, j, v)
+                               in zip (*[x.tolist () for x in columns[k]])],
+                              list (partition (c, ps, k)), 'partition')
+
+    def test_threadedBlocks (self):
+        g = random2d (200)
+        R = (0, 199)
+        ps = [cross (R, (0, 49)), cross (R, (50, 199))]
+        for c in [cross (R, R) * random (0.1),
+                  cross (R, R) * (disc (0.2) * euclidMetric2d (g, g))]:
+            for (masks, k) in [(None, 0), (ps, 1)]:
+                expected = [x for b in iterationPlan (c, masks, k).blocks (50)
+                            for x in zip (b[0].tolist (), b[1].tolist ())]
+                blocks = list (threadedBlocks (c, masks, k, threads = 3,
+                                               blockSize = 50))
+                self.assertTrue (all ([len (b[0]) <= 50 for b in blocks]),
+                                 'block size')
+                self.assertEqual ([x for b in blocks
+                                   for x in zip (b[0].tolist (), b[1].tolist ())],
+                                  expected, 'threaded blocks')
+
+
+class TestCompressed (TestCSA):
+    def test_fix (self):
+        m = cross ((0, 99), (0, 99)) * random (0.1) \
+            + cross ((0, 20), (0, 20)) * oneToOne
+        f = fix * m
+        self.assertEqual (list (f), list (m), 'fixed mask')
+        self.assertEqual (len (f), len (m), 'fixed mask length')
+        self.assertEqual (list (cross ((3, 50), (2, 30)) * f),
+                          list (cross ((3, 50), (2, 30)) * m), 'bounded')
+        c = cset (cross ((0, 49), (0, 79)) * random (0.2),
+                  vset (lambda i, j: i + 0.5 * j), 2.0)
+        self.assertEqual (list (fix * c), list (c), 'fixed connection-set')
+        self.assertEqual (list (fix * []), [], 'empty')
+
+    @unittest.skipUnless (HAVE_SCIPY, 'requires scipy')
+    def test_sparse (self):
+        c = fix * cset (cross ((0, 49), (0, 79)) * random (0.2),
+                        vset (lambda i, j: i + 0.5 * j))
+        matrix = toSparse (c)
+        self.assertEqual (matrix.shape, (50, 80))
+        self.assertTrue (numpy.shares_memory (matrix.indices,
+                                              mask (c).indices),
+                         'exported without copying')
+        dense = matrix.toarray ()
+        for (i, j, v) in c:
+            self.assertEqual (dense[i, j], i + 0.5 * j)
+        self.assertEqual (list (fromSparse (matrix)), list (c), 'import')
+
 
 def main():
     suite = unittest.TestLoader().loadTestsFromTestCase(TestElementary,